@@ -0,0 +1,206 @@
+#
+# Copyright (c) 2026 University of Dundee.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Caches used by the iviewer views."""
+
+from collections import OrderedDict
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+
+class LRUCache(object):
+    """
+    A thread-safe least recently used cache, bounded by the total size
+    in bytes of its values.
+
+    A max_bytes of 0 (or less) disables the cache.
+    """
+
+    def __init__(self, max_bytes, sizeof=None):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof if sizeof is not None else \
+            (lambda value: value.nbytes)
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def get(self, key):
+        """Returns the cached value for key or None."""
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Adds value, evicting least recently used entries if needed."""
+        size = self.sizeof(value)
+        if not self.enabled or size > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= self.sizeof(previous)
+            self.entries[key] = value
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= self.sizeof(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """Returns a dict of the cache counters."""
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class TTLCache(object):
+    """
+    A thread-safe cache of values which expire timeout seconds after they
+    were loaded, for server-wide constants such as enumerations and
+    configuration values.
+
+    A timeout of 0 (or less) disables the cache.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.timeout > 0
+
+    def get(self, key, load):
+        """
+        Returns the value for key, calling load() to get it if it is not
+        cached or has expired. None is a valid value.
+        """
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        # loading (from the server) is done without holding the lock
+        value = load()
+        if self.enabled:
+            with self.lock:
+                self.entries[key] = (value, now + self.timeout)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """Returns a dict of the cache counters."""
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'timeout': self.timeout,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+def get_rois_version(image_id):
+    """
+    Returns the version of the ROIs of an image, as kept in the django
+    cache. It is used in the keys of all cached ROI data of the image,
+    so that changing it with invalidate_rois() invalidates all of them.
+    """
+    return get_rois_versions([image_id])[image_id]
+
+
+def get_rois_versions(image_ids):
+    """
+    Returns a dict of the versions of the ROIs of images by id, as for
+    get_rois_version(), with one cache lookup for all the images.
+    """
+    keys = dict((image_id, 'omero_iviewer:rois_version:%s' % image_id)
+                for image_id in image_ids)
+    cached = cache.get_many(list(keys.values()))
+    versions = {}
+    missing = {}
+    for image_id, key in keys.items():
+        version = cached.get(key)
+        if version is None:
+            version = missing[key] = uuid.uuid4().hex
+        versions[image_id] = version
+    if len(missing) > 0:
+        cache.set_many(missing, None)
+    return versions
+
+
+def invalidate_rois(image_id):
+    """Invalidates all cached ROI data of an image."""
+    version = uuid.uuid4().hex
+    cache.set('omero_iviewer:rois_version:%s' % image_id, version, None)
+    return version
+
+
+def rois_cache_key(conn, image_id, name, *args):
+    """
+    Returns the django cache key for ROI data of an image, which includes
+    the ROIs version and the group and user of the session since the
+    ROIs that can be seen depend on permissions.
+    """
+    return rois_cache_keys(conn, [image_id], name, *args)[image_id]
+
+
+def rois_cache_keys(conn, image_ids, name, *args):
+    """
+    Returns a dict of the rois_cache_key() of images by id, looking up
+    the ROIs versions of all the images at once.
+    """
+    ctx = conn.getEventContext()
+    keys = {}
+    for image_id, version in get_rois_versions(image_ids).items():
+        parts = [name, image_id, version, ctx.groupId, ctx.userId]
+        keys[image_id] = 'omero_iviewer:' + ':'.join(
+            str(p) for p in parts + list(args))
+    return keys
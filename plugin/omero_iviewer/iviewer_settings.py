@@ -19,6 +19,7 @@
 
 """Settings for the OMERO.iviewer app."""
 
+import json
 import sys
 from omeroweb.settings import process_custom_settings, report_settings
 
@@ -50,6 +51,37 @@ IVIEWER_SETTINGS_MAPPING = {
          int,
          "Page size for ROI pagination."],
 
+    "omero.web.iviewer.roi_save_chunk_size":
+        ["ROI_SAVE_CHUNK_SIZE",
+         1000,
+         int,
+         ("Maximum number of changed shapes saved per request when "
+          "large ROI changes are saved in chunks.")],
+
+    "omero.web.iviewer.projection_workers":
+        ["PROJECTION_WORKERS",
+         2,
+         int,
+         ("Number of projections created at once in the background "
+          "(per web worker process).")],
+
+    "omero.web.iviewer.projection_jobs_per_user":
+        ["PROJECTION_JOBS_PER_USER",
+         2,
+         int,
+         ("Maximum number of queued or running background projections "
+          "per user, counted in all web worker processes sharing the "
+          "cache configured with omero.web.caches.")],
+
+    "omero.web.iviewer.async_projections":
+        ["ASYNC_PROJECTIONS",
+         False,
+         bool,
+         ("Saves projections from the viewer in the background, polling "
+          "their status. The status is shared through the cache "
+          "configured with omero.web.caches, so with several web worker "
+          "processes this requires a shared cache such as Redis.")],
+
     "omero.web.iviewer.roi_color_palette":
         ["ROI_COLOR_PALETTE",
          '',
@@ -76,7 +108,91 @@ IVIEWER_SETTINGS_MAPPING = {
         ["ENABLE_MIRROR",
          False,
          bool,
-         ("Enables buttons to mirror X or Y axis.")]
+         ("Enables buttons to mirror X or Y axis.")],
+
+    "omero.web.iviewer.intensity_cache_bytes":
+        ["INTENSITY_CACHE_BYTES",
+         64 * 1024 * 1024,
+         int,
+         ("Maximum bytes of raw pixel data kept in memory (per web worker "
+          "process) for answering intensity queries. "
+          "Set to 0 to disable the cache.")],
+
+    "omero.web.iviewer.roi_cache_timeout":
+        ["ROI_CACHE_TIMEOUT",
+         600,
+         int,
+         ("Seconds for which ROI data such as shape counts per plane "
+          "is kept in the cache configured with omero.web.caches. "
+          "Changes saved from iviewer invalidate the cached data, "
+          "changes made elsewhere show once it has expired.")],
+
+    "omero.web.iviewer.image_data_cache_timeout":
+        ["IMAGE_DATA_CACHE_TIMEOUT",
+         3600,
+         int,
+         ("Seconds for which the image data loaded by the viewer is kept "
+          "in the cache configured with omero.web.caches. Changes to the "
+          "image, its pixels, rendering settings or ROIs are picked up "
+          "immediately, changes to e.g. its dataset once it has expired.")],
+
+    "omero.web.iviewer.histogram_cache_timeout":
+        ["HISTOGRAM_CACHE_TIMEOUT",
+         86400,
+         int,
+         ("Seconds for which the histograms of the planes of images are "
+          "kept in the cache configured with omero.web.caches.")],
+
+    "omero.web.iviewer.shape_stats_cache_timeout":
+        ["SHAPE_STATS_CACHE_TIMEOUT",
+         86400,
+         int,
+         ("Seconds for which the statistics of shapes are kept in the "
+          "cache configured with omero.web.caches. Stats are cached per "
+          "shape version, so edited shapes are measured again.")],
+
+    "omero.web.iviewer.server_cache_timeout":
+        ["SERVER_CACHE_TIMEOUT",
+         3600,
+         int,
+         ("Seconds for which server-wide constants, such as the rendering "
+          "families, pixels types and server configuration values, are "
+          "kept in memory (per web worker process). "
+          "Set to 0 to load them for each request.")],
+
+    "omero.web.iviewer.roi_index_cache_bytes":
+        ["ROI_INDEX_CACHE_BYTES",
+         64 * 1024 * 1024,
+         int,
+         ("Maximum bytes of shape bounding box indexes kept in memory "
+          "(per web worker process) for loading the ROIs in a viewport. "
+          "Set to 0 to disable the cache.")],
+
+    "omero.web.iviewer.metrics":
+        ["METRICS_ENABLED",
+         False,
+         bool,
+         ("Times the iviewer requests and the OMERO service calls they "
+          "make. The timings are returned in a Server-Timing header and "
+          "kept per web worker process for the metrics endpoint.")],
+
+    "omero.web.iviewer.metrics_endpoint":
+        ["METRICS_ENDPOINT",
+         False,
+         bool,
+         ("Enables the iviewer metrics/ endpoint, which returns the "
+          "request metrics and cache counters of the web worker process "
+          "in the Prometheus text format, without login. It only answers "
+          "requests from omero.web.iviewer.metrics_allowed_ips.")],
+
+    "omero.web.iviewer.metrics_allowed_ips":
+        ["METRICS_ALLOWED_IPS",
+         '["127.0.0.1", "::1"]',
+         json.loads,
+         ("List of the client addresses allowed to read the metrics "
+          "endpoint. Behind a reverse proxy, requests come from the "
+          "address of the proxy, which must then restrict access to "
+          "the endpoint itself.")]
 }
 
 process_custom_settings(sys.modules[__name__], 'IVIEWER_SETTINGS_MAPPING')
@@ -0,0 +1,231 @@
+#
+# Copyright (c) 2026 University of Dundee.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Background jobs, such as creating projections, run in-process."""
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+from omero.gateway import BlitzGateway
+
+logger = logging.getLogger(__name__)
+
+
+def join_session(conn):
+    """
+    Returns a new connection to the OMERO session of conn, in the same
+    group context, which can be used once the request of conn has ended.
+    """
+    worker = BlitzGateway(host=conn.host, port=conn.port,
+                          secure=conn.secure, useragent=conn.useragent)
+    if not worker.connect(sUuid=conn.c.getSessionId()):
+        raise Exception("Failed to join the session")
+    worker.SERVICE_OPTS.setOmeroGroup(conn.SERVICE_OPTS.getOmeroGroup())
+    return worker
+
+
+class TooManyJobs(Exception):
+    """Raised when a user has as many unfinished jobs as allowed."""
+
+
+class Job(object):
+    """The state of a job, as reported to its user."""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    # minimum seconds between saves of the progress of a job
+    SAVE_INTERVAL = 1
+
+    def __init__(self, user_id, save=None):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.status = Job.QUEUED
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.finished = None
+        self.save = save
+        self.saved = 0
+
+    @property
+    def is_finished(self):
+        return self.status in (Job.DONE, Job.FAILED)
+
+    def set_progress(self, progress):
+        self.progress = min(1.0, max(0.0, progress))
+        if self.save is not None and \
+                time.time() - self.saved >= Job.SAVE_INTERVAL:
+            self.save(self)
+
+    def to_dict(self):
+        rv = {'job': self.id, 'status': self.status,
+              'progress': self.progress}
+        if self.status == Job.DONE:
+            rv['result'] = self.result
+        if self.error is not None:
+            rv['error'] = self.error
+        return rv
+
+    @classmethod
+    def from_dict(cls, user_id, data):
+        """Returns a Job with the state of data, as given by to_dict."""
+        job = cls(user_id)
+        job.id = data['job']
+        job.status = data['status']
+        job.progress = data['progress']
+        job.result = data.get('result')
+        job.error = data.get('error')
+        return job
+
+
+class JobQueue(object):
+    """
+    Runs jobs in a bounded pool of threads of the web worker process.
+
+    Each job runs with its own connection to the session of the user who
+    submitted it. A user may have at most max_jobs_per_user unfinished
+    jobs. Finished jobs are forgotten after max_age seconds.
+    The jobs are kept in memory, so their status is only known to the
+    process that runs them unless shared is True: then it is also kept
+    in the django cache, for the other processes sharing the cache, and
+    the unfinished jobs of a user are counted in all of these processes.
+    """
+
+    def __init__(self, max_workers, max_jobs_per_user, max_age=3600,
+                 shared=False):
+        self.max_workers = max(1, max_workers)
+        self.max_jobs_per_user = max_jobs_per_user
+        self.max_age = max_age
+        self.shared = shared
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def submit(self, conn, fn, *args):
+        """
+        Queues fn(conn, job, *args) to be run with a new connection to the
+        session of conn. Its return value is the result of the job.
+        Returns the job, or raises TooManyJobs.
+        """
+        user_id = conn.getEventContext().userId
+        with self.lock:
+            self.expire()
+            unfinished = self.unfinished(user_id)
+            if len(unfinished) >= self.max_jobs_per_user:
+                raise TooManyJobs(
+                    "At most %s jobs can run at once" %
+                    self.max_jobs_per_user)
+            job = Job(user_id, self.save if self.shared else None)
+            self.jobs[job.id] = job
+            self.save(job)
+            if self.shared:
+                cache.set(self.user_cache_key(user_id),
+                          unfinished + [job.id], self.max_age)
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='omero_iviewer_jobs')
+        try:
+            worker = join_session(conn)
+        except Exception as e:
+            self.fail(job, e)
+            return job
+        self.executor.submit(self.run, job, worker, fn, args)
+        return job
+
+    def run(self, job, conn, fn, args):
+        job.status = Job.RUNNING
+        self.save(job)
+        try:
+            job.result = fn(conn, job, *args)
+            job.progress = 1.0
+            job.status = Job.DONE
+            job.finished = time.time()
+            self.save(job)
+        except Exception as e:
+            logger.error("Job %s failed", job.id, exc_info=True)
+            self.fail(job, e)
+        finally:
+            conn.close(hard=False)
+
+    def fail(self, job, error):
+        job.error = repr(error)
+        job.status = Job.FAILED
+        job.finished = time.time()
+        self.save(job)
+
+    def save(self, job):
+        """Shares the state of the job through the django cache."""
+        if not self.shared:
+            return
+        job.saved = time.time()
+        data = job.to_dict()
+        data['user_id'] = job.user_id
+        cache.set(self.cache_key(job.id), data, self.max_age)
+
+    def cache_key(self, job_id):
+        return 'omero_iviewer:job:%s' % job_id
+
+    def user_cache_key(self, user_id):
+        return 'omero_iviewer:jobs:%s' % user_id
+
+    def unfinished(self, user_id):
+        """
+        Returns the ids of the unfinished jobs of the user in this process
+        and, if shared, in the other processes sharing the django cache.
+        Concurrent submits to several processes may exceed the limit.
+        """
+        job_ids = [j.id for j in self.jobs.values()
+                   if j.user_id == user_id and not j.is_finished]
+        if self.shared:
+            shared_ids = cache.get(self.user_cache_key(user_id)) or []
+            jobs = cache.get_many([self.cache_key(i) for i in shared_ids])
+            for job_id in shared_ids:
+                data = jobs.get(self.cache_key(job_id))
+                if job_id not in job_ids and data is not None and \
+                        data['status'] in (Job.QUEUED, Job.RUNNING):
+                    job_ids.append(job_id)
+        return job_ids
+
+    def get(self, job_id, user_id):
+        """
+        Returns the job of the user or None. Jobs of other processes are
+        read from the django cache if shared.
+        """
+        with self.lock:
+            self.expire()
+            job = self.jobs.get(job_id)
+        if job is None and self.shared:
+            data = cache.get(self.cache_key(job_id))
+            if data is not None:
+                job = Job.from_dict(data['user_id'], data)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    def expire(self):
+        oldest = time.time() - self.max_age
+        for job_id, job in list(self.jobs.items()):
+            if job.is_finished and job.finished < oldest:
+                del self.jobs[job_id]
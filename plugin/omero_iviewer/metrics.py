@@ -0,0 +1,250 @@
+#
+# Copyright (c) 2026 University of Dundee.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Timing of the iviewer views and of the OMERO service calls they make."""
+
+from collections import OrderedDict
+from functools import wraps
+import threading
+import time
+import weakref
+
+from django.http import StreamingHttpResponse
+
+from . import iviewer_settings
+
+METRICS_ENABLED = getattr(iviewer_settings, 'METRICS_ENABLED')
+
+# the gateway methods returning the services whose calls are timed
+SERVICES = OrderedDict([
+    ('getQueryService', 'query'),
+    ('getUpdateService', 'update'),
+    ('getRoiService', 'roi'),
+    ('getPixelsService', 'pixels'),
+    ('createRawPixelsStore', 'pixels'),
+    ('getConfigService', 'config'),
+])
+
+# upper bounds in seconds of the buckets of the request durations
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# the timers of the connections of the requests being instrumented
+TIMERS = weakref.WeakKeyDictionary()
+
+
+class RequestTimer(object):
+    """The number and duration of the service calls of one request."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = OrderedDict()
+
+    def add(self, service, seconds):
+        # services may be called from several threads, e.g. shape_stats
+        with self.lock:
+            count, total = self.calls.get(service, (0, 0))
+            self.calls[service] = (count + 1, total + seconds)
+
+
+class TimedService(object):
+    """Wraps a service so that its calls are added to a RequestTimer."""
+
+    def __init__(self, service, name, timer):
+        self._service = service
+        self._name = name
+        self._timer = timer
+
+    def __getattr__(self, attr):
+        rv = getattr(self._service, attr)
+        if not callable(rv):
+            return rv
+        name, timer = self._name, self._timer
+
+        def timed_call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return rv(*args, **kwargs)
+            finally:
+                timer.add(name, time.perf_counter() - start)
+        return timed_call
+
+
+def timed(conn, name, service):
+    """
+    Returns the service, wrapped to time its calls if the request of conn
+    is instrumented. Used for services not created by the gateway methods
+    of SERVICES, e.g. raw pixels stores of their own.
+    """
+    if not METRICS_ENABLED:
+        return service
+    timer = TIMERS.get(conn)
+    if timer is None:
+        return service
+    return TimedService(service, name, timer)
+
+
+class Metrics(object):
+    """Thread-safe totals of the instrumented requests, by view."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = OrderedDict()
+        self.services = OrderedDict()
+
+    def add(self, view, seconds, timer, request_bytes, response_bytes):
+        with self.lock:
+            totals = self.views.get(view)
+            if totals is None:
+                totals = self.views[view] = {
+                    'count': 0, 'seconds': 0, 'request_bytes': 0,
+                    'response_bytes': 0, 'buckets': [0] * len(BUCKETS)}
+            totals['count'] += 1
+            totals['seconds'] += seconds
+            totals['request_bytes'] += request_bytes
+            totals['response_bytes'] += response_bytes or 0
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    totals['buckets'][i] += 1
+            for service, (count, total) in timer.calls.items():
+                calls, service_seconds = self.services.get(
+                    (view, service), (0, 0))
+                self.services[(view, service)] = (
+                    calls + count, service_seconds + total)
+
+    def clear(self):
+        with self.lock:
+            self.views.clear()
+            self.services.clear()
+
+    def render(self, caches=None):
+        """
+        Returns the metrics in the Prometheus text format, with the
+        counters of the caches, a dict of LRUCache or TTLCache by name.
+        """
+        lines = []
+
+        def metric(name, kind, doc, samples):
+            lines.append('# HELP omero_iviewer_%s %s' % (name, doc))
+            lines.append('# TYPE omero_iviewer_%s %s' % (name, kind))
+            for suffix, labels, value in samples:
+                lines.append('omero_iviewer_%s%s{%s} %s' % (
+                    name, suffix, ','.join(
+                        '%s="%s"' % label for label in labels), value))
+
+        with self.lock:
+            views = [(view, dict(totals, buckets=list(totals['buckets'])))
+                     for view, totals in self.views.items()]
+            services = list(self.services.items())
+        samples = []
+        for view, totals in views:
+            for bound, count in zip(BUCKETS, totals['buckets']):
+                samples.append(
+                    ('_bucket', [('view', view), ('le', bound)], count))
+            samples.append(
+                ('_bucket', [('view', view), ('le', '+Inf')],
+                 totals['count']))
+            samples.append(('_sum', [('view', view)], totals['seconds']))
+            samples.append(('_count', [('view', view)], totals['count']))
+        metric('request_duration_seconds', 'histogram',
+               'Duration of the iviewer requests.', samples)
+        for name, doc in (
+                ('request_bytes', 'Bytes of the request bodies.'),
+                ('response_bytes', 'Bytes of the responses, '
+                                   'except streamed ones.')):
+            metric(name + '_total', 'counter', doc, [
+                ('', [('view', view)], totals[name])
+                for view, totals in views])
+        metric('service_calls_total', 'counter',
+               'Calls to OMERO services.', [
+                   ('', [('view', view), ('service', service)], count)
+                   for (view, service), (count, _) in services])
+        metric('service_call_seconds_total', 'counter',
+               'Duration of the calls to OMERO services.', [
+                   ('', [('view', view), ('service', service)], seconds)
+                   for (view, service), (_, seconds) in services])
+        cache_stats = [(name, c.stats())
+                       for name, c in (caches or {}).items()]
+        for name, metric_name, kind in (
+                ('hits', 'cache_hits_total', 'counter'),
+                ('misses', 'cache_misses_total', 'counter'),
+                ('entries', 'cache_entries', 'gauge')):
+            metric(metric_name, kind, 'Cache %s.' % name, [
+                ('', [('cache', cache_name)], stats[name])
+                for cache_name, stats in cache_stats if name in stats])
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = Metrics()
+
+
+def server_timing(seconds, timer):
+    """Returns the value of the Server-Timing header of a request."""
+    timings = ['view;dur=%.1f' % (seconds * 1000)]
+    for service, (count, total) in timer.calls.items():
+        timings.append('%s;desc="%s calls";dur=%.1f' % (
+            service, count, total * 1000))
+    return ', '.join(timings)
+
+
+def instrument(view):
+    """
+    Decorator of views (within login_required) timing the requests and
+    the calls to the services of SERVICES, which are added to METRICS and
+    returned in a Server-Timing header.
+    Returns the view unchanged if metrics are disabled.
+    """
+    if not METRICS_ENABLED:
+        return view
+
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        start = time.perf_counter()
+        timer = RequestTimer()
+        conn = kwargs.get('conn')
+        # a view called by another one is timed as part of it
+        patched = conn is not None and conn not in TIMERS
+        if patched:
+            TIMERS[conn] = timer
+            for method, name in SERVICES.items():
+                setattr(conn, method, timed_getter(
+                    getattr(conn, method), name, timer))
+        response = None
+        try:
+            response = view(request, *args, **kwargs)
+            return response
+        finally:
+            if patched:
+                for method in SERVICES:
+                    delattr(conn, method)
+                TIMERS.pop(conn, None)
+            seconds = time.perf_counter() - start
+            response_bytes = None
+            if response is not None:
+                response['Server-Timing'] = server_timing(seconds, timer)
+                if not isinstance(response, StreamingHttpResponse):
+                    response_bytes = len(response.content)
+            METRICS.add(view.__name__, seconds, timer,
+                        int(request.META.get('CONTENT_LENGTH') or 0),
+                        response_bytes)
+    return wrapped
+
+
+def timed_getter(getter, name, timer):
+    """Wraps a gateway service getter to return timed services."""
+    def get_service(*args, **kwargs):
+        return TimedService(getter(*args, **kwargs), name, timer)
+    return get_service
@@ -0,0 +1,206 @@
+#
+# Copyright (c) 2026 University of Dundee.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Helpers for reading and decoding raw pixel data."""
+
+import base64
+
+import numpy
+import omero
+import omero.util.pixelstypetopython as pixelstypetopython
+
+from .metrics import timed
+
+
+def get_pixels_dtype(pixels_type):
+    """
+    Returns the numpy dtype matching an OMERO pixels type.
+
+    Raw pixel data is sent by the server in big-endian byte order.
+
+    @param pixels_type  string, e.g. "uint16"
+    """
+    return numpy.dtype('>' + pixelstypetopython.toPython(pixels_type))
+
+
+def create_raw_pixels_store(conn, pixels_id):
+    """
+    Returns a new raw pixels store with the pixels id set, to be closed by
+    the caller. conn.createRawPixelsStore() returns the one store shared
+    by all users of conn, which can't read several pixels sets at once,
+    e.g. from several threads.
+    """
+    store = timed(conn, 'pixels', conn.c.sf.createRawPixelsStore())
+    store.setPixelsId(pixels_id, True, conn.SERVICE_OPTS)
+    return store
+
+
+def get_tile(raw_pixel_store, z, c, t, x, y, width, height, dtype,
+             opts=None):
+    """
+    Reads a tile from the raw pixels store and returns it as a 2D array
+    of shape (height, width).
+    """
+    data = raw_pixel_store.getTile(z, c, t, x, y, width, height, opts)
+    return numpy.frombuffer(data, dtype=dtype).reshape(height, width)
+
+
+def get_histograms(raw_pixel_store, z, t, channels, bins, opts=None):
+    """
+    Returns the histograms of the channels of a plane as a dict of lists
+    by channel, computed by the server over the global range of each
+    channel, with one call for all channels.
+    """
+    plane = omero.romio.PlaneDef(omero.romio.XY)
+    plane.z = z
+    plane.t = t
+    histograms = raw_pixel_store.getHistogram(
+        list(channels), bins, True, plane, opts)
+    return dict((c, list(histograms[c])) for c in channels)
+
+
+def encode_array(array):
+    """
+    Returns the base64 encoded bytes of an array in little-endian order,
+    which is what javascript typed arrays expect on all common platforms.
+    """
+    little_endian = array.astype(array.dtype.newbyteorder('<'), copy=False)
+    return base64.b64encode(little_endian.tobytes()).decode('ascii')
+
+
+# width and height of the grid-aligned blocks held in the tile cache
+TILE_BLOCK_SIZE = 256
+
+
+class RegionReader(object):
+    """
+    Reads regions of the planes of a Pixels object.
+
+    If a tile cache is given, regions are assembled from blocks aligned
+    to a grid of TILE_BLOCK_SIZE which are kept in the cache, so that the
+    raw pixels store is only opened on a cache miss. Cache keys include
+    the group and user of the session.
+
+    Stores are not kept for later requests: the client of each request is
+    closed when it ends, and with it the stateful services it created.
+    """
+
+    def __init__(self, conn, pixels_id, size_x, size_y, dtype, cache=None):
+        self.conn = conn
+        self.pixels_id = pixels_id
+        self.size_x = size_x
+        self.size_y = size_y
+        self.dtype = dtype
+        self.cache = cache
+        self.cache_key = None
+        if cache is not None and cache.enabled:
+            ctx = conn.getEventContext()
+            self.cache_key = (ctx.groupId, ctx.userId, pixels_id)
+        self.raw_pixel_store = None
+
+    def get_store(self):
+        """Returns the raw pixels store, creating it on first use."""
+        if self.raw_pixel_store is None:
+            self.raw_pixel_store = create_raw_pixels_store(
+                self.conn, self.pixels_id)
+        return self.raw_pixel_store
+
+    def get_region(self, z, c, t, x, y, width, height):
+        """Returns the region as a 2D array of shape (height, width)."""
+        if self.cache_key is None:
+            return get_tile(self.get_store(), z, c, t, x, y, width, height,
+                            self.dtype, self.conn.SERVICE_OPTS)
+
+        size = TILE_BLOCK_SIZE
+        region = numpy.empty((height, width), dtype=self.dtype)
+        for block_y in range(y // size, (y + height - 1) // size + 1):
+            for block_x in range(x // size, (x + width - 1) // size + 1):
+                block = self.get_block(z, c, t, block_x, block_y)
+                block_left, block_top = block_x * size, block_y * size
+                # intersection of block and region in image coordinates
+                left = max(x, block_left)
+                top = max(y, block_top)
+                right = min(x + width, block_left + block.shape[1])
+                bottom = min(y + height, block_top + block.shape[0])
+                region[top - y:bottom - y, left - x:right - x] = \
+                    block[top - block_top:bottom - block_top,
+                          left - block_left:right - block_left]
+        return region
+
+    def get_points(self, z, c, t, xs, ys):
+        """
+        Returns the values at the points given by the integer arrays
+        xs and ys, reading each grid-aligned block only once.
+        """
+        size = TILE_BLOCK_SIZE
+        values = numpy.empty(len(xs), dtype=self.dtype)
+        if len(xs) == 0:
+            return values
+        block_xs, block_ys = xs // size, ys // size
+        keys = block_ys * (self.size_x // size + 1) + block_xs
+        # group the points by block
+        order = numpy.argsort(keys, kind='stable')
+        starts = numpy.flatnonzero(numpy.diff(keys[order])) + 1
+        for group in numpy.split(order, starts):
+            block_x = int(block_xs[group[0]])
+            block_y = int(block_ys[group[0]])
+            block = self.get_block(z, c, t, block_x, block_y)
+            values[group] = block[ys[group] - block_y * size,
+                                  xs[group] - block_x * size]
+        return values
+
+    def get_block(self, z, c, t, block_x, block_y):
+        """Returns a grid-aligned block, from the cache if present."""
+        key = None
+        if self.cache_key is not None:
+            key = self.cache_key + (z, c, t, block_x, block_y)
+            block = self.cache.get(key)
+            if block is not None:
+                return block
+        x, y = block_x * TILE_BLOCK_SIZE, block_y * TILE_BLOCK_SIZE
+        width = min(TILE_BLOCK_SIZE, self.size_x - x)
+        height = min(TILE_BLOCK_SIZE, self.size_y - y)
+        block = get_tile(self.get_store(), z, c, t, x, y, width, height,
+                         self.dtype, self.conn.SERVICE_OPTS)
+        if key is not None:
+            self.cache.put(key, block)
+        return block
+
+    def close(self):
+        if self.raw_pixel_store is not None:
+            self.raw_pixel_store.close()
+            self.raw_pixel_store = None
+
+
+def sample_polyline(points, step):
+    """
+    Returns arrays of x, y and distance along the polyline for samples
+    taken every step pixels, always including the last vertex.
+
+    @param points   list of [x, y] vertices
+    @param step     the sampling distance in pixels
+    """
+    vertices = numpy.asarray(points, dtype=float).reshape(-1, 2)
+    lengths = numpy.hypot(*numpy.diff(vertices, axis=0).T)
+    cumulative = numpy.concatenate(([0], numpy.cumsum(lengths)))
+    total = cumulative[-1]
+    distances = numpy.append(numpy.arange(0, total, step), total)
+    if len(distances) > 1 and distances[-1] == distances[-2]:
+        distances = distances[:-1]
+    xs = numpy.interp(distances, cumulative, vertices[:, 0])
+    ys = numpy.interp(distances, cumulative, vertices[:, 1])
+    return xs, ys, distances
@@ -0,0 +1,218 @@
+#
+# Copyright (c) 2026 University of Dundee.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Compact columnar encoding of ROIs and their Shapes."""
+
+import json
+
+import numpy
+import omero_marshal
+from omero.rtypes import unwrap
+
+from .pixels import encode_array
+
+# the numeric values sent per shape type, named as by omero_marshal
+SHAPE_VALUES = {
+    'Rectangle': ['X', 'Y', 'Width', 'Height'],
+    'Mask': ['X', 'Y', 'Width', 'Height'],
+    'Ellipse': ['X', 'Y', 'RadiusX', 'RadiusY'],
+    'Point': ['X', 'Y'],
+    'Label': ['X', 'Y'],
+    'Line': ['X1', 'Y1', 'X2', 'Y2'],
+    'Polygon': [],
+    'Polyline': [],
+}
+
+# the shape types sent with their coordinates as Points
+SHAPES_WITH_POINTS = ('Polygon', 'Polyline')
+
+# the style properties, as named by omero_marshal
+STYLE_PROPERTIES = ['FillColor', 'StrokeColor', 'StrokeWidth',
+                    'StrokeDashArray', 'FontFamily', 'FontSize',
+                    'FontStyle', 'MarkerStart', 'MarkerEnd', 'Locked']
+
+
+def get_attribute(obj, name):
+    """Returns the attribute of a model object for an omero_marshal name."""
+    return getattr(obj, name[0].lower() + name[1:], None)
+
+
+def encode_value(value):
+    """Encodes a property value as omero_marshal would."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if hasattr(value, 'getUnit'):
+        return omero_marshal.get_encoder(value.__class__).encode(value)
+    return unwrap(value)
+
+
+class Interned(object):
+    """Assigns indices to distinct values, sent once as a palette."""
+
+    def __init__(self):
+        self.indices = {}
+        self.values = []
+
+    def index(self, key, create):
+        index = self.indices.get(key)
+        if index is None:
+            index = len(self.values)
+            self.indices[key] = index
+            self.values.append(create())
+        return index
+
+
+class ShapeColumns(object):
+    """The columns for the shapes of one type."""
+
+    def __init__(self, shape_type):
+        self.shape_type = shape_type
+        self.keys = SHAPE_VALUES[shape_type]
+        self.ids = []
+        self.rois = []
+        self.z = []
+        self.t = []
+        self.c = []
+        self.styles = []
+        self.details = []
+        self.text = []
+        self.transforms = {}
+        self.values = []
+        self.points = []
+
+    def encode(self):
+        rv = {
+            'count': len(self.ids),
+            'ids': encode_array(numpy.array(self.ids, dtype='<f8')),
+            'roi': encode_array(numpy.array(self.rois, dtype='<i4')),
+            'z': encode_array(numpy.array(self.z, dtype='<i4')),
+            't': encode_array(numpy.array(self.t, dtype='<i4')),
+            'c': encode_array(numpy.array(self.c, dtype='<i4')),
+            'style': encode_array(numpy.array(self.styles, dtype='<i4')),
+            'details': encode_array(numpy.array(self.details, dtype='<i4')),
+            'keys': self.keys,
+            'values': encode_array(numpy.array(self.values, dtype='<f8')),
+        }
+        if any(text is not None for text in self.text):
+            rv['text'] = self.text
+        if len(self.transforms) > 0:
+            rv['transforms'] = self.transforms
+        if self.shape_type in SHAPES_WITH_POINTS:
+            # offsets (in points) into the flat x, y coordinates
+            lengths = [len(p) // 2 for p in self.points]
+            offsets = numpy.concatenate(([0], numpy.cumsum(lengths)))
+            rv['offsets'] = encode_array(offsets.astype('<u4'))
+            coords = numpy.concatenate(self.points) if self.points else []
+            rv['coords'] = encode_array(numpy.asarray(coords, dtype='<f8'))
+        return rv
+
+
+def parse_points(points):
+    """Returns the flat x, y coordinates of a 'x,y x,y ...' string."""
+    coords = numpy.array(points.replace(',', ' ').split(),
+                         dtype=numpy.float64)
+    if len(coords) == 0 or len(coords) % 2 != 0:
+        raise ValueError("Invalid points: %s" % points)
+    return coords
+
+
+def encode_rois_columnar(rois):
+    """
+    Encodes ROIs (loaded with their Shapes) in a compact columnar form.
+
+    ROIs are sent as lists of ids and names. Shapes are grouped by type,
+    with base64 encoded little-endian typed arrays for their ids (float64),
+    ROI index, z, t, c (int32, -1 if unset), style and details indices
+    (int32) as well as their numeric values (float64, as named by keys).
+    Polygon and polyline coordinates are sent as flat float64 x, y buffers
+    with uint32 offsets (in points) per shape. Styles and 'omero:details'
+    are interned and sent once each, as encoded by omero_marshal.
+    """
+    roi_ids = []
+    roi_names = []
+    styles = Interned()
+    details = Interned()
+    columns = {}
+    for roi_index, roi in enumerate(rois):
+        roi_ids.append(roi.id.val)
+        roi_names.append(unwrap(roi.name))
+        for shape in roi.copyShapes():
+            if shape is None:
+                continue
+            # e.g. RectangleI
+            shape_type = shape.__class__.__name__[:-1]
+            if shape_type not in SHAPE_VALUES:
+                continue
+            try:
+                points = None
+                if shape_type in SHAPES_WITH_POINTS:
+                    points = parse_points(unwrap(shape.points) or '')
+                values = [unwrap(get_attribute(shape, key))
+                          for key in SHAPE_VALUES[shape_type]]
+                # unset values are sent as NaN
+                values = [numpy.nan if v is None else v for v in values]
+            except Exception:
+                # as for json, shapes we can't display are skipped
+                continue
+            col = columns.get(shape_type)
+            if col is None:
+                col = columns[shape_type] = ShapeColumns(shape_type)
+
+            style = {}
+            for name in STYLE_PROPERTIES:
+                value = encode_value(get_attribute(shape, name))
+                if value is not None:
+                    style[name] = value
+            style_key = json.dumps(style, sort_keys=True)
+
+            shape_details = shape.getDetails()
+            perms = shape_details.getPermissions()
+            owner = shape_details.getOwner()
+            group = shape_details.getGroup()
+            details_key = (
+                owner.id.val if owner is not None else None,
+                group.id.val if group is not None else None,
+                str(perms),
+                perms.canAnnotate(), perms.canDelete(),
+                perms.canEdit(), perms.canLink())
+
+            col.ids.append(shape.id.val)
+            col.rois.append(roi_index)
+            for dim, attr in ((col.z, shape.theZ), (col.t, shape.theT),
+                              (col.c, shape.theC)):
+                value = unwrap(attr)
+                dim.append(-1 if value is None else value)
+            col.styles.append(styles.index(style_key, lambda: style))
+            col.details.append(details.index(
+                details_key,
+                lambda: omero_marshal.get_encoder(
+                    shape_details.__class__).encode(shape_details)))
+            col.text.append(unwrap(shape.textValue))
+            if shape.transform is not None:
+                col.transforms[len(col.ids) - 1] = omero_marshal.get_encoder(
+                    shape.transform.__class__).encode(shape.transform)
+            col.values.extend(values)
+            if points is not None:
+                col.points.append(points)
+
+    return {
+        'rois': {'ids': roi_ids, 'names': roi_names},
+        'styles': styles.values,
+        'details': details.values,
+        'shapes': dict((shape_type, col.encode())
+                       for shape_type, col in columns.items()),
+    }
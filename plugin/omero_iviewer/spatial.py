@@ -0,0 +1,228 @@
+#
+# Copyright (c) 2026 University of Dundee.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""A bounding box index of the Shapes of an image."""
+
+import numpy
+import omero
+from omero.rtypes import unwrap
+
+# the geometry columns queried per shape type
+SHAPE_GEOMETRY = {
+    'Rectangle': ['x', 'y', 'width', 'height'],
+    'Mask': ['x', 'y', 'width', 'height'],
+    'Ellipse': ['x', 'y', 'radiusX', 'radiusY'],
+    'Point': ['x', 'y'],
+    'Label': ['x', 'y'],
+    'Line': ['x1', 'y1', 'x2', 'y2'],
+    'Polygon': ['points'],
+    'Polyline': ['points'],
+}
+
+# the affine transform columns, x' = a00 x + a01 y + a02 etc.
+TRANSFORM = ['a00', 'a10', 'a01', 'a11', 'a02', 'a12']
+
+# number of grid cells along the longest side of the indexed extent
+GRID_SIZE = 256
+# shapes covering more cells than this are tested on every query
+MAX_SHAPE_CELLS = 64
+
+
+def get_points_bounds(points):
+    """Returns the bounds [x1, y1, x2, y2] of a 'x,y x,y ...' string."""
+    try:
+        coords = numpy.array(points.replace(',', ' ').split(), dtype=float)
+    except (AttributeError, ValueError):
+        return [numpy.nan] * 4
+    if len(coords) == 0 or len(coords) % 2 != 0:
+        return [numpy.nan] * 4
+    xs, ys = coords[0::2], coords[1::2]
+    return [xs.min(), ys.min(), xs.max(), ys.max()]
+
+
+def get_geometry_bounds(shape_type, values):
+    """
+    Returns an (n, 4) array of the bounds x1, y1, x2, y2 of shapes of a
+    type, from a list of rows of their SHAPE_GEOMETRY values.
+    """
+    if shape_type in ('Polygon', 'Polyline'):
+        return numpy.array([get_points_bounds(row[0]) for row in values],
+                           dtype=float).reshape(-1, 4)
+    geometry = numpy.array(values, dtype=float).reshape(
+        -1, len(SHAPE_GEOMETRY[shape_type]))
+    if shape_type in ('Rectangle', 'Mask'):
+        x, y, width, height = geometry.T
+        return numpy.stack([x, y, x + width, y + height], axis=1)
+    if shape_type == 'Ellipse':
+        x, y, radius_x, radius_y = geometry.T
+        return numpy.stack([x - radius_x, y - radius_y,
+                            x + radius_x, y + radius_y], axis=1)
+    if shape_type == 'Line':
+        x1, y1, x2, y2 = geometry.T
+        return numpy.stack([numpy.minimum(x1, x2), numpy.minimum(y1, y2),
+                            numpy.maximum(x1, x2), numpy.maximum(y1, y2)],
+                           axis=1)
+    # points and labels (whose text extent is unknown)
+    x, y = geometry.T
+    return numpy.stack([x, y, x, y], axis=1)
+
+
+def transform_bounds(bounds, transforms):
+    """
+    Returns the bounds of the corners of bounds transformed by the affine
+    transforms, an (n, 6) array which is NaN for shapes without one.
+    """
+    has_transform = ~numpy.isnan(transforms).any(axis=1)
+    if not has_transform.any():
+        return bounds
+    bounds = bounds.copy()
+    a00, a10, a01, a11, a02, a12 = transforms[has_transform].T
+    x1, y1, x2, y2 = bounds[has_transform].T
+    xs = numpy.stack([a00 * x + a01 * y + a02
+                      for x, y in ((x1, y1), (x2, y1), (x1, y2), (x2, y2))])
+    ys = numpy.stack([a10 * x + a11 * y + a12
+                      for x, y in ((x1, y1), (x2, y1), (x1, y2), (x2, y2))])
+    bounds[has_transform] = numpy.stack(
+        [xs.min(axis=0), ys.min(axis=0), xs.max(axis=0), ys.max(axis=0)],
+        axis=1)
+    return bounds
+
+
+def load_shape_index(query_service, image_id, opts):
+    """
+    Loads the geometry of all Shapes of an image, with one query per shape
+    type, and returns a ShapeIndex of their bounding boxes.
+    """
+    params = omero.sys.ParametersI()
+    params.addId(image_id)
+    ids, rois, zs, ts, bounds = [], [], [], [], []
+    for shape_type, columns in SHAPE_GEOMETRY.items():
+        query = """
+            select shape.id, roi.id, shape.theZ, shape.theT, %s, %s
+            from %s shape join shape.roi roi
+            left outer join shape.transform transform
+            where roi.image.id = :id
+        """ % (', '.join('shape.' + c for c in columns),
+               ', '.join('transform.' + c for c in TRANSFORM), shape_type)
+        rows = [unwrap(row) for row in query_service.projection(
+            query, params, opts)]
+        if len(rows) == 0:
+            continue
+        geometry = [row[4:4 + len(columns)] for row in rows]
+        transforms = numpy.array(
+            [row[4 + len(columns):] for row in rows],
+            dtype=float).reshape(-1, len(TRANSFORM))
+        bounds.append(transform_bounds(
+            get_geometry_bounds(shape_type, geometry), transforms))
+        for row in rows:
+            ids.append(row[0])
+            rois.append(row[1])
+            zs.append(-1 if row[2] is None else row[2])
+            ts.append(-1 if row[3] is None else row[3])
+    if len(bounds) == 0:
+        bounds = [numpy.empty((0, 4))]
+    return ShapeIndex(ids, rois, zs, ts, numpy.concatenate(bounds))
+
+
+class ShapeIndex(object):
+    """
+    The bounding boxes of the Shapes of an image, indexed by a uniform
+    grid: each shape is listed in every cell its bounding box touches,
+    except for very large shapes which are tested on every query.
+    Shapes with an invalid geometry are not indexed.
+    """
+
+    def __init__(self, ids, rois, zs, ts, bounds):
+        valid = ~numpy.isnan(bounds).any(axis=1)
+        self.ids = numpy.asarray(ids, dtype=numpy.int64)[valid]
+        self.rois = numpy.asarray(rois, dtype=numpy.int64)[valid]
+        self.z = numpy.asarray(zs, dtype=numpy.int32)[valid]
+        self.t = numpy.asarray(ts, dtype=numpy.int32)[valid]
+        self.bounds = bounds[valid]
+
+        if len(self.ids) > 0:
+            self.origin = self.bounds[:, :2].min(axis=0)
+            extent = self.bounds[:, 2:].max(axis=0) - self.origin
+        else:
+            self.origin = numpy.zeros(2)
+            extent = numpy.zeros(2)
+        self.cell_size = max(1.0, float(extent.max()) / GRID_SIZE)
+        self.grid_shape = (extent // self.cell_size).astype(int) + 1
+
+        x1, y1, x2, y2 = self.get_cells(self.bounds).T
+        cells = (x2 - x1 + 1) * (y2 - y1 + 1)
+        self.large = numpy.flatnonzero(cells > MAX_SHAPE_CELLS)
+        small = numpy.flatnonzero(cells <= MAX_SHAPE_CELLS)
+        # list each small shape once per cell, sorted by cell
+        shapes = numpy.repeat(small, cells[small])
+        offsets = numpy.arange(len(shapes)) - numpy.repeat(
+            numpy.cumsum(cells[small]) - cells[small], cells[small])
+        widths = (x2 - x1 + 1)[shapes]
+        cell_x = x1[shapes] + offsets % widths
+        cell_y = y1[shapes] + offsets // widths
+        keys = cell_y * self.grid_shape[0] + cell_x
+        order = numpy.argsort(keys, kind='stable')
+        self.cell_shapes = shapes[order].astype(numpy.int32)
+        # start of the shapes of each cell in cell_shapes
+        self.cell_starts = numpy.searchsorted(
+            keys[order], numpy.arange(self.grid_shape.prod() + 1))
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (
+            self.ids, self.rois, self.z, self.t, self.bounds, self.large,
+            self.cell_shapes, self.cell_starts))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get_cells(self, bounds):
+        """Returns the (clipped) grid cells x1, y1, x2, y2 of bounds."""
+        cells = numpy.floor((numpy.asarray(bounds, dtype=float).reshape(
+            -1, 4) - numpy.tile(self.origin, 2)) / self.cell_size)
+        max_cell = numpy.tile(self.grid_shape - 1, 2)
+        return numpy.clip(cells, 0, max_cell).astype(numpy.int64)
+
+    def query(self, x1, y1, x2, y2, the_z=None, the_t=None, z_end=None,
+              t_end=None):
+        """
+        Returns the indices of the shapes whose bounding boxes intersect
+        the rectangle x1, y1, x2, y2 and which are on the plane(s), as
+        for rois_by_plane. Shapes with theZ or theT unset are on all planes.
+        """
+        if len(self.ids) == 0:
+            return numpy.empty(0, dtype=numpy.int64)
+        candidates = [self.large]
+        cx1, cy1, cx2, cy2 = self.get_cells([x1, y1, x2, y2])[0]
+        for cell_y in range(cy1, cy2 + 1):
+            row = cell_y * self.grid_shape[0]
+            start = self.cell_starts[row + cx1]
+            end = self.cell_starts[row + cx2 + 1]
+            candidates.append(self.cell_shapes[start:end])
+        candidates = numpy.unique(numpy.concatenate(candidates))
+
+        bounds = self.bounds[candidates]
+        match = (bounds[:, 0] <= x2) & (bounds[:, 2] >= x1) & \
+            (bounds[:, 1] <= y2) & (bounds[:, 3] >= y1)
+        for values, start, end in ((self.z, the_z, z_end),
+                                   (self.t, the_t, t_end)):
+            if start is None:
+                continue
+            values = values[candidates]
+            end = start if end is None else end
+            match &= (values == -1) | ((values >= start) & (values <= end))
+        return candidates[match]
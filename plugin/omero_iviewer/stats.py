@@ -0,0 +1,223 @@
+#
+# Copyright (c) 2026 University of Dundee.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Statistics of the pixels within shapes, computed with numpy."""
+
+import numpy
+from omero.rtypes import unwrap
+
+from .spatial import SHAPE_GEOMETRY, TRANSFORM, get_geometry_bounds, \
+    transform_bounds
+
+# the shape types that can be rasterized
+SUPPORTED_SHAPES = ('Rectangle', 'Ellipse', 'Polygon', 'Mask', 'Point')
+
+
+def get_shape_type(shape):
+    """Returns the type of an omero.model Shape, e.g. 'Rectangle'."""
+    return shape.__class__.__name__.rstrip('I')
+
+
+def get_shape_geometry(shape):
+    """
+    Returns the geometry of an omero.model Shape as a dict of its type,
+    its SHAPE_GEOMETRY values, its transform (or None) and for masks the
+    mask bytes.
+    """
+    shape_type = get_shape_type(shape)
+    if shape_type not in SUPPORTED_SHAPES:
+        raise ValueError("Unsupported shape type: %s" % shape_type)
+    geometry = {'type': shape_type, 'transform': None}
+    for name in SHAPE_GEOMETRY[shape_type]:
+        geometry[name] = unwrap(getattr(shape, name))
+    transform = shape.getTransform()
+    if transform is not None:
+        geometry['transform'] = [unwrap(getattr(transform, name))
+                                 for name in TRANSFORM]
+    if shape_type == 'Mask':
+        geometry['bytes'] = unwrap(shape.getBytes())
+    return geometry
+
+
+def get_polygon_points(points):
+    """Returns the x and y arrays of a 'x,y x,y ...' string."""
+    coords = numpy.array(points.replace(',', ' ').split(), dtype=float)
+    return coords[0::2], coords[1::2]
+
+
+def contains(geometry, xs, ys):
+    """
+    Returns whether the points xs, ys are within the (untransformed)
+    geometry of a shape other than a polygon, following the rules of
+    java.awt.geom: the left and top edges of rectangles are inside, the
+    right and bottom ones are not.
+    """
+    shape_type = geometry['type']
+    if shape_type == 'Rectangle':
+        x, y = geometry['x'], geometry['y']
+        return (xs >= x) & (xs < x + geometry['width']) & \
+            (ys >= y) & (ys < y + geometry['height'])
+    if shape_type == 'Ellipse':
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            dx = (xs - geometry['x']) / geometry['radiusX']
+            dy = (ys - geometry['y']) / geometry['radiusY']
+            return dx * dx + dy * dy < 1
+    if shape_type == 'Point':
+        return (xs == numpy.floor(geometry['x'])) & \
+            (ys == numpy.floor(geometry['y']))
+    if shape_type == 'Mask':
+        x0, y0 = numpy.floor(geometry['x']), numpy.floor(geometry['y'])
+        width, height = int(geometry['width']), int(geometry['height'])
+        # one bit per pixel, row by row
+        bits = numpy.zeros(width * height, dtype=numpy.uint8)
+        unpacked = numpy.unpackbits(numpy.frombuffer(
+            geometry['bytes'] or b'', dtype=numpy.uint8))[:len(bits)]
+        bits[:len(unpacked)] = unpacked
+        bits = bits.reshape(height, width)
+        cols = (xs - x0).astype(numpy.int64)
+        rows = (ys - y0).astype(numpy.int64)
+        inside = (xs >= x0) & (cols < width) & (ys >= y0) & (rows < height)
+        rv = numpy.zeros(xs.shape, dtype=bool)
+        rv[inside] = bits[rows[inside], cols[inside]] != 0
+        return rv
+    raise ValueError("Use polygon_row for %s" % shape_type)
+
+
+def polygon_row(px, py, xs, y):
+    """
+    Returns whether the points xs on the row y are within the polygon of
+    vertices px, py following the even-odd rule: a point is inside if an
+    odd number of edges cross the row after it.
+    """
+    x1, y1 = px, py
+    x2, y2 = numpy.roll(px, -1), numpy.roll(py, -1)
+    crosses = (y1 > y) != (y2 > y)
+    x1, y1, x2, y2 = x1[crosses], y1[crosses], x2[crosses], y2[crosses]
+    x_cross = numpy.sort(x1 + (y - y1) * (x2 - x1) / (y2 - y1))
+    after = len(x_cross) - numpy.searchsorted(x_cross, xs, side='right')
+    return after % 2 == 1
+
+
+def get_image_polygon(geometry):
+    """
+    Returns the vertices px, py in image coordinates of polygons, and of
+    transformed rectangles, or None for other shapes.
+    """
+    shape_type = geometry['type']
+    transform = geometry['transform']
+    if shape_type == 'Polygon':
+        px, py = get_polygon_points(geometry['points'])
+    elif shape_type == 'Rectangle' and transform is not None:
+        x, y = geometry['x'], geometry['y']
+        x2, y2 = x + geometry['width'], y + geometry['height']
+        px, py = numpy.array([x, x2, x2, x]), numpy.array([y, y, y2, y2])
+    else:
+        return None
+    if transform is not None:
+        a00, a10, a01, a11, a02, a12 = transform
+        px, py = a00 * px + a01 * py + a02, a10 * px + a11 * py + a12
+    return px, py
+
+
+def get_shape_mask(geometry, size_x, size_y, max_pixels=None):
+    """
+    Rasterizes the geometry of a shape within the image bounds, row by
+    row so that memory use is that of the mask.
+
+    Returns (x, y, mask), the origin of the bounding box of the shape in
+    the image and a boolean array of shape (height, width) of the pixels
+    in the shape, or None if the shape is outside of the image.
+    A pixel is in the shape if its top left corner is.
+    Raises ValueError if the bounding box has more than max_pixels.
+    """
+    shape_type = geometry['type']
+    bounds = get_geometry_bounds(shape_type, [[
+        geometry[name] for name in SHAPE_GEOMETRY[shape_type]]])
+    transform = geometry['transform']
+    if transform is not None:
+        bounds = transform_bounds(
+            bounds, numpy.array([transform], dtype=float))
+    x1, y1, x2, y2 = bounds[0]
+    if numpy.isnan([x1, y1, x2, y2]).any():
+        raise ValueError("Invalid %s geometry" % shape_type)
+    x1, y1 = max(0, int(numpy.floor(x1))), max(0, int(numpy.floor(y1)))
+    x2 = min(size_x - 1, int(numpy.ceil(x2)))
+    y2 = min(size_y - 1, int(numpy.ceil(y2)))
+    if x1 > x2 or y1 > y2:
+        return None
+    width, height = x2 - x1 + 1, y2 - y1 + 1
+    if max_pixels is not None and width * height > max_pixels:
+        raise ValueError("Shape is too large: %s pixels in its bounding box"
+                         % (width * height))
+
+    mask = numpy.zeros((height, width), dtype=bool)
+    xs = numpy.arange(x1, x2 + 1, dtype=float)
+    polygon = get_image_polygon(geometry)
+    if polygon is not None:
+        px, py = polygon
+        for row in range(height):
+            mask[row] = polygon_row(px, py, xs, float(y1 + row))
+        return x1, y1, mask
+
+    matrix = None
+    if transform is not None:
+        # test the points mapped back by the inverse transform
+        a00, a10, a01, a11, a02, a12 = transform
+        matrix = numpy.linalg.inv(
+            numpy.array([[a00, a01, a02], [a10, a11, a12], [0, 0, 1]]))
+    for row in range(height):
+        row_xs, row_ys = xs, numpy.full(width, float(y1 + row))
+        if matrix is not None:
+            row_xs, row_ys = (
+                matrix[0, 0] * xs + matrix[0, 1] * row_ys + matrix[0, 2],
+                matrix[1, 0] * xs + matrix[1, 1] * row_ys + matrix[1, 2])
+        mask[row] = contains(geometry, row_xs, row_ys)
+    return x1, y1, mask
+
+
+def compute_stats(values, mask, percentiles=None):
+    """
+    Returns the statistics of the pixels in mask of each channel of
+    values, an array of shape (channels, height, width), as a list of
+    dicts with the keys of the ROI service results ('points', 'min',
+    'max', 'sum', 'mean', 'std_dev') and optionally 'percentiles'.
+    All channels are computed at once.
+    """
+    selected = values[:, mask].astype(numpy.float64)
+    count = selected.shape[1]
+    if count == 0:
+        stats = dict((name, numpy.zeros(len(values))) for name in
+                     ('min', 'max', 'sum', 'mean', 'std_dev'))
+    else:
+        stats = {
+            'min': selected.min(axis=1),
+            'max': selected.max(axis=1),
+            'sum': selected.sum(axis=1),
+            'mean': selected.mean(axis=1),
+            'std_dev': selected.std(axis=1),
+        }
+    rv = []
+    for c in range(len(values)):
+        stat = {'points': count}
+        for name, channel_values in stats.items():
+            stat[name] = float(channel_values[c])
+        if percentiles:
+            stat['percentiles'] = numpy.percentile(
+                selected[c], percentiles).tolist() if count > 0 else \
+                [0.0] * len(percentiles)
+        rv.append(stat)
+    return rv
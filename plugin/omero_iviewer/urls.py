@@ -24,19 +24,45 @@ urlpatterns = [
     re_path(r'^$', views.index, name='omero_iviewer_index'),
     re_path(r'^persist_rois/?$', views.persist_rois,
             name='omero_iviewer_persist_rois'),
+    # chunked save of large ROI changes: start, send chunks, commit
+    re_path(r'^persist_rois/chunked/$', views.persist_rois_session,
+            name='omero_iviewer_persist_rois_session'),
+    re_path(r'^persist_rois/chunked/(?P<session_id>[0-9a-f]+)/'
+            r'(?P<index>[0-9]+)/$', views.persist_rois_chunk,
+            name='omero_iviewer_persist_rois_chunk'),
+    re_path(r'^persist_rois/chunked/(?P<session_id>[0-9a-f]+)/commit/$',
+            views.persist_rois_commit,
+            name='omero_iviewer_persist_rois_commit'),
     re_path(r'^image_data/(?P<image_id>[0-9]+)/$', views.image_data,
             name='omero_iviewer_image_data'),
+    # image_data of many images, e.g. ?images=1,2,3
+    re_path(r'^images_data/$', views.images_data,
+            name='omero_iviewer_images_data'),
     re_path(r'^image_data/(?P<image_id>[0-9]+)/delta_t/$', views.delta_t_data,
             name='omero_iviewer_image_data_deltat'),
+    # histograms of channels of planes, e.g. ?c=0,1&z=0&t=0
+    re_path(r'^histograms/(?P<image_id>[0-9]+)/$', views.histograms,
+            name='omero_iviewer_histograms'),
     # load image_data for image linked to an ROI or Shape
     re_path(r'^(?P<obj_type>(roi|shape))/(?P<obj_id>[0-9]+)/image_data/$',
             views.roi_image_data, name='omero_iviewer_roi_image_data'),
     re_path(r'^save_projection/?$', views.save_projection,
             name='omero_iviewer_save_projection'),
+    # projections of many images, e.g. ?dataset=1&projection=intmax
+    re_path(r'^save_projections/?$', views.save_projections,
+            name='omero_iviewer_save_projections'),
+    re_path(r'^projection_job/(?P<job_id>[0-9a-f]+)/$',
+            views.projection_job, name='omero_iviewer_projection_job'),
     re_path(r'^well_images/?$', views.well_images,
             name='omero_iviewer_well_images'),
+    # images of the wells of a plate or a well, e.g. ?plate=1&thumbnails=96
+    re_path(r'^plate_images/$', views.plate_images,
+            name='omero_iviewer_plate_images'),
     re_path(r'^get_intensity/?$', views.get_intensity,
             name='omero_iviewer_get_intensity'),
+    # intensities at many points or along a polyline (POST)
+    re_path(r'^get_intensities/?$', views.get_intensities,
+            name='omero_iviewer_get_intensities'),
     re_path(r'^shape_stats/?$', views.shape_stats,
             name='omero_iviewer_shape_stats'),
     # optional z or t range e.g. iid/0-10/2-5/
@@ -44,9 +70,21 @@ urlpatterns = [
             r'(?P<the_z>[0-9]+)(?:-(?P<z_end>[0-9]+))?/'
             r'(?P<the_t>[0-9:]+)(?:-(?P<t_end>[0-9]+))?/$',
             views.rois_by_plane, name='omero_iviewer_rois_by_plane'),
+    # same as rois_by_plane, in a compact columnar form
+    re_path(r'^shapes_by_plane/(?P<image_id>[0-9]+)/'
+            r'(?P<the_z>[0-9]+)(?:-(?P<z_end>[0-9]+))?/'
+            r'(?P<the_t>[0-9:]+)(?:-(?P<t_end>[0-9]+))?/$',
+            views.shapes_by_plane, name='omero_iviewer_shapes_by_plane'),
+    # shapes on the plane(s) within a viewport, e.g. ?bbox=0,0,512,512
+    re_path(r'^rois_in_viewport/(?P<image_id>[0-9]+)/'
+            r'(?P<the_z>[0-9]+)(?:-(?P<z_end>[0-9]+))?/'
+            r'(?P<the_t>[0-9]+)(?:-(?P<t_end>[0-9]+))?/$',
+            views.rois_in_viewport, name='omero_iviewer_rois_in_viewport'),
     re_path(r'^plane_shape_counts/(?P<image_id>[0-9]+)/$',
             views.plane_shape_counts, name='omero_iviewer_plane_shape_counts'),
     # Find the index of an ROI within all ROIs for the Image (for pagination)
     re_path(r'^(?P<obj_type>(roi|shape))/(?P<obj_id>[0-9]+)/page_data/$',
             views.roi_page_data, name='omero_iviewer_roi_page_data'),
+    # request and cache metrics in the Prometheus text format
+    re_path(r'^metrics/$', views.metrics, name='omero_iviewer_metrics'),
 ]
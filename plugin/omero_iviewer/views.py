@@ -15,34 +15,51 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
 from django.shortcuts import redirect, render
-from django.http import JsonResponse, Http404
+from django.http import HttpResponse, HttpResponseForbidden, \
+    HttpResponseNotModified, JsonResponse, Http404
 from django.conf import settings
 from django.urls import reverse, NoReverseMatch
 
+import base64
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+from functools import lru_cache
 from os.path import splitext
-from collections import defaultdict
-from struct import unpack
+import time
 import traceback
+import uuid
 
 from omeroweb.api.api_settings import API_MAX_LIMIT
-from omeroweb.decorators import login_required
+from omeroweb.decorators import login_required, ConnCleaningHttpResponse
 from omeroweb.webgateway.marshal import imageMarshal
 from omeroweb.webgateway.templatetags.common_filters import lengthformat, \
     lengthunit
 
 import json
+import numpy
 import omero_marshal
 import omero
-from omero.rtypes import rint, rlong, unwrap
+from omero.rtypes import rint, rlong, rstring, unwrap
 from omero_sys_ParametersI import ParametersI
-import omero.util.pixelstypetopython as pixelstypetopython
 from omeroweb.webclient.show import get_image_roi_id_for_shape
 
 from .version import __version__
 from omero_version import omero_version
 
 from . import iviewer_settings
+from .caches import invalidate_rois, LRUCache, rois_cache_key, \
+    rois_cache_keys, TTLCache
+from .jobs import JobQueue, TooManyJobs
+from .metrics import instrument, METRICS
+from .shapes import encode_rois_columnar
+from .spatial import load_shape_index
+from .stats import compute_stats, get_shape_geometry, get_shape_mask
+from .pixels import create_raw_pixels_store, encode_array, \
+    get_histograms, get_pixels_dtype, RegionReader, sample_polyline
 
 WEB_API_VERSION = 0
 MAX_LIMIT = max(1, API_MAX_LIMIT)
@@ -55,6 +72,23 @@ ROI_COLOR_PALETTE = getattr(iviewer_settings, 'ROI_COLOR_PALETTE')
 SHOW_PALETTE_ONLY = getattr(iviewer_settings, 'SHOW_PALETTE_ONLY')
 ENABLE_MIRROR = getattr(iviewer_settings, 'ENABLE_MIRROR')
 REDIRECT_IVIEWER = getattr(iviewer_settings, 'REDIRECT_IVIEWER')
+INTENSITY_CACHE_BYTES = getattr(iviewer_settings, 'INTENSITY_CACHE_BYTES')
+ROI_CACHE_TIMEOUT = getattr(iviewer_settings, 'ROI_CACHE_TIMEOUT')
+ROI_INDEX_CACHE_BYTES = getattr(iviewer_settings, 'ROI_INDEX_CACHE_BYTES')
+ROI_SAVE_CHUNK_SIZE = getattr(iviewer_settings, 'ROI_SAVE_CHUNK_SIZE')
+IMAGE_DATA_CACHE_TIMEOUT = getattr(
+    iviewer_settings, 'IMAGE_DATA_CACHE_TIMEOUT')
+SERVER_CACHE_TIMEOUT = getattr(iviewer_settings, 'SERVER_CACHE_TIMEOUT')
+HISTOGRAM_CACHE_TIMEOUT = getattr(
+    iviewer_settings, 'HISTOGRAM_CACHE_TIMEOUT')
+SHAPE_STATS_CACHE_TIMEOUT = getattr(
+    iviewer_settings, 'SHAPE_STATS_CACHE_TIMEOUT')
+PROJECTION_WORKERS = getattr(iviewer_settings, 'PROJECTION_WORKERS')
+PROJECTION_JOBS_PER_USER = getattr(
+    iviewer_settings, 'PROJECTION_JOBS_PER_USER')
+ASYNC_PROJECTIONS = getattr(iviewer_settings, 'ASYNC_PROJECTIONS')
+METRICS_ENDPOINT = getattr(iviewer_settings, 'METRICS_ENDPOINT')
+METRICS_ALLOWED_IPS = getattr(iviewer_settings, 'METRICS_ALLOWED_IPS')
 
 PROJECTIONS = {
     'normal': -1,
@@ -64,9 +98,54 @@ PROJECTIONS = {
 }
 
 QUERY_DISTANCE = 25
+# number of ROIs loaded per query when streaming ROIs
+ROI_STREAM_BATCH_SIZE = 100
+# maximum number of images projected by one save_projections job
+MAX_PROJECTION_BATCH = 1000
+# maximum number of images listed by one plate_images request
+MAX_PLATE_IMAGES = 2000
+# number of inline thumbnails loaded per call to the thumbnail service
+THUMBNAILS_BATCH = 100
+# largest size of inline thumbnails
+MAX_THUMBNAIL_SIZE = 256
+# maximum number of images loaded by one images_data request
+MAX_IMAGE_DATA_BATCH = 100
+# maximum number of histograms (planes x channels) per request
+MAX_HISTOGRAMS = 500
+# maximum number of shapes x planes per shape_stats request
+MAX_SHAPE_STATS = 10000
+# number of concurrent calls to the ROI service per shape_stats request
+SHAPE_STATS_WORKERS = 4
+# the statistics of a shape on a channel, as returned by shape_stats
+SHAPE_STATS = ['points', 'min', 'max', 'sum', 'mean', 'std_dev']
+# maximum number of pixels in the bounding box of a shape measured by
+# the numpy engine of shape_stats
+MAX_SHAPE_STATS_PIXELS = 2048 * 2048
+# the django session key of the chunked ROI saves in progress
+ROI_SAVES_SESSION_KEY = 'omero_iviewer_roi_saves'
+# maximum number of chunked ROI saves in progress per session
+MAX_ROI_SAVES = 5
+# seconds the ids of the saved chunks of a chunked ROI save are cached
+ROI_SAVE_TIMEOUT = 3600
+# maximum number of values (points x channels x planes) per batched query
+MAX_INTENSITY_SAMPLES = 1000000
+
+# decoded raw pixel blocks shared by the intensity queries of this process
+INTENSITY_CACHE = LRUCache(INTENSITY_CACHE_BYTES)
+# projections created in the background by this process
+PROJECTION_JOBS = JobQueue(PROJECTION_WORKERS, PROJECTION_JOBS_PER_USER,
+                           shared=True)
+# shape bounding box indexes (with their creation time) per image
+ROI_INDEX_CACHE = LRUCache(
+    ROI_INDEX_CACHE_BYTES, sizeof=lambda entry: entry[1].nbytes)
+# server-wide constants such as enumerations, per server
+SERVER_CACHE = TTLCache(SERVER_CACHE_TIMEOUT)
+# histograms computed in the background, one prefetch per user at a time
+HISTOGRAM_JOBS = JobQueue(2, 1)
 
 
 @login_required()
+@instrument
 def index(request, iid=None, conn=None, **kwargs):
     # create params (incl. versions)
     params = {'VERSION': __version__, 'OMERO_VERSION': omero_version}
@@ -94,12 +173,16 @@ def index(request, iid=None, conn=None, **kwargs):
         elif params.get("IMAGES") is not None:
             image_id = int(params.get("IMAGES").split(',')[0])
         elif params.get("WELL") is not None:
-            well = conn.getObject("Well", int(params.get("WELL")))
-            if well is not None:
-                image_ids = [well_sample.getImage().id for well_sample in well.listChildren()]
-                if len(image_ids) > 0:
-                    image_id = image_ids[0]
-                    query_string = f"images={','.join(map(str, image_ids))}"
+            well_params = ParametersI()
+            well_params.addId(int(params.get("WELL")))
+            rows = conn.getQueryService().projection(
+                "select ws.image.id from WellSample ws "
+                "where ws.well.id = :id order by well_index",
+                well_params, conn.SERVICE_OPTS)
+            image_ids = [row[0].val for row in rows]
+            if len(image_ids) > 0:
+                image_id = image_ids[0]
+                query_string = f"images={','.join(map(str, image_ids))}"
 
         if image_id is not None:
             redirect_url = reverse('web_image_viewer', kwargs={'iid': image_id})
@@ -117,48 +200,8 @@ def index(request, iid=None, conn=None, **kwargs):
     viewer_settings = server_settings.get('viewer', {})
 
     params['INTERPOLATE'] = viewer_settings.get('interpolate_pixels', True)
-    # we add the (possibly prefixed) uris
-    params['WEBGATEWAY'] = reverse('webgateway')
-    params['WEBCLIENT'] = reverse('webindex')
-    try:
-        params['OMERO_FIGURE'] = reverse('figure_index')
-    except NoReverseMatch:
-        # omero-figure not installed
-        pass
-    params['WEB_API_BASE'] = reverse(
-        'api_base', kwargs={'api_version': WEB_API_VERSION})
-    if settings.FORCE_SCRIPT_NAME is not None:
-        params['URI_PREFIX'] = settings.FORCE_SCRIPT_NAME
-    params['ROI_PAGE_SIZE'] = ROI_PAGE_SIZE
-
-    c = conn.getConfigService()
-    max_bytes = None
-    try:
-        max_bytes = c.getConfigValue('omero.pixeldata.max_projection_bytes')
-        # check if MAX_PROJECTION_BYTES should override server setting
-        if max_bytes is None or len(max_bytes) == 0 or (
-                MAX_PROJECTION_BYTES > 0 and
-                MAX_PROJECTION_BYTES < int(max_bytes)):
-            max_bytes = MAX_PROJECTION_BYTES
-        else:
-            max_bytes = int(max_bytes)
-    except omero.SecurityViolation:
-        # config setting not supported in OMERO before 5.6.1
-        if MAX_PROJECTION_BYTES > 0:
-            max_bytes = MAX_PROJECTION_BYTES
-
-    try:
-        nodedescriptors = c.getConfigValue("omero.server.nodedescriptors")
-    except omero.SecurityViolation:
-        # nodedescriptors not supported in OMERO before 5.6.6 (Dec 2022)
-        nodedescriptors = None
-
-    params['MAX_PROJECTION_BYTES'] = max_bytes
-    params['MAX_ACTIVE_CHANNELS'] = MAX_ACTIVE_CHANNELS
-    params['NODEDESCRIPTORS'] = nodedescriptors
-    params['ROI_COLOR_PALETTE'] = ROI_COLOR_PALETTE
-    params['SHOW_PALETTE_ONLY'] = SHOW_PALETTE_ONLY
-    params['ENABLE_MIRROR'] = ENABLE_MIRROR
+    # the (possibly prefixed) uris and server settings
+    params.update(get_server_constant(conn, 'index_params', load_index_params))
 
     return render(
         request, 'omero_iviewer/index.html',
@@ -167,6 +210,7 @@ def index(request, iid=None, conn=None, **kwargs):
 
 
 @login_required()
+@instrument
 def persist_rois(request, conn=None, **kwargs):
     if not request.method == 'POST':
         return JsonResponse({"errors": ["Use HTTP POST to send data!"]})
@@ -184,115 +228,296 @@ def persist_rois(request, conn=None, **kwargs):
     if rois is None:
         return JsonResponse({"errors": ["Could not find rois object!"]})
 
-    # get the associated image and an instance of the update service
-    image = conn.getObject("Image", image_id, opts=conn.SERVICE_OPTS)
-    if image is None:
-        return JsonResponse({"errors": ["Could not find associated image!"]})
+    image, error = get_image_for_update(conn, image_id)
+    if error is not None:
+        return JsonResponse({"errors": [error]})
+
+    ids_to_sync, errors = save_rois(conn, image, rois)
+
+    # cached ROI data of the image (e.g. shape counts) is now out of date
+    invalidate_rois(image_id)
+
+    # prepare response
+    ret = {'ids': ids_to_sync}
+    if len(errors) > 0:
+        ret['errors'] = errors
+
+    return JsonResponse(ret)
 
-    # prepare services
-    update_service = conn.getUpdateService()
-    if update_service is None:
-        return JsonResponse({"errors": ["Could not get update service!"]})
 
+def get_image_for_update(conn, image_id):
+    """
+    Returns the image ROIs are saved to and sets the group context of conn
+    to its group, or None and an error message.
+    """
+    image = conn.getObject("Image", image_id, opts=conn.SERVICE_OPTS)
+    if image is None:
+        return None, "Could not find associated image!"
     # when persisting we use the specific group context
     conn.SERVICE_OPTS['omero.group'] = image.getDetails().getGroup().getId()
+    return image, None
+
+
+def save_rois(conn, image, rois):
+    """
+    Saves the new, modified and deleted shapes and deletes the empty rois
+    given by the client.
+
+    Returns the dict of client ids of the saved shapes to their saved
+    'roi:shape' ids, and a list of errors.
+    """
+    update_service = conn.getUpdateService()
 
     # for id syncing
     ids_to_sync = {}
     # keep track of errors
     errors = []
 
-    # insert new ones
-    try:
-        new = rois.get('new', [])
-        new_count = len(new)
-        if new_count > 0:
-            decoded_rois = []
-            for n in new:
-                new_roi = {
-                    "@type":
-                    "http://www.openmicroscopy.org/Schemas/OME/2016-06#ROI",
-                    "shapes": [n]
-                }
-                decoder = omero_marshal.get_decoder(new_roi.get("@type"))
-                decoded_roi = decoder.decode(new_roi)
-                decoded_roi.setImage(image._obj)
-                decoded_rois.append(decoded_roi)
-            decoded_rois = update_service.saveAndReturnArray(
-                decoded_rois, conn.SERVICE_OPTS)
-            # sync ids
-            for r in range(new_count):
-                ids_to_sync[new[r]['oldId']] = \
-                    str(decoded_rois[r].getId().getValue()) + ':' + \
-                    str(decoded_rois[r].getShape(0).getId().getValue())
-    except Exception as marshal_or_persistence_exception:
-        errors.append('Error persisting new rois: ' +
-                      repr(marshal_or_persistence_exception))
+    new = rois.get('new', [])
+    modified = rois.get('modified', [])
+    empty_rois = rois.get('empty_rois', {})
+    deleted = rois.get('deleted', {})
 
-    # modify existing ones
+    # delete entire (empty) rois, waiting for it after the save below
+    delete_handle = None
     try:
-        modified = rois.get('modified', [])
-        modified_count = len(modified)
-        if modified_count > 0:
-            decoded_shapes = []
-            for m in modified:
-                decoder = omero_marshal.get_decoder(m.get("@type"))
-                decoded_shapes.append(decoder.decode(m))
-            update_service.saveArray(decoded_shapes, conn.SERVICE_OPTS)
-        # set ids after successful modification
-        for r in range(modified_count):
-            ids_to_sync[modified[r]['oldId']] = modified[r]['oldId']
-    except Exception as marshal_or_persistence_exception:
-        errors.append('Error modifying rois: ' +
-                      repr(marshal_or_persistence_exception))
-
-    # delete entire (empty) rois
-    try:
-        empty_rois = rois.get('empty_rois', {})
         empty_rois_ids = [int(k) for k in list(empty_rois.keys())]
-        if (len(empty_rois_ids) > 0):
-            conn.deleteObjects("Roi", empty_rois_ids, wait=True)
-        # set ids after successful deletion,
-        for e in empty_rois:
-            for s in empty_rois[e]:
-                ids_to_sync[s] = s
+        if len(empty_rois_ids) > 0:
+            delete_handle = conn.deleteObjects("Roi", empty_rois_ids)
     except Exception as deletion_exception:
         errors.append('Error deleting empty rois: ' +
                       repr(deletion_exception))
 
-    # remove individual shapes (so as to not punch holes into shape index)
+    # new, modified and deleted shapes are saved together
     try:
-        deleted = rois.get('deleted', {})
-        deleted_rois_ids = deleted.keys()
-        if len(deleted_rois_ids) > 0:
-            rois_service = conn.getRoiService()
-            rois_to_be_updated = []
-            for d in deleted_rois_ids:
-                r = rois_service.findByRoi(
-                    int(d), None, conn.SERVICE_OPTS).rois[0]
-                for s in r.copyShapes():
-                    roi_shape_id = str(d) + ':' + str(s.getId().getValue())
-                    if roi_shape_id in deleted[d]:
-                        r.removeShape(s)
-                rois_to_be_updated.append(r)
-            update_service.saveArray(rois_to_be_updated, conn.SERVICE_OPTS)
-            # set ids after successful deletion,
+        to_save = []
+        for n in new:
+            new_roi = {
+                "@type":
+                "http://www.openmicroscopy.org/Schemas/OME/2016-06#ROI",
+                "shapes": [n]
+            }
+            decoder = omero_marshal.get_decoder(new_roi.get("@type"))
+            decoded_roi = decoder.decode(new_roi)
+            decoded_roi.setImage(image._obj)
+            to_save.append(decoded_roi)
+
+        modified_shapes = {}
+        for m in modified:
+            decoder = omero_marshal.get_decoder(m.get("@type"))
+            decoded_shape = decoder.decode(m)
+            modified_shapes[decoded_shape.id.val] = decoded_shape
+
+        # remove individual shapes (so as to not punch holes into shape
+        # index), loading all the rois concerned with one query
+        deleted_ids = set()
+        for d in deleted:
+            deleted_ids.update(int(s.split(':')[1]) for s in deleted[d])
+        for r in load_rois_for_update(conn, list(deleted.keys())):
+            shapes = []
+            for s in r.copyShapes():
+                if s is None:
+                    continue
+                shape_id = s.getId().getValue()
+                if shape_id in deleted_ids:
+                    continue
+                # modified shapes of the roi are saved with it
+                shapes.append(modified_shapes.pop(shape_id, s))
+            r.clearShapes()
+            for s in shapes:
+                r.addShape(s)
+            to_save.append(r)
+        to_save.extend(modified_shapes.values())
+
+        if len(to_save) > 0:
+            saved = update_service.saveAndReturnArray(
+                to_save, conn.SERVICE_OPTS)
+            # sync ids
+            for r in range(len(new)):
+                ids_to_sync[new[r]['oldId']] = \
+                    str(saved[r].getId().getValue()) + ':' + \
+                    str(saved[r].getShape(0).getId().getValue())
+            for m in modified:
+                ids_to_sync[m['oldId']] = m['oldId']
             for d in deleted:
                 for s in deleted[d]:
                     ids_to_sync[s] = s
-    except Exception as deletion_exception:
-        errors.append('Error deleting shapes: ' + repr(deletion_exception))
+    except Exception as marshal_or_persistence_exception:
+        errors.append('Error saving rois: ' +
+                      repr(marshal_or_persistence_exception))
 
-    # prepare response
-    ret = {'ids': ids_to_sync}
+    if delete_handle is not None:
+        try:
+            conn._waitOnCmd(delete_handle, closehandle=True)
+            # set ids after successful deletion
+            for e in empty_rois:
+                for s in empty_rois[e]:
+                    ids_to_sync[s] = s
+        except Exception as deletion_exception:
+            errors.append('Error deleting empty rois: ' +
+                          repr(deletion_exception))
+
+    return ids_to_sync, errors
+
+
+@login_required()
+@instrument
+def persist_rois_session(request, conn=None, **kwargs):
+    """
+    Starts a chunked save of ROIs for an image, for changes that are too
+    large to be sent to persist_rois at once.
+
+    Returns the id of the save session and the maximum number of changes
+    (shapes, or deleted shapes) per chunk. The chunks are then sent to
+    persist_rois_chunk, and the save is ended by persist_rois_commit.
+    """
+    if not request.method == 'POST':
+        return JsonResponse({"errors": ["Use HTTP POST to send data!"]})
+    try:
+        image_id = int(json.loads(request.body).get('imageId'))
+    except Exception as e:
+        return JsonResponse({"errors": ["No image id provided: " + repr(e)]})
+    image, error = get_image_for_update(conn, image_id)
+    if error is not None:
+        return JsonResponse({"errors": [error]})
+
+    # the indices of the saved chunks are kept in the django session, so
+    # that any web worker can handle the chunks
+    saves = request.session.get(ROI_SAVES_SESSION_KEY, {})
+    # forget about the oldest saves that were never committed
+    for session_id in list(saves.keys())[:-(MAX_ROI_SAVES - 1)]:
+        del saves[session_id]
+    session_id = uuid.uuid4().hex
+    saves[session_id] = {'imageId': image_id, 'chunks': []}
+    request.session[ROI_SAVES_SESSION_KEY] = saves
+    return JsonResponse(
+        {'session': session_id, 'chunkSize': ROI_SAVE_CHUNK_SIZE})
+
+
+@login_required()
+@instrument
+def persist_rois_chunk(request, session_id, index, conn=None, **kwargs):
+    """
+    Saves a chunk of ROI changes, with the same 'rois' as persist_rois.
+
+    The chunk is saved when it arrives and its ids are returned, so a
+    chunk that failed can be sent again. A chunk is saved once: sending it
+    again once saved, even if the save reported errors (e.g. deleting
+    empty ROIs), returns its ids from the django cache without saving it.
+    The ids are only returned again if the cache is shared by the web
+    workers, so clients should keep those of the first response.
+    """
+    if not request.method == 'POST':
+        return JsonResponse({"errors": ["Use HTTP POST to send data!"]})
+    saves = request.session.get(ROI_SAVES_SESSION_KEY, {})
+    save = saves.get(session_id)
+    if save is None:
+        return JsonResponse(
+            {"errors": ["Unknown save session %s" % session_id]}, status=404)
+    if index in save['chunks']:
+        ids = cache.get(roi_save_cache_key(session_id, index))
+        return JsonResponse({'ids': ids or {}})
+
+    try:
+        rois = json.loads(request.body).get('rois', None)
+    except Exception as e:
+        return JsonResponse({"errors": ["Failed to load json: " + repr(e)]})
+    if rois is None:
+        return JsonResponse({"errors": ["Could not find rois object!"]})
+    if count_roi_changes(rois) > ROI_SAVE_CHUNK_SIZE:
+        return JsonResponse({"errors": [
+            "Chunks must have at most %s changes" % ROI_SAVE_CHUNK_SIZE]},
+            status=400)
+
+    image, error = get_image_for_update(conn, save['imageId'])
+    if error is not None:
+        return JsonResponse({"errors": [error]})
+    ids_to_sync, errors = save_rois(conn, image, rois)
+    invalidate_rois(save['imageId'])
+    # the chunk is saved unless it failed as a whole
+    if len(ids_to_sync) > 0 or len(errors) == 0:
+        cache.set(roi_save_cache_key(session_id, index), ids_to_sync,
+                  ROI_SAVE_TIMEOUT)
+        save['chunks'].append(index)
+        request.session[ROI_SAVES_SESSION_KEY] = saves
     if len(errors) > 0:
-        ret['errors'] = errors
+        return JsonResponse({'ids': ids_to_sync, 'errors': errors})
+    return JsonResponse({'ids': ids_to_sync})
+
+
+def roi_save_cache_key(session_id, index):
+    """Returns the django cache key of the ids of a saved chunk."""
+    return 'omero_iviewer:roi_save:%s:%s' % (session_id, index)
+
+
+@login_required()
+@instrument
+def persist_rois_commit(request, session_id, conn=None, **kwargs):
+    """
+    Ends a chunked save and returns the ids of all the saved chunks, as
+    persist_rois would have for all the changes, which are read from the
+    django cache (see persist_rois_chunk).
 
+    If 'chunks', the number of chunks sent, is given then the indices of
+    the chunks that were not saved are returned as 'missing' and the save
+    session is kept, so that they can be sent before committing again.
+    """
+    if not request.method == 'POST':
+        return JsonResponse({"errors": ["Use HTTP POST to send data!"]})
+    saves = request.session.get(ROI_SAVES_SESSION_KEY, {})
+    save = saves.get(session_id)
+    if save is None:
+        return JsonResponse(
+            {"errors": ["Unknown save session %s" % session_id]}, status=404)
+    try:
+        chunks = json.loads(request.body or '{}').get('chunks', None)
+    except Exception as e:
+        return JsonResponse({"errors": ["Failed to load json: " + repr(e)]})
+
+    keys = [roi_save_cache_key(session_id, index)
+            for index in save['chunks']]
+    ids_to_sync = {}
+    for ids in cache.get_many(keys).values():
+        ids_to_sync.update(ids)
+    ret = {'ids': ids_to_sync}
+    if chunks is not None:
+        missing = [i for i in range(int(chunks))
+                   if str(i) not in save['chunks']]
+        if len(missing) > 0:
+            ret['missing'] = missing
+            ret['errors'] = ["Chunks %s were not saved" % missing]
+            return JsonResponse(ret)
+
+    del saves[session_id]
+    request.session[ROI_SAVES_SESSION_KEY] = saves
+    cache.delete_many(keys)
     return JsonResponse(ret)
 
 
+def count_roi_changes(rois):
+    """
+    Returns the number of changes in the 'rois' sent by the client: new,
+    modified and deleted shapes and empty rois.
+    """
+    return len(rois.get('new', [])) + len(rois.get('modified', [])) + \
+        sum(len(shapes) for shapes in rois.get('deleted', {}).values()) + \
+        len(rois.get('empty_rois', {}))
+
+
+def load_rois_for_update(conn, ids):
+    """Loads the ROIs with the given IDs and all their Shapes."""
+    if len(ids) == 0:
+        return []
+    params = omero.sys.ParametersI()
+    params.addIds([int(i) for i in ids])
+    return conn.getQueryService().findAllByQuery("""
+        select distinct roi from Roi roi left outer join fetch roi.shapes
+        where roi.id in (:ids)
+    """, params, conn.SERVICE_OPTS)
+
+
 def get_query_for_rois_by_plane(the_z=None, the_t=None, z_end=None,
-                                t_end=None, load_shapes=False):
+                                t_end=None, after=None, before=None):
 
     clauses = ['roi.image.id = :id']
     if the_z is not None:
@@ -307,6 +532,11 @@ def get_query_for_rois_by_plane(the_z=None, the_t=None, z_end=None,
             where_t = """((shapes.theT >= %s and shapes.theT <= %s)
                 or shapes.theT is null)""" % (the_t, t_end)
         clauses.append(where_t)
+    if after is not None:
+        # keyset pagination: only ROIs after the last one of previous page
+        clauses.append("roi.id > %s" % int(after))
+    if before is not None:
+        clauses.append("roi.id < %s" % int(before))
 
     query = """
         select distinct(roi.id) from Roi roi
@@ -314,21 +544,12 @@ def get_query_for_rois_by_plane(the_z=None, the_t=None, z_end=None,
         where %s
     """ % ' and '.join(clauses)
 
-    if load_shapes:
-        # If we want to load ALL shapes for the ROIs (omero-marshal fails if
-        # any shapes are None) we use the query above to get ROI IDs, then
-        # load all ROIs with Shapes
-        query = """
-            select roi from Roi roi
-            join fetch roi.details.owner join fetch roi.details.creationEvent
-            left outer join fetch roi.shapes
-            where roi.id in (%s) order by roi.id
-        """ % (query)
-
     return query
 
 
-@login_required()
+# the connection is closed by the decorator, or by the streamed response
+@login_required(doConnectionCleanup=False)
+@instrument
 def rois_by_plane(request, image_id, the_z, the_t, z_end=None, t_end=None,
                   conn=None, **kwargs):
     """
@@ -337,38 +558,255 @@ def rois_by_plane(request, image_id, the_z, the_t, z_end=None, t_end=None,
     Includes Shapes where Z or T are null.
     If z_end or t_end are not None, we filter by any shape within the
     range (inclusive of z/t_end)
+
+    Pages are requested with the 'after' parameter, the id of the last ROI
+    of the previous page which is returned as meta.next (null on the last
+    page). The 'offset' parameter is still supported.
+
+    With stream=true the ROIs are loaded and encoded in batches while the
+    response is sent. The viewer itself loads shapes_by_plane, so the
+    streamed mode is only used by other clients of this API.
     """
-    query_service = conn.getQueryService()
+    try:
+        ids, meta = get_rois_by_plane_page(
+            request, conn, image_id, the_z, the_t, z_end, t_end)
+    except ValueError:
+        return JsonResponse(
+            {"error": "after, offset and limit must be integers"},
+            status=400)
+
+    if request.GET.get("stream") == "true":
+        # load and encode the ROIs in batches while the response is sent,
+        # the connection is closed once the stream is done
+        rsp = ConnCleaningHttpResponse(
+            stream_rois_json(conn, ids, meta),
+            content_type='application/json')
+        rsp.conn = conn
+        return rsp
 
-    params = omero.sys.ParametersI()
-    params.addId(image_id)
-    filter = omero.sys.Filter()
-    filter.offset = rint(request.GET.get("offset", 0))
-    limit = min(MAX_LIMIT, int(request.GET.get("limit", MAX_LIMIT)))
-    filter.limit = rint(limit)
-    params.theFilter = filter
+    marshalled = []
+    for r in load_rois_with_shapes(conn, ids):
+        encoder = get_encoder(r.__class__)
+        if encoder is not None:
+            marshalled.append(encoder.encode(r))
+
+    return JsonResponse({'data': marshalled, 'meta': meta})
+
+
+@login_required()
+@instrument
+def shapes_by_plane(request, image_id, the_z, the_t, z_end=None, t_end=None,
+                    conn=None, **kwargs):
+    """
+    Get the same ROIs as rois_by_plane in a compact columnar form.
 
-    query = get_query_for_rois_by_plane(the_z, the_t, z_end, t_end,
-                                        load_shapes=True)
-    rois = query_service.findAllByQuery(query, params, conn.SERVICE_OPTS)
+    See shapes.encode_rois_columnar() for the format.
+    """
+    try:
+        ids, meta = get_rois_by_plane_page(
+            request, conn, image_id, the_z, the_t, z_end, t_end)
+    except ValueError:
+        return JsonResponse(
+            {"error": "after, offset and limit must be integers"},
+            status=400)
+    rv = encode_rois_columnar(load_rois_with_shapes(conn, ids))
+    rv['meta'] = meta
+    return JsonResponse(rv)
+
+
+@login_required()
+@instrument
+def rois_in_viewport(request, image_id, the_z, the_t, z_end=None,
+                     t_end=None, conn=None, **kwargs):
+    """
+    Get the Shapes on the given Z and T plane(s), as for rois_by_plane,
+    whose bounding boxes intersect the viewport.
+
+    The viewport is given by bbox=x1,y1,x2,y2 in image coordinates.
+    Shapes are returned with their ROIs, which only include the shapes in
+    the viewport. At most 'limit' shapes are returned, meta.totalCount is
+    the number of shapes in the viewport. With format=columnar the ROIs
+    are encoded as for shapes_by_plane.
+    """
+    try:
+        x1, y1, x2, y2 = [float(v) for v in
+                          request.GET.get('bbox', '').split(',')]
+        limit = int(request.GET.get('limit', MAX_LIMIT))
+    except ValueError:
+        return JsonResponse(
+            {"error": "bbox=x1,y1,x2,y2 and limit must be numbers"},
+            status=400)
+    if x2 < x1 or y2 < y1:
+        return JsonResponse({"error": "Invalid bbox"}, status=400)
+
+    index = get_shape_index(conn, image_id)
+    found = index.query(
+        x1, y1, x2, y2, int(the_z), int(the_t),
+        None if z_end is None else int(z_end),
+        None if t_end is None else int(t_end))
+    # in the order of rois_by_plane
+    found = found[numpy.lexsort((index.ids[found], index.rois[found]))]
+    total = len(found)
+    found = found[:max(0, min(MAX_LIMIT, limit))]
+    rois = load_shapes_with_rois(conn, index.ids[found].tolist())
+    meta = {"totalCount": total, "count": len(found)}
+
+    if request.GET.get('format') == 'columnar':
+        rv = encode_rois_columnar(rois)
+        rv['meta'] = meta
+        return JsonResponse(rv)
     marshalled = []
     for r in rois:
-        encoder = omero_marshal.get_encoder(r.__class__)
+        encoder = get_encoder(r.__class__)
         if encoder is not None:
             marshalled.append(encoder.encode(r))
+    return JsonResponse({'data': marshalled, 'meta': meta})
+
+
+def get_shape_index(conn, image_id):
+    """
+    Returns the bounding box index of the Shapes of an image, cached per
+    process. The cache key includes the ROIs version which persist_rois
+    changes, cached indexes expire after ROI_CACHE_TIMEOUT seconds.
+    """
+    key = rois_cache_key(conn, image_id, 'shape_index')
+    entry = ROI_INDEX_CACHE.get(key)
+    if entry is not None and entry[0] > time.time() - ROI_CACHE_TIMEOUT:
+        return entry[1]
+    index = load_shape_index(
+        conn.getQueryService(), image_id, conn.SERVICE_OPTS)
+    ROI_INDEX_CACHE.put(key, (time.time(), index))
+    return index
+
 
-    # Modify query to only select count() and NOT paginate
-    query = get_query_for_rois_by_plane(the_z, the_t, z_end, t_end)
-    query = query.replace("distinct(roi.id)", "count(distinct roi.id)")
+def load_shapes_with_rois(conn, ids):
+    """
+    Loads the Shapes with the given IDs and returns their ROIs, holding
+    only these Shapes, ordered by ROI id.
+    """
+    if len(ids) == 0:
+        return []
+    params = omero.sys.ParametersI()
+    params.addIds(ids)
+    shapes = conn.getQueryService().findAllByQuery("""
+        select shape from Shape shape
+        join fetch shape.details.owner join fetch shape.details.creationEvent
+        join fetch shape.roi roi
+        join fetch roi.details.owner join fetch roi.details.creationEvent
+        where shape.id in (:ids) order by roi.id, shape.id
+    """, params, conn.SERVICE_OPTS)
+    rois = OrderedDict()
+    for shape in shapes:
+        loaded = shape.roi
+        roi = rois.get(loaded.id.val)
+        if roi is None:
+            # an unsaved copy, holding only the requested shapes
+            roi = omero.model.RoiI(loaded.id.val, True)
+            roi.name = loaded.name
+            roi._details = loaded.details
+            rois[loaded.id.val] = roi
+        roi.addShape(shape)
+    return list(rois.values())
+
+
+def get_rois_by_plane_page(request, conn, image_id, the_z, the_t,
+                           z_end=None, t_end=None):
+    """
+    Returns the IDs of the page of ROIs requested (with either the 'after'
+    cursor or an 'offset' and a 'limit') and the meta data of the page.
+    Raises ValueError if these parameters are not integers.
+    """
+    after = request.GET.get("after", None)
+    filter = omero.sys.Filter()
+    if after is not None:
+        after = int(after)
+    else:
+        filter.offset = rint(int(request.GET.get("offset", 0)))
+    limit = min(MAX_LIMIT, int(request.GET.get("limit", MAX_LIMIT)))
+    filter.limit = rint(limit)
     params = omero.sys.ParametersI()
     params.addId(image_id)
-    result = query_service.projection(query, params, conn.SERVICE_OPTS)
-    meta = {"totalCount": result[0][0].val}
+    params.theFilter = filter
 
-    return JsonResponse({'data': marshalled, 'meta': meta})
+    # Page through the ROI IDs first (without loading any shapes), the
+    # ROIs are then loaded with ALL their Shapes (omero-marshal fails if
+    # any shapes are None)
+    query = get_query_for_rois_by_plane(the_z, the_t, z_end, t_end, after)
+    query += " order by roi.id"
+    ids = [unwrap(row[0]) for row in conn.getQueryService().projection(
+        query, params, conn.SERVICE_OPTS)]
+    meta = {
+        "totalCount": get_rois_by_plane_count(
+            conn, image_id, the_z, the_t, z_end, t_end),
+        "next": ids[-1] if len(ids) == limit else None,
+    }
+    return ids, meta
+
+
+def load_rois_with_shapes(conn, ids):
+    """Loads the ROIs with the given IDs, with all their Shapes."""
+    if len(ids) == 0:
+        return []
+    params = omero.sys.ParametersI()
+    params.addIds(ids)
+    return conn.getQueryService().findAllByQuery("""
+        select roi from Roi roi
+        join fetch roi.details.owner join fetch roi.details.creationEvent
+        left outer join fetch roi.shapes
+        where roi.id in (:ids) order by roi.id
+    """, params, conn.SERVICE_OPTS)
+
+
+# omero_marshal encoders by model class
+ENCODERS = {}
+
+
+def get_encoder(model_class):
+    """Returns the (cached) omero_marshal encoder for a model class."""
+    if model_class not in ENCODERS:
+        ENCODERS[model_class] = omero_marshal.get_encoder(model_class)
+    return ENCODERS[model_class]
+
+
+def stream_rois_json(conn, ids, meta):
+    """
+    Generates the json of {data: [rois], meta: meta}, identical to that of
+    a JsonResponse, loading and encoding the ROIs in batches.
+    """
+    yield '{"data": ['
+    separator = ''
+    for start in range(0, len(ids), ROI_STREAM_BATCH_SIZE):
+        batch = ids[start:start + ROI_STREAM_BATCH_SIZE]
+        for r in load_rois_with_shapes(conn, batch):
+            encoder = get_encoder(r.__class__)
+            if encoder is not None:
+                yield separator + json.dumps(
+                    encoder.encode(r), cls=DjangoJSONEncoder)
+                separator = ', '
+    yield '], "meta": ' + json.dumps(meta, cls=DjangoJSONEncoder) + '}'
+
+
+def get_rois_by_plane_count(conn, image_id, the_z=None, the_t=None,
+                            z_end=None, t_end=None):
+    """Returns the number of ROIs with any Shapes on the plane(s), cached."""
+    key = rois_cache_key(conn, image_id, 'rois_by_plane_count',
+                         the_z, z_end, the_t, t_end)
+    count = cache.get(key)
+    if count is None:
+        # Modify query to only select count() and NOT paginate
+        query = get_query_for_rois_by_plane(the_z, the_t, z_end, t_end)
+        query = query.replace("distinct(roi.id)", "count(distinct roi.id)")
+        params = omero.sys.ParametersI()
+        params.addId(image_id)
+        result = conn.getQueryService().projection(
+            query, params, conn.SERVICE_OPTS)
+        count = result[0][0].val
+        cache.set(key, count, ROI_CACHE_TIMEOUT)
+    return count
 
 
 @login_required()
+@instrument
 def plane_shape_counts(request, image_id, conn=None, **kwargs):
     """
     Get the number of shapes that will be visible on each plane.
@@ -380,58 +818,71 @@ def plane_shape_counts(request, image_id, conn=None, **kwargs):
     if image is None:
         return JsonResponse({"error": "Image not found"}, status=404)
 
-    query_service = conn.getQueryService()
-    params = omero.sys.ParametersI()
-    params.addId(image_id)
-    counts = []
-
-    # Attempt to load counts for each Z/T index.
-    # Unfortunately this is too slow. Use alternative approach (see below)
-    # query = """
-    #     select count(distinct shape) from Shape shape
-    #     join shape.roi as roi
-    #     where (shape.theZ = %s or shape.theZ is null)
-    #     and (shape.theT = %s or shape.theT is null)
-    #     and roi.image.id = :id
-    # """
-    # for z in range(image.getSizeZ()):
-    #     t_counts = []
-    #     for t in range(image.getSizeT()):
-    #         result = query_service.projection(query % (z, t), params,
-    #                                           conn.SERVICE_OPTS)
-    #         t_counts.append(result[0][0].val)
-    #     counts.append(t_counts)
-
     size_t = image.getSizeT()
     size_z = image.getSizeZ()
-    counts = [[0] * size_t for z in range(size_z)]
+    key = rois_cache_key(conn, image_id, 'plane_shape_counts')
+    counts = cache.get(key)
+    if counts is None:
+        params = omero.sys.ParametersI()
+        params.addId(image_id)
+        counts = get_plane_shape_counts(conn.getQueryService(), params,
+                                        size_z, size_t, conn.SERVICE_OPTS)
+        cache.set(key, counts, ROI_CACHE_TIMEOUT)
+
+    encoding = request.GET.get("encoding", None)
+    if encoding in ('rle', 'sparse'):
+        rsp = encode_counts(counts, encoding)
+        rsp['shape'] = [size_z, size_t]
+        return JsonResponse(rsp)
+    return JsonResponse({'data': counts.tolist()})
 
+
+def get_plane_shape_counts(query_service, params, size_z, size_t, opts):
+    """
+    Returns a (size_z, size_t) array of the number of shapes on each plane.
+
+    Shapes are counted with a single query grouped by Z and T. The counts
+    of shapes with theZ and/or theT unset are added to all Z and/or T.
+    params must hold the image id.
+    """
     query = """
-        select shape.theZ, shape.theT from Shape shape
+        select shape.theZ, shape.theT, count(shape.id) from Shape shape
         join shape.roi as roi where roi.image.id = :id
+        group by shape.theZ, shape.theT
     """
-    # key is 'z:t' for unattached shapes, e.g. {'none:5':3}
-    unattached_counts = defaultdict(int)
-    result = query_service.projection(query, params, conn.SERVICE_OPTS)
-    for shape in result:
-        z = unwrap(shape[0])
-        t = unwrap(shape[1])
-        if z is not None and t is not None:
-            counts[z][t] += 1
-        else:
-            key = "%s:%s" % (z, t)
-            unattached_counts[key] += 1
-
-    for key, count in unattached_counts.items():
-        z = key.split(':')[0]
-        t = key.split(':')[1]
-        z_range = range(size_z) if z == 'None' else [int(z)]
-        t_range = range(size_t) if t == 'None' else [int(t)]
-        for the_z in z_range:
-            for the_t in t_range:
-                counts[the_z][the_t] += count
+    counts = numpy.zeros((size_z, size_t), dtype=numpy.int64)
+    result = query_service.projection(query, params, opts)
+    for row in result:
+        z, t, count = unwrap(row)
+        # ignore shapes that are outside of the image dimensions
+        if (z is not None and not 0 <= z < size_z) or \
+                (t is not None and not 0 <= t < size_t):
+            continue
+        counts[slice(None) if z is None else z,
+               slice(None) if t is None else t] += count
+    return counts
+
+
+def encode_counts(counts, encoding):
+    """
+    Returns a compact encoding of a 2D counts array.
 
-    return JsonResponse({'data': counts})
+    'rle' gives the runs of equal values of the array in row order as
+    {values: [...], lengths: [...]}, 'sparse' gives the indices and values
+    of the non-zero entries as {z: [...], t: [...], values: [...]}.
+    """
+    if encoding == 'sparse':
+        zs, ts = numpy.nonzero(counts)
+        return {'encoding': 'sparse', 'z': zs.tolist(), 't': ts.tolist(),
+                'values': counts[zs, ts].tolist()}
+    flat = counts.ravel()
+    if flat.size == 0:
+        return {'encoding': 'rle', 'values': [], 'lengths': []}
+    starts = numpy.concatenate(
+        ([0], numpy.flatnonzero(numpy.diff(flat)) + 1))
+    lengths = numpy.diff(numpy.append(starts, flat.size))
+    return {'encoding': 'rle', 'values': flat[starts].tolist(),
+            'lengths': lengths.tolist()}
 
 
 def get_shape_info(conn, shape_id):
@@ -464,27 +915,22 @@ def get_shape_info(conn, shape_id):
 
 
 @login_required()
+@instrument
 def roi_page_data(request, obj_type, obj_id, conn=None, **kwargs):
     """
     Get info for loading the correct 'page' of ROIs
 
     Returns {image: {'id': 1}, roi_index: 123, roi_count: 3456}
     """
-    qs = conn.getQueryService()
     image_id = None
     roi_id = None
     shape_info = None
-    ids = []
     if obj_type == 'roi':
         roi_id = int(obj_id)
-        roi = qs.get('Roi', roi_id)
+        roi = conn.getQueryService().get('Roi', roi_id, conn.SERVICE_OPTS)
         image_id = roi.image.id.val
-        params = omero.sys.ParametersI()
-
-        params.addId(image_id)
-        query = "select roi.id from Roi roi where roi.image.id = :id"
-        ids = [i[0].val for i in qs.projection(query, params,
-                                               conn.SERVICE_OPTS)]
+        index = get_roi_index(conn, image_id, roi_id)
+        count = get_roi_count(conn, image_id)
     elif obj_type == 'shape':
         shape_info = get_shape_info(conn, obj_id)
         if shape_info is not None:
@@ -492,22 +938,17 @@ def roi_page_data(request, obj_type, obj_id, conn=None, **kwargs):
             roi_id = shape_info.get('roi_id')
             the_z = shape_info.get('theZ')
             the_t = shape_info.get('theT')
-            query = get_query_for_rois_by_plane(the_z, the_t)
-            params = omero.sys.ParametersI()
-            params.addId(image_id)
-            result = qs.projection(query, params, conn.SERVICE_OPTS)
-            for roi in result:
-                ids.append(unwrap(roi[0]))
+            index = get_roi_index(conn, image_id, roi_id, the_z, the_t,
+                                  by_plane=True)
+            count = get_rois_by_plane_count(conn, image_id, the_z, the_t)
     if image_id is None:
         raise Http404(f'Could not find {obj_type}: {obj_id}')
 
-    ids.sort()
-    index = ids.index(roi_id)
     rsp = {
         'image': {'id': image_id},
         'roi': {'id': roi_id},
         'roi_index': index,
-        'roi_count': len(ids)
+        'roi_count': count
     }
     if shape_info is not None:
         rsp['theT'] = shape_info.get('theT')
@@ -515,7 +956,36 @@ def roi_page_data(request, obj_type, obj_id, conn=None, **kwargs):
     return JsonResponse(rsp)
 
 
+def get_roi_index(conn, image_id, roi_id, the_z=None, the_t=None,
+                  by_plane=False):
+    """
+    Returns the index of a ROI in the ROIs of its image sorted by id, or
+    in those with shapes on the plane if by_plane, cached.
+    """
+    key = rois_cache_key(conn, image_id, 'roi_index', roi_id,
+                         by_plane, the_z, the_t)
+    index = cache.get(key)
+    if index is None:
+        if by_plane:
+            query = get_query_for_rois_by_plane(the_z, the_t, before=roi_id)
+            query = query.replace("distinct(roi.id)",
+                                  "count(distinct roi.id)")
+        else:
+            query = """
+                select count(roi.id) from Roi roi
+                where roi.image.id = :id and roi.id < %s
+            """ % int(roi_id)
+        params = omero.sys.ParametersI()
+        params.addId(image_id)
+        result = conn.getQueryService().projection(
+            query, params, conn.SERVICE_OPTS)
+        index = result[0][0].val
+        cache.set(key, index, ROI_CACHE_TIMEOUT)
+    return index
+
+
 @login_required()
+@instrument
 def roi_image_data(request, obj_type, obj_id, conn=None, **kwargs):
     """ Get image_data for image linked to ROI """
     image_id = None
@@ -532,119 +1002,545 @@ def roi_image_data(request, obj_type, obj_id, conn=None, **kwargs):
 
 
 @login_required()
+@instrument
 def image_data(request, image_id, conn=None, **kwargs):
+    """
+    Get the data of an image needed by the viewer.
 
-    image = conn.getObject("Image", image_id)
-
-    if image is None:
+    Responses have a strong ETag, a 304 is returned if it matches the
+    If-None-Match header. The data is cached with the same key, which
+    includes the user context and the last changes of the image, its
+    pixels, rendering settings and ROIs.
+    """
+    etag = get_image_data_etags(conn, [int(image_id)]).get(int(image_id))
+    if etag is None:
         return JsonResponse({"error": "Image not found"}, status=404)
+    if etag_matches(request, etag):
+        rsp = HttpResponseNotModified()
+    else:
+        key = 'omero_iviewer:image_data:' + etag.strip('"')
+        rv = cache.get(key)
+        if rv is None:
+            image = conn.getObject("Image", image_id)
+            if image is None:
+                return JsonResponse(
+                    {"error": "Image not found"}, status=404)
+            try:
+                rv = marshal_image_data(conn, image)
+            except Exception:
+                return JsonResponse({'error': traceback.format_exc()})
+            cache.set(key, rv, IMAGE_DATA_CACHE_TIMEOUT)
+        rsp = JsonResponse(rv)
+    rsp['ETag'] = etag
+    # the browser keeps the response, but checks it is still valid
+    rsp['Cache-Control'] = 'private, no-cache'
+    return rsp
+
+
+@login_required()
+@instrument
+def images_data(request, conn=None, **kwargs):
+    """
+    Get the image_data of many images, e.g. to preload the neighbours of
+    the opened image, given by 'images' (comma separated ids).
 
+    Returns {'data': {image_id: image_data}}, where the data of images
+    which are not found or fail to load is an {'error': message}.
+    The images missing from the cache are loaded with one query, as are
+    their ROI counts and the fingerprints used as ETags and cache keys.
+    """
     try:
-        rv = imageMarshal(image)
-
-        # set roi count
-        rv['roi_count'] = image.getROICount()
-
-        # Add extra parameters with units data
-        # Note ['pixel_size']['x'] will have size in MICROMETER
-        px = image.getPrimaryPixels().getPhysicalSizeX()
-        if (px is not None and 'pixel_size' in rv):
-            size = image.getPixelSizeX(True)
-            value = format_pixel_size_with_units(size)
-            rv['pixel_size']['unit_x'] = value[0]
-            rv['pixel_size']['symbol_x'] = value[1]
-            # id e.g. 'MICROMETER' is used for export to OMERO.figure
-            rv['pixel_size']['unit_id_x'] = value[2]
-        py = image.getPrimaryPixels().getPhysicalSizeY()
-        if (py is not None and 'pixel_size' in rv):
-            size = image.getPixelSizeY(True)
-            value = format_pixel_size_with_units(size)
-            rv['pixel_size']['unit_y'] = value[0]
-            rv['pixel_size']['symbol_y'] = value[1]
-            rv['pixel_size']['unit_id_y'] = value[2]
-        pz = image.getPrimaryPixels().getPhysicalSizeZ()
-        if (pz is not None and 'pixel_size' in rv):
-            size = image.getPixelSizeZ(True)
-            value = format_pixel_size_with_units(size)
-            rv['pixel_size']['unit_z'] = value[0]
-            rv['pixel_size']['symbol_z'] = value[1]
-            rv['pixel_size']['unit_id_z'] = value[2]
-
-        delta_t_unit_symbol = None
-        rv['delta_t_unit_symbol'] = delta_t_unit_symbol
-        df = "%Y-%m-%d %H:%M:%S"
-        rv['import_date'] = image.creationEventDate().strftime(df)
-        if image.getAcquisitionDate() is not None:
-            rv['acquisition_date'] = image.getAcquisitionDate().strftime(df)
-
-        # add available families
-        rv['families'] = []
-        families = image.getFamilies().values()
-        for fam in families:
-            rv['families'].append(fam.getValue())
+        image_ids = list(OrderedDict.fromkeys(
+            int(i) for i in request.GET.get("images", "").split(',') if i))
+    except ValueError:
+        return JsonResponse({"error": "Image ids must be integers"})
+    if len(image_ids) == 0:
+        return JsonResponse({"error": "No images given"})
+    if len(image_ids) > MAX_IMAGE_DATA_BATCH:
+        return JsonResponse({"error": "At most %s images can be loaded at "
+                             "once" % MAX_IMAGE_DATA_BATCH})
+
+    etags = get_image_data_etags(conn, image_ids)
+    keys = dict((image_id, 'omero_iviewer:image_data:' + etag.strip('"'))
+                for image_id, etag in etags.items())
+    cached = cache.get_many(list(keys.values()))
+    data = {}
+    to_load = []
+    for image_id in image_ids:
+        if image_id not in etags:
+            data[image_id] = {"error": "Image not found"}
+        elif keys[image_id] in cached:
+            data[image_id] = cached[keys[image_id]]
+        else:
+            to_load.append(image_id)
+
+    if len(to_load) > 0:
+        roi_counts = get_roi_counts(conn, to_load)
+        to_cache = {}
+        for image in conn.getObjects("Image", to_load):
+            image_id = image.getId()
+            try:
+                rv = marshal_image_data(conn, image, roi_counts[image_id])
+                to_cache[keys[image_id]] = rv
+            except Exception:
+                rv = {'error': traceback.format_exc()}
+            data[image_id] = rv
+        cache.set_many(to_cache, IMAGE_DATA_CACHE_TIMEOUT)
+        for image_id in to_load:
+            if image_id not in data:
+                data[image_id] = {"error": "Image not found"}
+
+    rsp = JsonResponse({'data': data})
+    etag = hashlib.sha1(':'.join(
+        etags.get(i, '') for i in image_ids).encode('utf-8')).hexdigest()
+    rsp['ETag'] = '"%s"' % etag
+    rsp['Cache-Control'] = 'private, no-cache'
+    return rsp
+
+
+def marshal_image_data(conn, image, roi_count=None):
+    """Returns the image_data of an image, with its ROI count if given."""
+    rv = imageMarshal(image)
+
+    # set roi count
+    if roi_count is None:
+        roi_count = get_roi_count(conn, image.getId())
+    rv['roi_count'] = roi_count
+
+    # Add extra parameters with units data
+    # Note ['pixel_size']['x'] will have size in MICROMETER
+    px = image.getPrimaryPixels().getPhysicalSizeX()
+    if (px is not None and 'pixel_size' in rv):
+        size = image.getPixelSizeX(True)
+        value = format_pixel_size_with_units(size)
+        rv['pixel_size']['unit_x'] = value[0]
+        rv['pixel_size']['symbol_x'] = value[1]
+        # id e.g. 'MICROMETER' is used for export to OMERO.figure
+        rv['pixel_size']['unit_id_x'] = value[2]
+    py = image.getPrimaryPixels().getPhysicalSizeY()
+    if (py is not None and 'pixel_size' in rv):
+        size = image.getPixelSizeY(True)
+        value = format_pixel_size_with_units(size)
+        rv['pixel_size']['unit_y'] = value[0]
+        rv['pixel_size']['symbol_y'] = value[1]
+        rv['pixel_size']['unit_id_y'] = value[2]
+    pz = image.getPrimaryPixels().getPhysicalSizeZ()
+    if (pz is not None and 'pixel_size' in rv):
+        size = image.getPixelSizeZ(True)
+        value = format_pixel_size_with_units(size)
+        rv['pixel_size']['unit_z'] = value[0]
+        rv['pixel_size']['symbol_z'] = value[1]
+        rv['pixel_size']['unit_id_z'] = value[2]
+
+    delta_t_unit_symbol = None
+    rv['delta_t_unit_symbol'] = delta_t_unit_symbol
+    df = "%Y-%m-%d %H:%M:%S"
+    rv['import_date'] = image.creationEventDate().strftime(df)
+    if image.getAcquisitionDate() is not None:
+        rv['acquisition_date'] = image.getAcquisitionDate().strftime(df)
+
+    # add available families
+    rv['families'] = list(
+        get_server_constant(conn, 'families', load_families))
+    return rv
 
-        return JsonResponse(rv)
-    except Exception:
-        return JsonResponse({'error': traceback.format_exc()})
+
+def get_image_data_etags(conn, image_ids):
+    """
+    Returns a dict of the ETags of the image_data of images by id, which
+    leaves out the images that are not found. They are computed from the
+    last update events of the images, their pixels, channels, logical
+    channels and all their rendering settings as well as their number of
+    ROIs, loaded with one query each.
+    """
+    params = omero.sys.ParametersI()
+    params.addIds(image_ids)
+    rows = conn.getQueryService().projection("""
+        select image.id, image.details.updateEvent.id,
+               pixels.details.updateEvent.id,
+               rdef.id, rdef.details.updateEvent.id
+        from Image image join image.pixels pixels
+        left outer join pixels.settings rdef
+        where image.id in (:ids) order by image.id, rdef.id
+    """, params, conn.SERVICE_OPTS)
+    events = OrderedDict()
+    for row in rows:
+        row = unwrap(row)
+        events.setdefault(row[0], []).extend(row[1:])
+    if len(events) == 0:
+        return {}
+    # e.g. renaming a channel only updates its logical channel
+    rows = conn.getQueryService().projection("""
+        select image.id, max(channel.details.updateEvent.id),
+               max(lc.details.updateEvent.id)
+        from Image image join image.pixels pixels
+        join pixels.channels channel join channel.logicalChannel lc
+        where image.id in (:ids) group by image.id
+    """, params, conn.SERVICE_OPTS)
+    for row in rows:
+        row = unwrap(row)
+        events[row[0]].extend(row[1:])
+    roi_counts = get_roi_counts(conn, list(events.keys()))
+    ctx = conn.getEventContext()
+    etags = {}
+    for image_id, values in events.items():
+        parts = [__version__, image_id, ctx.groupId, ctx.userId,
+                 conn.SERVICE_OPTS.getOmeroGroup(), roi_counts[image_id]]
+        parts.extend(values)
+        digest = hashlib.sha1(
+            ':'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+        etags[image_id] = '"%s"' % digest
+    return etags
+
+
+def etag_matches(request, etag):
+    """Returns True if the If-None-Match header of request matches etag."""
+    header = request.META.get('HTTP_IF_NONE_MATCH', None)
+    if header is None:
+        return False
+    etags = [e.strip() for e in header.split(',')]
+    return etag in etags or '*' in etags
+
+
+def get_roi_counts(conn, image_ids):
+    """
+    Returns a dict of the number of ROIs of images by id, cached per image.
+    The counts missing from the cache are loaded with one query.
+    """
+    keys = rois_cache_keys(conn, image_ids, 'roi_count')
+    cached = cache.get_many(list(keys.values()))
+    counts = {}
+    to_load = []
+    for image_id in image_ids:
+        if keys[image_id] in cached:
+            counts[image_id] = cached[keys[image_id]]
+        else:
+            to_load.append(image_id)
+    if len(to_load) > 0:
+        params = omero.sys.ParametersI()
+        params.addIds(to_load)
+        rows = conn.getQueryService().projection("""
+            select roi.image.id, count(roi.id) from Roi roi
+            where roi.image.id in (:ids) group by roi.image.id
+        """, params, conn.SERVICE_OPTS)
+        loaded = dict((row[0].val, row[1].val) for row in rows)
+        for image_id in to_load:
+            counts[image_id] = loaded.get(image_id, 0)
+        cache.set_many(dict((keys[image_id], counts[image_id])
+                            for image_id in to_load), ROI_CACHE_TIMEOUT)
+    return counts
+
+
+def get_roi_count(conn, image_id):
+    """Returns the number of ROIs of the image, cached per image."""
+    return get_roi_counts(conn, [image_id])[image_id]
+
+
+def load_index_params(conn):
+    """
+    Returns the params of the index page which are the same for all
+    requests to the server of conn.
+    """
+    params = {}
+    # we add the (possibly prefixed) uris
+    params['WEBGATEWAY'] = reverse('webgateway')
+    params['WEBCLIENT'] = reverse('webindex')
+    try:
+        params['OMERO_FIGURE'] = reverse('figure_index')
+    except NoReverseMatch:
+        # omero-figure not installed
+        pass
+    params['WEB_API_BASE'] = reverse(
+        'api_base', kwargs={'api_version': WEB_API_VERSION})
+    if settings.FORCE_SCRIPT_NAME is not None:
+        params['URI_PREFIX'] = settings.FORCE_SCRIPT_NAME
+    params['ROI_PAGE_SIZE'] = ROI_PAGE_SIZE
+    params['MAX_PROJECTION_BYTES'] = get_server_constant(
+        conn, 'max_projection_bytes', load_max_projection_bytes)
+    params['MAX_ACTIVE_CHANNELS'] = MAX_ACTIVE_CHANNELS
+    params['NODEDESCRIPTORS'] = get_server_constant(
+        conn, 'nodedescriptors', load_nodedescriptors)
+    params['ROI_COLOR_PALETTE'] = ROI_COLOR_PALETTE
+    params['SHOW_PALETTE_ONLY'] = SHOW_PALETTE_ONLY
+    params['ENABLE_MIRROR'] = ENABLE_MIRROR
+    params['ASYNC_PROJECTIONS'] = ASYNC_PROJECTIONS
+    return params
+
+
+def get_server_constant(conn, name, load):
+    """
+    Returns a value which is the same for all users of the server of conn,
+    e.g. an enumeration, from the process cache. load(conn) is called to
+    get it from the server if it is not cached or has expired.
+    """
+    return SERVER_CACHE.get(
+        (conn.host, conn.port, name), lambda: load(conn))
+
+
+def load_max_projection_bytes(conn):
+    """
+    Returns the maximum bytes allowed for projections: the lower of the
+    server setting and MAX_PROJECTION_BYTES.
+    """
+    max_bytes = None
+    try:
+        max_bytes = conn.getConfigService().getConfigValue(
+            'omero.pixeldata.max_projection_bytes')
+        # check if MAX_PROJECTION_BYTES should override server setting
+        if max_bytes is None or len(max_bytes) == 0 or (
+                MAX_PROJECTION_BYTES > 0 and
+                MAX_PROJECTION_BYTES < int(max_bytes)):
+            max_bytes = MAX_PROJECTION_BYTES
+        else:
+            max_bytes = int(max_bytes)
+    except omero.SecurityViolation:
+        # config setting not supported in OMERO before 5.6.1
+        if MAX_PROJECTION_BYTES > 0:
+            max_bytes = MAX_PROJECTION_BYTES
+    return max_bytes
+
+
+def load_nodedescriptors(conn):
+    try:
+        return conn.getConfigService().getConfigValue(
+            "omero.server.nodedescriptors")
+    except omero.SecurityViolation:
+        # nodedescriptors not supported in OMERO before 5.6.6 (Dec 2022)
+        return None
+
+
+def load_families(conn):
+    return [f.getValue() for f in conn.getEnumerationEntries('Family')]
+
+
+def load_pixels_types(conn):
+    return dict((t.getId(), t.getValue())
+                for t in conn.getEnumerationEntries('PixelsType'))
+
+
+def get_pixels_type(conn, image):
+    """Returns the pixels type of an image, e.g. 'uint16'."""
+    pixels_type = image.getPrimaryPixels()._obj.getPixelsType()
+    if pixels_type.isLoaded():
+        return pixels_type.getValue().val
+    return get_server_constant(
+        conn, 'pixels_types', load_pixels_types)[pixels_type.getId().val]
 
 
 @login_required()
-def delta_t_data(request, image_id, conn=None, **kwargs):
+@instrument
+def histograms(request, image_id, conn=None, **kwargs):
+    """
+    Get the histograms of several channels ('c', comma separated indices)
+    of the planes 'z' to 'z_end' and 't' to 't_end' (both 0 by default),
+    with 'bins' bins (256 by default).
+
+    Histograms are cached per pixels id, plane, channel and bins for all
+    users. With prefetch=true the missing histograms are computed in the
+    background and only their number is returned, e.g. to have the next
+    planes ready during movie playback.
+    """
+    params = omero.sys.ParametersI()
+    params.addId(image_id)
+    rows = conn.getQueryService().projection(
+        "select pixels.id, pixels.sizeZ, pixels.sizeT, pixels.sizeC "
+        "from Pixels pixels where pixels.image.id = :id",
+        params, conn.SERVICE_OPTS)
+    if len(rows) == 0:
+        return JsonResponse({"error": "Image not found"}, status=404)
+    pixels_id, size_z, size_t, size_c = unwrap(rows[0])
 
-    image = conn.getObject("Image", image_id)
+    try:
+        channels = [int(c) for c in request.GET.get("c", "").split(',')
+                    if c]
+        bins = int(request.GET.get("bins", 256))
+        ranges = []
+        for dim, size in (('z', size_z), ('t', size_t)):
+            start = int(request.GET.get(dim, 0))
+            end = int(request.GET.get(dim + '_end', start))
+            if not 0 <= start <= end < size:
+                return JsonResponse(
+                    {"error": "%s is out of bounds" % dim.upper()})
+            ranges.append(range(start, end + 1))
+    except ValueError:
+        return JsonResponse(
+            {"error": "Channels, planes and bins must be integers"})
+    if len(channels) == 0 or any(not 0 <= c < size_c for c in channels):
+        return JsonResponse({"error": "Please supply a valid list of "
+                             "channels"})
+    if bins <= 0:
+        return JsonResponse({"error": "bins must be positive"})
+    planes = [(z, t) for t in ranges[1] for z in ranges[0]]
+    if len(planes) * len(channels) > MAX_HISTOGRAMS:
+        return JsonResponse({"error": "Too many histograms requested, "
+                             "max: %s" % MAX_HISTOGRAMS})
+
+    keys = OrderedDict(
+        ((z, t, c), histogram_cache_key(pixels_id, z, t, c, bins))
+        for z, t in planes for c in channels)
+    cached = cache.get_many(list(keys.values()))
+    missing = [k for k, key in keys.items() if key not in cached]
+
+    if request.GET.get("prefetch", None) == 'true':
+        rsp = {'prefetching': len(missing)}
+        if len(missing) > 0:
+            try:
+                HISTOGRAM_JOBS.submit(
+                    conn, run_histograms_job, pixels_id, missing, bins)
+            except TooManyJobs as e:
+                rsp = {'prefetching': 0, 'error': str(e)}
+        return JsonResponse(rsp)
+
+    try:
+        computed = compute_histograms(conn, pixels_id, missing, bins)
+    except Exception as e:
+        return JsonResponse({"error": repr(e)})
+    data = []
+    for (z, t, c), key in keys.items():
+        histogram = cached[key] if key in cached else computed[(z, t, c)]
+        data.append({'theZ': z, 'theT': t, 'theC': c, 'data': histogram})
+    return JsonResponse({'bins': bins, 'data': data})
+
+
+def histogram_cache_key(pixels_id, z, t, c, bins):
+    return 'omero_iviewer:histogram:%s:%s:%s:%s:%s' % (
+        pixels_id, z, t, c, bins)
 
+
+def compute_histograms(conn, pixels_id, planes_channels, bins,
+                       progress=None):
+    """
+    Computes the histograms of a list of (z, t, c), with one call per plane,
+    and caches them. Returns a dict of the histograms by (z, t, c).
+    """
+    by_plane = OrderedDict()
+    for z, t, c in planes_channels:
+        by_plane.setdefault((z, t), []).append(c)
     rv = {}
+    if len(by_plane) == 0:
+        return rv
+    store = create_raw_pixels_store(conn, pixels_id)
+    try:
+        for i, ((z, t), channels) in enumerate(by_plane.items()):
+            histograms = get_histograms(
+                store, z, t, channels, bins, conn.SERVICE_OPTS)
+            cache.set_many(dict(
+                (histogram_cache_key(pixels_id, z, t, c, bins), h)
+                for c, h in histograms.items()), HISTOGRAM_CACHE_TIMEOUT)
+            for c, h in histograms.items():
+                rv[(z, t, c)] = h
+            if progress is not None:
+                progress(float(i + 1) / len(by_plane))
+    finally:
+        store.close()
+    return rv
 
-    size_t = image.getSizeT()
-    time_list = []
-    delta_t_unit_symbol = None
-    if size_t > 1:
-        params = omero.sys.ParametersI()
-        params.addLong('pid', image.getPixelsId())
-        query = "from PlaneInfo as Info where"\
-            " Info.theZ=0 and Info.theC=0 and pixels.id=:pid"
-        info_list = conn.getQueryService().findAllByQuery(
-            query, params, conn.SERVICE_OPTS)
 
-        if len(info_list) < size_t:
-            # C & Z dimensions are not always filled
-            # Remove restriction on c0 z0 to catch all timestamps
-            params = omero.sys.ParametersI()
-            params.addLong('pid', image.getPixelsId())
-            query = """
-                from PlaneInfo Info where Info.id in (
-                    select min(subInfo.id)
-                    from PlaneInfo subInfo
-                    where subInfo.pixels.id=:pid
-                    group by subInfo.theT
-                )
-            """
-            info_list = conn.getQueryService().findAllByQuery(
-                query, params, conn.SERVICE_OPTS)
-
-        timemap = {}
-        for info in info_list:
-            t_index = info.theT.getValue()
-            if info.deltaT is not None:
-                secs = get_converted_value(info.deltaT, "SECOND")
-                timemap[t_index] = secs
-                if delta_t_unit_symbol is None:
-                    # Get unit symbol for first info only
-                    delta_t_unit_symbol = info.deltaT.getSymbol()
-        for t in range(size_t):
-            if t in timemap:
-                time_list.append(timemap[t])
-            else:
-                # Hopefully never gets here, but
-                # time_list length MUST match image.sizeT
-                time_list.append(0)
+def run_histograms_job(conn, job, pixels_id, planes_channels, bins):
+    """Computes and caches histograms in a job."""
+    compute_histograms(conn, pixels_id, planes_channels, bins,
+                       job.set_progress)
+
+
+@login_required()
+@instrument
+def delta_t_data(request, image_id, conn=None, **kwargs):
+    """
+    Get the deltaT of each timepoint of an image, in seconds.
 
-    rv['delta_t'] = time_list
+    With encoding=delta the timeline is given as the deltaT of the first
+    timepoint ('start') and the intervals between the timepoints
+    ('deltas'), which is more compact for long regular series.
+    """
+    params = omero.sys.ParametersI()
+    params.addId(image_id)
+    rows = conn.getQueryService().projection(
+        "select pixels.id, pixels.sizeT from Pixels pixels "
+        "where pixels.image.id = :id", params, conn.SERVICE_OPTS)
+    if len(rows) == 0:
+        return JsonResponse({"error": "Image not found"}, status=404)
+    pixels_id, size_t = unwrap(rows[0])
+
+    # the timeline is the same for all users who can see the image
+    key = 'omero_iviewer:delta_t:%s' % pixels_id
+    cached = cache.get(key)
+    if cached is None:
+        cached = get_delta_t(conn, pixels_id, size_t)
+        cache.set(key, cached, IMAGE_DATA_CACHE_TIMEOUT)
+    time_list, delta_t_unit_symbol = cached
+
+    rv = {}
+    if request.GET.get("encoding", None) == 'delta':
+        rv['encoding'] = 'delta'
+        rv['start'] = float(time_list[0]) if len(time_list) > 0 else None
+        rv['deltas'] = numpy.diff(time_list).tolist()
+    else:
+        rv['delta_t'] = time_list.tolist()
     rv['delta_t_unit_symbol'] = delta_t_unit_symbol
     rv['image_id'] = image_id
     return JsonResponse(rv)
 
 
+def get_delta_t(conn, pixels_id, size_t):
+    """
+    Returns the deltaT in seconds of each timepoint as an array of size_t
+    (0 if unknown), and the symbol of the original unit.
+
+    The deltaT of a timepoint is taken from its plane at Z=0 and C=0, or
+    if there is none, from the first of its planes. Both are loaded with
+    one query, which only returns the deltaT values and units.
+    """
+    if size_t <= 1:
+        return numpy.zeros(0), None
+    time_list = numpy.zeros(size_t)
+    params = omero.sys.ParametersI()
+    params.addId(pixels_id)
+    query = """
+        select info.theT, info.theZ, info.theC,
+               info.deltaT.value, info.deltaT.unit
+        from PlaneInfo info where info.pixels.id = :id
+        and ((info.theZ = 0 and info.theC = 0) or info.id in (
+            select min(sub.id) from PlaneInfo sub
+            where sub.pixels.id = :id group by sub.theT))
+    """
+    rows = [unwrap(row) for row in conn.getQueryService().projection(
+        query, params, conn.SERVICE_OPTS)]
+    rows = [row for row in rows
+            if row[3] is not None and 0 <= row[0] < size_t]
+    if len(rows) == 0:
+        return time_list, None
+
+    ts = numpy.array([row[0] for row in rows], dtype=numpy.int64)
+    first_plane = numpy.array([row[1] == 0 and row[2] == 0 for row in rows])
+    values = numpy.array([row[3] for row in rows], dtype=float)
+    units = numpy.array([str(row[4]) for row in rows])
+    symbol = None
+    # convert the values to seconds, once per unit
+    for unit in numpy.unique(units):
+        factor, unit_symbol = get_time_unit(unit)
+        values[units == unit] *= factor
+        if unit == units[numpy.argmin(ts)]:
+            # the symbol of the unit of the first timepoint
+            symbol = unit_symbol
+    # the planes at Z=0, C=0 take precedence
+    time_list[ts[~first_plane]] = values[~first_plane]
+    time_list[ts[first_plane]] = values[first_plane]
+    return time_list, symbol
+
+
+@lru_cache(maxsize=None)
+def get_time_unit(unit):
+    """
+    Returns the factor converting values in unit, e.g. 'MILLISECOND' or its
+    symbol 'ms', to seconds and the symbol of the unit.
+    """
+    for unit_enum in omero.model.enums.UnitsTime._enumerators.values():
+        time = omero.model.TimeI(1.0, unit_enum)
+        if unit in (str(unit_enum), time.getSymbol()):
+            return get_converted_value(time, "SECOND"), time.getSymbol()
+    raise ValueError("Unknown time unit: %s" % unit)
+
+
 def get_converted_value(obj, units):
     """
     Convert the length or time object to units and return value
@@ -670,15 +1566,27 @@ def format_pixel_size_with_units(value):
     length = value.getValue()
     unit = str(value.getUnit())
     if unit == "MICROMETER":
-        symbol = lengthunit(length)
-        length = lengthformat(length)
+        length, symbol = format_micrometers(length)
     else:
         symbol = value.getSymbol()
     return (length, symbol, unit)
 
 
+@lru_cache(maxsize=1024)
+def format_micrometers(length):
+    """Returns a length in micrometers in a more appropriate unit."""
+    return lengthformat(length), lengthunit(length)
+
+
 @login_required()
+@instrument
 def save_projection(request, conn=None, **kwargs):
+    """
+    Creates a new image, the projection of an image over start..end Z.
+
+    With async=true the projection is created in the background and the
+    id of the job is returned, its status is given by projection_job.
+    """
     # check for mandatory parameters
     image_id = request.GET.get("image", None)
     proj_type = request.GET.get("projection", None)
@@ -699,67 +1607,315 @@ def save_projection(request, conn=None, **kwargs):
     if img is None:
         return JsonResponse({"error": "Image not Found"}, status=404)
 
-    new_image_id = None
+    if request.GET.get("async") == "true":
+        try:
+            job = PROJECTION_JOBS.submit(
+                conn, run_projection_job, int(image_id), proj_type,
+                start, end, dataset_id)
+        except TooManyJobs as e:
+            return JsonResponse({"error": str(e)}, status=429)
+        return JsonResponse(job.to_dict())
+
     try:
-        # no getter defined in gateway...
-        proj_svc = conn._proxies['projection']
+        new_image_id = project_image(
+            conn, img, proj_type, start, end, dataset_id)
+    except Exception as save_projection_exception:
+        return JsonResponse({"error": repr(save_projection_exception)})
 
-        # gather params needed for projection call
-        pixels_id = img.getPixelsId()
-        pixels = img.getPrimaryPixels()
-        pixels_type = pixels.getPixelsType()._obj
+    return JsonResponse({"id": new_image_id})
 
-        # assemble new file name
-        filename, extension = splitext(img.getName())
-        file_name = filename + '_proj' + extension
 
-        # delegate to projectPixels
-        new_image_id = proj_svc.projectPixels(
-            pixels_id, pixels_type, proj, 0, img.getSizeT()-1,
-            range(img.getSizeC()), 1, int(start), int(end), file_name)
+@login_required()
+@instrument
+def projection_job(request, job_id, conn=None, **kwargs):
+    """
+    Get the status of a projection job started by save_projection: its
+    status ('queued', 'running', 'done' or 'failed'), progress (0 to 1)
+    and, once done, the id of the new image.
+    """
+    job = PROJECTION_JOBS.get(job_id, conn.getEventContext().userId)
+    if job is None:
+        return JsonResponse({"error": "Job not found"}, status=404)
+    rsp = job.to_dict()
+    if job.status == job.DONE:
+        rsp['id'] = job.result
+    return JsonResponse(rsp)
 
-        # apply present rendering settings
-        try:
-            rnd = conn.getRenderingSettingsService()
-            rnd.applySettingsToImage(pixels_id, new_image_id)
-        except Exception:
-            pass
-
-        # set image decription
-        details = []
-        details.append("Image's name:" + img.getName())
-        details.append("Image:" + image_id)
-        details.append("Projection Type: " + proj_type)
+
+def run_projection_job(conn, job, image_id, proj_type, start, end,
+                       dataset_id):
+    """Creates a projection in a job, returns the new image id."""
+    img = conn.getObject("Image", image_id, opts=conn.SERVICE_OPTS)
+    if img is None:
+        raise Exception("Image not Found")
+    return project_image(conn, img, proj_type, start, end, dataset_id,
+                         job.set_progress)
+
+
+def project_image(conn, img, proj_type, start, end, dataset_id=None,
+                  progress=None):
+    """
+    Creates the projection of an image with its rendering settings, links
+    it to the dataset (if given) and returns the new image id.
+
+    progress is called with the fraction of the work done.
+    """
+    if progress is None:
+        progress = (lambda fraction: None)
+    source = {
+        'id': img.getId(),
+        'name': img.getName(),
+        'pixels_id': img.getPixelsId(),
+        'size_z': img.getSizeZ(),
+        'size_t': img.getSizeT(),
+        'size_c': img.getSizeC(),
+    }
+    progress(0.1)
+    new_image_id = project_pixels(
+        conn, source, proj_type, int(start), int(end))
+    progress(0.8)
+    save_projected_images(conn, [(new_image_id, get_projection_description(
+        source, proj_type, int(start), int(end)))], dataset_id)
+    return new_image_id
+
+
+def get_projection_sources(conn, image_ids):
+    """
+    Returns the images to project, as dicts of the image and pixels data
+    needed, by image id. All are loaded with one query.
+    """
+    params = omero.sys.ParametersI()
+    params.addIds(image_ids)
+    result = conn.getQueryService().projection("""
+        select image.id, image.name, pixels.id,
+               pixels.sizeZ, pixels.sizeT, pixels.sizeC
+        from Image image join image.pixels pixels
+        where image.id in (:ids)
+    """, params, conn.SERVICE_OPTS)
+    sources = {}
+    for row in result:
+        image_id, name, pixels_id, size_z, size_t, size_c = unwrap(row)
+        sources[image_id] = {
+            'id': image_id, 'name': name, 'pixels_id': pixels_id,
+            'size_z': size_z, 'size_t': size_t, 'size_c': size_c}
+    return sources
+
+
+def project_pixels(conn, source, proj_type, z_start, z_end, t_start=None,
+                   t_end=None, channels=None):
+    """
+    Creates the projection of an image, over all T and channels by default,
+    applies the rendering settings of the image to it and returns the new
+    image id.
+    """
+    if t_start is None:
+        t_start, t_end = 0, source['size_t'] - 1
+    if channels is None:
+        channels = range(source['size_c'])
+
+    # assemble new file name
+    filename, extension = splitext(source['name'])
+    file_name = filename + '_proj' + extension
+
+    # no getter defined in gateway...
+    proj_svc = conn._proxies['projection']
+    # the pixels type of the image is kept
+    new_image_id = proj_svc.projectPixels(
+        source['pixels_id'], None, PROJECTIONS[proj_type], t_start, t_end,
+        list(channels), 1, z_start, z_end, file_name)
+
+    # apply present rendering settings
+    try:
+        rnd = conn.getRenderingSettingsService()
+        rnd.applySettingsToImage(source['pixels_id'], new_image_id)
+    except Exception:
+        pass
+    return new_image_id
+
+
+def get_projection_description(source, proj_type, z_start, z_end,
+                               t_start=None, t_end=None, channels=None):
+    """Returns the description of a projected image."""
+    if t_start is None:
+        t_start, t_end = 0, source['size_t'] - 1
+    details = []
+    details.append("Image's name:" + source['name'])
+    details.append("Image:" + str(source['id']))
+    details.append("Projection Type: " + proj_type)
+    details.append(
+        "z-sections: " + str(z_start + 1) + "-" + str(z_end + 1))
+    if t_start == t_end:
+        details.append("timepoint: " + str(t_start + 1))
+    else:
         details.append(
-            "z-sections: " + str(int(start)+1) + "-" + str(int(end)+1))
-        size_t = img.getSizeT()
-        if size_t == 1:
-            details.append("timepoint: " + str(size_t))
-        else:
-            details.append("timepoints: 1-" + str(size_t))
-        description = "\n".join(details)
+            "timepoints: " + str(t_start + 1) + "-" + str(t_end + 1))
+    if channels is not None:
+        details.append(
+            "channels: " + ",".join(str(c + 1) for c in channels))
+    return "\n".join(details)
 
-        new_img = conn.getObject(
-            "Image", new_image_id, opts=conn.SERVICE_OPTS)
-        new_img.setDescription(description)
-        new_img.save()
 
-        # if we have a dataset id => we try to link to it
-        if dataset_id is not None:
-            upd_svc = conn.getUpdateService()
-            conn.SERVICE_OPTS.setOmeroGroup(
-                conn.getGroupFromContext().getId())
+def save_projected_images(conn, projections, dataset_id=None):
+    """
+    Sets the descriptions of projected images and links them to the
+    dataset (if given), saving all of them with one call.
+
+    @param projections  list of (new image id, description)
+    """
+    if len(projections) == 0:
+        return
+    descriptions = dict(projections)
+    params = omero.sys.ParametersI()
+    params.addIds(list(descriptions.keys()))
+    images = conn.getQueryService().findAllByQuery(
+        "select image from Image image where image.id in (:ids)",
+        params, conn.SERVICE_OPTS)
+    to_save = []
+    for image in images:
+        image.description = rstring(descriptions[image.id.val])
+        to_save.append(image)
+    # if we have a dataset id => we try to link to it
+    if dataset_id is not None:
+        conn.SERVICE_OPTS.setOmeroGroup(
+            conn.getGroupFromContext().getId())
+        for image in images:
             link = omero.model.DatasetImageLinkI()
             link.parent = omero.model.DatasetI(int(dataset_id), False)
-            link.child = omero.model.ImageI(new_image_id, False)
-            upd_svc.saveObject(link, conn.SERVICE_OPTS)
-    except Exception as save_projection_exception:
-        return JsonResponse({"error": repr(save_projection_exception)})
+            link.child = omero.model.ImageI(image.id.val, False)
+            to_save.append(link)
+    conn.getUpdateService().saveArray(to_save, conn.SERVICE_OPTS)
 
-    return JsonResponse({"id": new_image_id})
+
+@login_required()
+@instrument
+def save_projections(request, conn=None, **kwargs):
+    """
+    Creates projections of many images in a background job.
+
+    The images are given by 'images' (comma separated ids), 'dataset' or
+    'well'. Optional 'start' and 'end' select the Z range, 't_start' and
+    't_end' the T range and 'channels' (comma separated indices) the
+    channels, all of them by default. The projections are linked to
+    'link_dataset' if given, or else to the dataset of the images. The
+    projections of the images of a well are not added to the plate, they
+    are only linked to 'link_dataset' if given.
+
+    Returns the job, whose result (see projection_job) gives the new image
+    id or the error for each image.
+    """
+    proj_type = request.GET.get("projection", None)
+    if PROJECTIONS.get(proj_type, -1) == -1:
+        return JsonResponse({"error": "Projection type not listed"})
+
+    try:
+        opts = {}
+        for key in ('start', 'end', 't_start', 't_end'):
+            value = request.GET.get(key, None)
+            opts[key] = None if value is None else int(value)
+        channels = request.GET.get("channels", None)
+        if channels is not None:
+            channels = [int(c) for c in channels.split(',')]
+        opts['channels'] = channels
+
+        dataset_id = request.GET.get("dataset", None)
+        well_id = request.GET.get("well", None)
+        link_dataset = request.GET.get("link_dataset", dataset_id)
+        if link_dataset is not None:
+            link_dataset = int(link_dataset)
+        query = None
+        params = omero.sys.ParametersI()
+        if dataset_id is not None:
+            params.addId(int(dataset_id))
+            query = """select link.child.id from DatasetImageLink link
+                       where link.parent.id = :id"""
+        elif well_id is not None:
+            params.addId(int(well_id))
+            query = """select ws.image.id from WellSample ws
+                       where ws.well.id = :id"""
+        if query is not None:
+            image_ids = [row[0].val for row in conn.getQueryService(
+                ).projection(query, params, conn.SERVICE_OPTS)]
+        else:
+            image_ids = [int(i) for i in
+                         request.GET.get("images", "").split(',') if i]
+    except ValueError:
+        return JsonResponse({"error": "Ids and indices must be integers"})
+
+    if len(image_ids) == 0:
+        return JsonResponse({"error": "No images to project"})
+    if len(image_ids) > MAX_PROJECTION_BATCH:
+        return JsonResponse({"error": "At most %s images can be projected "
+                             "at once" % MAX_PROJECTION_BATCH})
+
+    try:
+        job = PROJECTION_JOBS.submit(
+            conn, run_batch_projection_job, image_ids, proj_type, opts,
+            link_dataset)
+    except TooManyJobs as e:
+        return JsonResponse({"error": str(e)}, status=429)
+    return JsonResponse(job.to_dict())
+
+
+def run_batch_projection_job(conn, job, image_ids, proj_type, opts,
+                             dataset_id):
+    """
+    Creates the projections of images one after the other, then saves
+    their descriptions and dataset links at once, or else one by one if
+    that fails. The job uses one of the PROJECTION_WORKERS threads and the
+    conn of the request, like any other.
+
+    Returns {image id: {'id': new image id}} with {'error': message} for
+    the images that could not be projected or saved.
+    """
+    sources = get_projection_sources(conn, image_ids)
+    results = {}
+    projected = []
+    projections = []
+
+    def project(source):
+        z_start = 0 if opts['start'] is None else opts['start']
+        z_end = source['size_z'] - 1 if opts['end'] is None else opts['end']
+        t_start = 0 if opts['t_start'] is None else opts['t_start']
+        t_end = source['size_t'] - 1 if opts['t_end'] is None \
+            else opts['t_end']
+        channels = opts['channels']
+        if not (0 <= z_start <= z_end < source['size_z']) or \
+                not (0 <= t_start <= t_end < source['size_t']) or \
+                any(not 0 <= c < source['size_c'] for c in channels or []):
+            raise ValueError("Z, T or channels out of range")
+        new_image_id = project_pixels(
+            conn, source, proj_type, z_start, z_end, t_start, t_end,
+            channels)
+        return new_image_id, get_projection_description(
+            source, proj_type, z_start, z_end, t_start, t_end, channels)
+
+    for done, image_id in enumerate(image_ids):
+        if image_id not in sources:
+            results[image_id] = {'error': "Image not Found"}
+            continue
+        try:
+            projection = project(sources[image_id])
+            projected.append(image_id)
+            projections.append(projection)
+            results[image_id] = {'id': projection[0]}
+        except Exception as e:
+            results[image_id] = {'error': repr(e)}
+        job.set_progress(0.9 * (done + 1) / len(image_ids))
+
+    try:
+        save_projected_images(conn, projections, dataset_id)
+    except Exception:
+        # nothing was saved, keep the projections which can be saved
+        for image_id, projection in zip(projected, projections):
+            try:
+                save_projected_images(conn, [projection], dataset_id)
+            except Exception as e:
+                results[image_id]['error'] = repr(e)
+    return results
 
 
 @login_required()
+@instrument
 def well_images(request, conn=None, **kwargs):
     # check for mandatory parameter id
     well_id = request.GET.get("id", None)
@@ -805,6 +1961,90 @@ def well_images(request, conn=None, **kwargs):
 
 
 @login_required()
+@instrument
+def plate_images(request, conn=None, **kwargs):
+    """
+    Get the images of the wells of a plate (?plate=1), or of one well
+    (?well=1), ordered by row, column and field.
+
+    Returns {data: [{'@id', 'Name', well, row, column, field}],
+             meta: {totalCount, next}}
+    The totalCount is only given for the first page, the next page is
+    requested with ?after=<next>. thumbnails=<size> adds the thumbnails
+    of the images as base64 data urls.
+    """
+    plate_id = request.GET.get("plate")
+    well_id = request.GET.get("well")
+    after = request.GET.get("after")
+    try:
+        obj_id = int(plate_id if plate_id is not None else well_id)
+        limit = min(MAX_PLATE_IMAGES,
+                    int(request.GET.get("limit", MAX_PLATE_IMAGES)))
+        thumbnail_size = int(request.GET.get("thumbnails", 0))
+        if after is not None:
+            after = [int(a) for a in after.split(',')]
+            if len(after) != 3:
+                raise ValueError("Invalid cursor")
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "Invalid Parameter types"})
+    if limit < 1 or not 0 <= thumbnail_size <= MAX_THUMBNAIL_SIZE:
+        return JsonResponse({"error": "Parameter out of range"})
+
+    where = "well.plate.id = :id" if plate_id is not None else \
+        "well.id = :id"
+    params = ParametersI()
+    params.addId(obj_id)
+    query_service = conn.getQueryService()
+    meta = {"next": None}
+    if after is None:
+        count = query_service.projection(
+            "select count(ws.id) from Well well join well.wellSamples ws "
+            "where " + where, params, conn.SERVICE_OPTS)
+        meta["totalCount"] = count[0][0].val
+    else:
+        # keyset pagination: the images after the last one of previous page
+        where += """ and (well.row > %s or (well.row = %s and
+            (well.column > %s or (well.column = %s and index(ws) > %s))))
+        """ % (after[0], after[0], after[1], after[1], after[2])
+
+    # one more than the limit to know if there is a next page
+    params.page(0, limit + 1)
+    rows = query_service.projection("""
+        select well.id, well.row, well.column, index(ws),
+               image.id, image.name
+        from Well well join well.wellSamples ws join ws.image image
+        where %s
+        order by well.row, well.column, index(ws)
+    """ % where, params, conn.SERVICE_OPTS)
+    rows = [unwrap(row) for row in rows]
+    if len(rows) > limit:
+        rows = rows[:limit]
+        meta["next"] = "%s,%s,%s" % tuple(rows[-1][1:4])
+
+    data = []
+    for well, row, column, field, image_id, name in rows:
+        img = {"@id": image_id, "well": well, "row": row,
+               "column": column, "field": field}
+        if name is not None:
+            img["Name"] = name
+        data.append(img)
+
+    if thumbnail_size > 0:
+        image_ids = [img["@id"] for img in data]
+        thumbnails = {}
+        for start in range(0, len(image_ids), THUMBNAILS_BATCH):
+            thumbnails.update(conn.getThumbnailSet(
+                image_ids[start:start + THUMBNAILS_BATCH], thumbnail_size))
+        for img in data:
+            thumbnail = thumbnails.get(img["@id"])
+            if thumbnail is not None:
+                img["thumbnail"] = "data:image/jpeg;base64,%s" % \
+                    base64.b64encode(thumbnail).decode("utf-8")
+    return JsonResponse({"data": data, "meta": meta})
+
+
+@login_required()
+@instrument
 def get_intensity(request, conn=None, **kwargs):
     # get mandatory params
     image_id = request.GET.get("image", None)
@@ -850,11 +2090,17 @@ def get_intensity(request, conn=None, **kwargs):
         return JsonResponse(
             {"error": "Please supply a valid list of channels"})
 
-    raw_pixel_store = None
+    # optional response format: 'columnar' returns flat value arrays
+    # per channel instead of a dict entry per pixel
+    response_format = request.GET.get("format", None)
+    encoding = request.GET.get("encoding", None)
+
+    reader = None
     try:
-        raw_pixel_store = conn.createRawPixelsStore()
-        raw_pixel_store.setPixelsId(img.getPixelsId(), True, conn.SERVICE_OPTS)
-        pixels_type = img.getPrimaryPixels().getPixelsType().getValue()
+        pixels_type = get_pixels_type(conn, img)
+        dtype = get_pixels_dtype(pixels_type)
+        reader = RegionReader(conn, img.getPixelsId(), size_x, size_y,
+                              dtype, cache=INTENSITY_CACHE)
 
         # determine query extent
         x_offset = x - QUERY_DISTANCE
@@ -870,21 +2116,37 @@ def get_intensity(request, conn=None, **kwargs):
         if y_offset + height >= size_y:
             height = size_y - y_offset
         extent = [x_offset, y_offset, x_offset + width, y_offset + height]
-        conversion = '>' + str(width * height) +  \
-            pixelstypetopython.toPython(pixels_type)
+
+        # collect the pixel intensities contained in extent
+        # (extent width x height), stacked to shape (channels, rows, cols)
+        tiles = numpy.stack([
+            reader.get_region(z, chan, t, x_offset, y_offset, width, height)
+            for chan in channels])
+
+        if response_format == 'columnar':
+            results = {
+                'format': 'columnar',
+                'extent': extent,
+                'dtype': dtype.name,
+                'channels': channels,
+                'count': int(tiles.size),
+            }
+            if encoding == 'base64':
+                # little-endian buffer, channel by channel in row order
+                results['encoding'] = 'base64'
+                results['data'] = encode_array(tiles)
+            else:
+                results['values'] = tiles.reshape(len(channels), -1).tolist()
+            return JsonResponse(results)
 
         # prepare return object (setting extent)
         results = {}
         results['count'] = 0
         results['pixels'] = {}
 
-        # loop over all channels and collect the pixel intensities
-        # contained in extent with getTile (extent width x height)
-        for chan in channels:
-            point_data = raw_pixel_store.getTile(
-                z, chan, t, x_offset, y_offset, width, height,
-                conn.SERVICE_OPTS)
-            unpacked_point_data = unpack(conversion, point_data)
+        # legacy format: a dict of channel intensities per pixel
+        for index, chan in enumerate(channels):
+            unpacked_point_data = tiles[index].ravel().tolist()
             i = 0
             for row in range(extent[1], extent[3]):
                 for col in range(extent[0], extent[2]):
@@ -900,12 +2162,136 @@ def get_intensity(request, conn=None, **kwargs):
     except Exception as pixel_service_exception:
         return JsonResponse({"error": repr(pixel_service_exception)})
     finally:
-        if raw_pixel_store is not None:
-            raw_pixel_store.close()
+        if reader is not None:
+            reader.close()
+
+
+def parse_indices(values, size):
+    """
+    Returns a list of indices from an int or a list of ints,
+    raising a ValueError if any of them is not within [0, size).
+    """
+    if not isinstance(values, list):
+        values = [values]
+    indices = [int(v) for v in values]
+    if len(indices) == 0 or any(i < 0 or i >= size for i in indices):
+        raise ValueError("Indices must be within [0, %s)" % size)
+    return indices
+
+
+@login_required()
+@instrument
+def get_intensities(request, conn=None, **kwargs):
+    """
+    Get the intensities at many points, e.g. for line profiles.
+
+    Expects a POST with a json body of the form
+    {image: 1, c: [0, 1], z: 0, t: [0, 1, 2], points: [[x, y], ...]}
+    or with polyline: [[x, y], ...] and an optional step (in pixels)
+    instead of points. Points are grouped by tile so that each tile is
+    read only once. Returns the values as an array of shape
+    (t, z, c, points), or as a base64 encoded little-endian buffer if
+    encoding is 'base64'.
+    """
+    if not request.method == 'POST':
+        return JsonResponse({"error": "Use HTTP POST to send data!"})
+
+    try:
+        query = json.loads(request.body)
+    except Exception as e:
+        return JsonResponse({"error": "Failed to load json: " + repr(e)})
+
+    image_id = query.get("image", None)
+    if image_id is None or query.get("c", None) is None or \
+            (query.get("points", None) is None and
+             query.get("polyline", None) is None):
+        return JsonResponse(
+            {"error": "Mandatory params are: image, c and points/polyline"})
+
+    img = conn.getObject("Image", image_id, opts=conn.SERVICE_OPTS)
+    if img is None:
+        return JsonResponse({"error": "Image not Found"}, status=404)
+
+    size_x, size_y = img.getSizeX(), img.getSizeY()
+    try:
+        channels = parse_indices(query.get("c"), img.getSizeC())
+        planes = parse_indices(query.get("z", 0), img.getSizeZ())
+        times = parse_indices(query.get("t", 0), img.getSizeT())
+        distances = None
+        if query.get("polyline", None) is not None:
+            step = float(query.get("step", 1))
+            if step <= 0:
+                raise ValueError("The step has to be positive")
+            xs, ys, distances = sample_polyline(query.get("polyline"), step)
+        else:
+            points = numpy.asarray(query.get("points"), dtype=float)
+            xs, ys = points.reshape(-1, 2).T
+        xs = numpy.floor(xs).astype(numpy.int64)
+        ys = numpy.floor(ys).astype(numpy.int64)
+    except Exception as e:
+        return JsonResponse({"error": "Invalid parameters: " + repr(e)})
+
+    if numpy.any((xs < 0) | (xs >= size_x) | (ys < 0) | (ys >= size_y)):
+        return JsonResponse({"error": "One or more points are out of bounds"})
+    shape = (len(times), len(planes), len(channels), len(xs))
+    if numpy.prod(shape) > MAX_INTENSITY_SAMPLES:
+        return JsonResponse({"error": "Too many values requested, max: %s"
+                             % MAX_INTENSITY_SAMPLES})
+
+    reader = None
+    try:
+        pixels_type = get_pixels_type(conn, img)
+        dtype = get_pixels_dtype(pixels_type)
+        reader = RegionReader(conn, img.getPixelsId(), size_x, size_y,
+                              dtype, cache=INTENSITY_CACHE)
+        values = numpy.empty(shape, dtype=dtype)
+        for ti, t in enumerate(times):
+            for zi, z in enumerate(planes):
+                for ci, c in enumerate(channels):
+                    values[ti, zi, ci] = reader.get_points(z, c, t, xs, ys)
+
+        results = {
+            'x': xs.tolist(),
+            'y': ys.tolist(),
+            'c': channels,
+            'z': planes,
+            't': times,
+            'dtype': dtype.name,
+            'shape': list(shape),
+        }
+        if distances is not None:
+            results['distance'] = distances.tolist()
+        if query.get("encoding", None) == 'base64':
+            results['encoding'] = 'base64'
+            results['data'] = encode_array(values)
+        else:
+            results['values'] = values.tolist()
+        return JsonResponse(results)
+    except Exception as pixel_service_exception:
+        return JsonResponse({"error": repr(pixel_service_exception)})
+    finally:
+        if reader is not None:
+            reader.close()
 
 
 @login_required()
+@instrument
 def shape_stats(request, conn=None, **kwargs):
+    """
+    Get the statistics of shapes ('ids') on the channels 'cs' (all by
+    default) of the planes 'z' to 'z_end' and 't' to 't_end'. Shapes with
+    theZ or theT set are measured on their own plane.
+
+    By default the stats of each channel are listed by shape id, which is
+    only meaningful for a single plane. With format=columnar the stats of
+    all shapes, planes and channels are returned as arrays, one entry per
+    shape, (effective) plane and channel.
+
+    Stats are computed by the ROI service, or by iviewer with numpy for
+    shapes the service rejects. engine=numpy always uses the latter, which
+    also gives the 'percentiles' (comma separated, 0 to 100) if requested.
+    Stats are cached per shape, shape version, plane and channel.
+    """
     # check for mandatory parameters
     ids = request.GET.get("ids", None)
     z = request.GET.get("z", None)
@@ -915,45 +2301,236 @@ def shape_stats(request, conn=None, **kwargs):
             {"error": "Parameters ids, z and t are mandatory"})
 
     # convert input params
-    channels = []
+    channels = None
     try:
         ids = [
             int(id.split(':')[1]) if ':' in id else int(id)
             for id in ids.split(',') if id != ''
         ]
         z, t = int(z), int(t)
+        z_end = int(request.GET.get("z_end", z))
+        t_end = int(request.GET.get("t_end", t))
         # optional cs
         cs = request.GET.get("cs", None)
         if cs is not None:
-            channels = [int(c) for c in cs.split(',') if c != '']
+            channels = [int(c) for c in cs.split(',') if c != ''] or None
+        percentiles = [float(p) for p in
+                       request.GET.get("percentiles", "").split(',') if p]
     except Exception:
         return JsonResponse({"error": "Invalid Parameter types"})
+    engine = request.GET.get("engine", "service")
+    if len(percentiles) > 0:
+        engine = "numpy"
+    if engine not in ("service", "numpy"):
+        return JsonResponse({"error": "Unknown engine: %s" % engine})
+    if any(not 0 <= p <= 100 for p in percentiles):
+        return JsonResponse({"error": "Percentiles must be within 0-100"})
+    planes = [(pz, pt) for pt in range(t, t_end + 1)
+              for pz in range(z, z_end + 1)]
+    if len(planes) * len(ids) > MAX_SHAPE_STATS:
+        return JsonResponse({"error": "Too many stats requested, max: %s "
+                             "shapes x planes" % MAX_SHAPE_STATS})
 
     try:
-        # call rois service restricted stats method
-        # populating our own return objects for convenience
-        rois_service = conn.getRoiService()
-        stats = rois_service.getShapeStatsRestricted(ids, z, t, channels)
-        ret = {}
-        for stat in stats:
-            ret_stat = []
-            number_of_channels = len(stat.channelIds)
-            i = 0
-            while i < number_of_channels:
-                ret_stat_chan = {
-                    "index": stat.channelIds[i],
-                    "points": stat.pointsCount[i],
-                    "min": stat.min[i],
-                    "max": stat.max[i],
-                    "sum": stat.sum[i],
-                    "mean": stat.mean[i],
-                    "std_dev": stat.stdDev[i]
-                }
-                ret_stat.append(ret_stat_chan)
-                i += 1
-            ret[str(stat.shapeId)] = ret_stat
-        return JsonResponse(ret,)
+        stats = get_shape_stats(conn, ids, planes, channels, engine,
+                                percentiles)
     except omero.ApiUsageException as api_exception:
         return JsonResponse({"error": api_exception.message})
+    except ValueError as error:
+        return JsonResponse({"error": str(error)})
     except Exception as stats_call_exception:
         return JsonResponse({"error": repr(stats_call_exception)})
+
+    if request.GET.get("format", None) == 'columnar':
+        names = SHAPE_STATS + (['percentiles'] if percentiles else [])
+        columns = ['shape', 'theZ', 'theT', 'theC'] + names
+        rv = dict((name, []) for name in columns)
+        for (shape_id, pz, pt, c), stat in stats.items():
+            for name, value in zip(columns, (shape_id, pz, pt, c)):
+                rv[name].append(value)
+            for name in names:
+                rv[name].append(stat[name])
+        return JsonResponse(rv)
+
+    ret = {}
+    for (shape_id, pz, pt, c), stat in stats.items():
+        ret_stat_chan = {"index": c}
+        ret_stat_chan.update(stat)
+        ret.setdefault(str(shape_id), []).append(ret_stat_chan)
+    return JsonResponse(ret)
+
+
+def get_shape_stats(conn, shape_ids, planes, channels=None,
+                    engine='service', percentiles=None):
+    """
+    Returns an OrderedDict of the stats of shapes by (shape id, z, t, c),
+    for the planes (z, t) in which the shapes are measured: their own
+    theZ/theT if set. channels are all channels of the image by default.
+
+    Stats missing from the cache are computed by the ROI service (or with
+    numpy if it rejects them or engine is 'numpy'), with one call per
+    plane and channels, up to SHAPE_STATS_WORKERS at once.
+    """
+    name = 'shape_stats'
+    if engine == 'numpy':
+        name += ':numpy:' + ','.join(str(p) for p in percentiles or [])
+    params = omero.sys.ParametersI()
+    params.addIds(shape_ids)
+    rows = conn.getQueryService().projection("""
+        select shape.id, shape.details.updateEvent.id,
+               shape.theZ, shape.theT, pixels.sizeC
+        from Shape shape join shape.roi roi join roi.image image
+        join image.pixels pixels where shape.id in (:ids)
+    """, params, conn.SERVICE_OPTS)
+    shapes = dict((row[0], row[1:]) for row in (unwrap(r) for r in rows))
+
+    keys = OrderedDict()
+    for pz, pt in planes:
+        for shape_id in shape_ids:
+            if shape_id not in shapes:
+                continue
+            version, the_z, the_t, size_c = shapes[shape_id]
+            plane = (pz if the_z is None else the_z,
+                     pt if the_t is None else the_t)
+            for c in (range(size_c) if channels is None else channels):
+                keys[(shape_id,) + plane + (c,)] = \
+                    'omero_iviewer:%s:%s:%s:%s:%s:%s' % (
+                        (name, shape_id, version) + plane + (c,))
+    cached = cache.get_many(list(keys.values()))
+
+    # the missing stats, grouped into calls by plane and channels
+    calls = OrderedDict()
+    for (shape_id, pz, pt, c), key in keys.items():
+        if key not in cached:
+            calls.setdefault((pz, pt), OrderedDict()).setdefault(
+                shape_id, []).append(c)
+    groups = OrderedDict()
+    for plane, shape_channels in calls.items():
+        for shape_id, cs in shape_channels.items():
+            groups.setdefault(plane + (tuple(cs),), []).append(shape_id)
+
+    computed = {}
+    if len(groups) > 0:
+        rois_service = conn.getRoiService()
+
+        def compute(group):
+            pz, pt, cs = group
+            if engine == 'numpy':
+                return compute_shape_stats(
+                    conn, groups[group], pz, pt, cs, percentiles)
+            try:
+                stats = rois_service.getShapeStatsRestricted(
+                    groups[group], pz, pt, list(cs), conn.SERVICE_OPTS)
+            except omero.ApiUsageException:
+                # e.g. unsupported shapes, which numpy may handle
+                try:
+                    return compute_shape_stats(
+                        conn, groups[group], pz, pt, cs)
+                except ValueError:
+                    pass
+                raise
+            rv = []
+            for stat in stats:
+                for i, c in enumerate(stat.channelIds):
+                    rv.append((stat.shapeId, c, {
+                        "points": stat.pointsCount[i],
+                        "min": stat.min[i],
+                        "max": stat.max[i],
+                        "sum": stat.sum[i],
+                        "mean": stat.mean[i],
+                        "std_dev": stat.stdDev[i]
+                    }))
+            return rv
+
+        with ThreadPoolExecutor(
+                max_workers=min(SHAPE_STATS_WORKERS, len(groups))) as pool:
+            for (pz, pt, cs), stats in zip(groups, pool.map(compute, groups)):
+                for shape_id, c, stat in stats:
+                    computed[(shape_id, pz, pt, c)] = stat
+        cache.set_many(dict(
+            (keys[k], v) for k, v in computed.items() if k in keys),
+            SHAPE_STATS_CACHE_TIMEOUT)
+
+    rv = OrderedDict()
+    for k, key in keys.items():
+        if key in cached:
+            rv[k] = cached[key]
+        elif k in computed:
+            rv[k] = computed[k]
+    return rv
+
+
+def compute_shape_stats(conn, shape_ids, the_z, the_t, channels,
+                        percentiles=None):
+    """
+    Computes the stats of shapes on channels of a plane with numpy, from
+    the pixels of their bounding boxes. Returns a list of
+    (shape id, channel, stats). Raises ValueError for shapes which can't
+    be rasterized.
+    """
+    params = omero.sys.ParametersI()
+    params.addIds(shape_ids)
+    shapes = conn.getQueryService().findAllByQuery("""
+        select shape from Shape shape
+        left outer join fetch shape.transform
+        join fetch shape.roi roi join fetch roi.image image
+        join fetch image.pixels pixels join fetch pixels.pixelsType
+        where shape.id in (:ids)
+    """, params, conn.SERVICE_OPTS)
+    readers = {}
+    rv = []
+    try:
+        for shape in shapes:
+            pixels = shape.roi.image.getPrimaryPixels()
+            size_x, size_y = pixels.sizeX.val, pixels.sizeY.val
+            if not (0 <= the_z < pixels.sizeZ.val and
+                    0 <= the_t < pixels.sizeT.val and
+                    all(0 <= c < pixels.sizeC.val for c in channels)):
+                raise ValueError("Plane or channel out of bounds")
+            # the bounding box is checked before any pixel is rasterized
+            region = get_shape_mask(get_shape_geometry(shape), size_x,
+                                    size_y, MAX_SHAPE_STATS_PIXELS)
+            if region is None:
+                mask = numpy.zeros((0, 0), dtype=bool)
+                values = numpy.zeros((len(channels), 0, 0))
+            else:
+                x, y, mask = region
+                pixels_id = pixels.id.val
+                if pixels_id not in readers:
+                    readers[pixels_id] = RegionReader(
+                        conn, pixels_id, size_x, size_y,
+                        get_pixels_dtype(pixels.pixelsType.value.val),
+                        cache=INTENSITY_CACHE)
+                height, width = mask.shape
+                # channels are read one after the other from the same
+                # store and measured all at once
+                values = numpy.stack([readers[pixels_id].get_region(
+                    the_z, c, the_t, x, y, width, height) for c in channels])
+            stats = compute_stats(values, mask, percentiles)
+            for c, stat in zip(channels, stats):
+                rv.append((shape.id.val, c, stat))
+    finally:
+        for reader in readers.values():
+            reader.close()
+    return rv
+
+
+def metrics(request):
+    """
+    Get the metrics of the instrumented views and the counters of the
+    caches of this web worker process, in the Prometheus text format.
+    Only available if enabled with omero.web.iviewer.metrics_endpoint,
+    to the clients of METRICS_ALLOWED_IPS.
+    """
+    if not METRICS_ENDPOINT:
+        raise Http404('Metrics are disabled')
+    if request.META.get('REMOTE_ADDR') not in METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden('Metrics are not available to %s' % (
+            request.META.get('REMOTE_ADDR')))
+    caches = {
+        'intensity': INTENSITY_CACHE,
+        'roi_index': ROI_INDEX_CACHE,
+        'server': SERVER_CACHE,
+    }
+    return HttpResponse(METRICS.render(caches),
+                        content_type='text/plain; version=0.0.4')
@@ -36,6 +36,12 @@ import {
     TABS, URI_PREFIX, WEB_API_BASE, WEBCLIENT, WEBGATEWAY, OMERO_FIGURE
 } from '../utils/constants';
 
+/**
+ * milliseconds for which preloaded image data is used
+ * @type {number}
+ */
+const IMAGE_DATA_PRELOAD_MAX_AGE = 60000;
+
 /**
  * Provides all the information to the application that it shares
  * among its components, in particular it holds ImageConfig instances
@@ -116,6 +122,15 @@ export default class Context {
      */
     image_configs = new Map();
 
+    /**
+     * the image data preloaded for images that may be opened next,
+     * keyed by image id, see preloadImageData
+     *
+     * @memberof Context
+     * @type {Map}
+     */
+    preloaded_image_data = new Map();
+
     /**
      * a map for unsaved image settings
      *
@@ -513,6 +528,8 @@ export default class Context {
         }
         this.show_palette_only = (this.initParams[REQUEST_PARAMS.SHOW_PALETTE_ONLY] != 'False') || false
         this.enable_mirror = (this.initParams[REQUEST_PARAMS.ENABLE_MIRROR] != 'False') || false
+        // projections are only saved in the background if configured
+        this.async_projections = this.initParams[REQUEST_PARAMS.ASYNC_PROJECTIONS] === 'True';
         // nodedescriptors can be empty string or "None" (undefined)
         let nds = this.initParams[REQUEST_PARAMS.NODEDESCRIPTORS];
         // initially hide left and right panels?
@@ -667,6 +684,61 @@ export default class Context {
         }
     }
 
+    /**
+     * Loads the image data of several images with one request so that
+     * opening any of them does not need to request it again.
+     * Images whose data is already preloaded or open are skipped.
+     *
+     * @memberof Context
+     * @param {Array.<number>} image_ids the image ids
+     */
+    preloadImageData(image_ids) {
+        let now = Date.now();
+        for (let [id, entry] of this.preloaded_image_data)
+            if (now - entry.time > IMAGE_DATA_PRELOAD_MAX_AGE)
+                this.preloaded_image_data.delete(id);
+        let open_ids = [];
+        for (let [id, conf] of this.image_configs)
+            open_ids.push(conf.image_info.image_id);
+        image_ids = image_ids.filter(
+            id => !this.preloaded_image_data.has(id) &&
+                open_ids.indexOf(id) === -1);
+        if (image_ids.length === 0) return;
+
+        $.ajax({
+            url : this.server + this.getPrefixedURI(IVIEWER) +
+                  "/images_data/?images=" + image_ids.join(','),
+            success : (response) => {
+                if (typeof response !== 'object' || response === null ||
+                    typeof response.data !== 'object') return;
+                let time = Date.now();
+                for (let id in response.data) {
+                    let data = response.data[id];
+                    // images that failed to load are requested when opened
+                    if (typeof data.error === 'undefined')
+                        this.preloaded_image_data.set(
+                            parseInt(id), {data, time});
+                }
+            }
+        });
+    }
+
+    /**
+     * Returns (and forgets) the preloaded image data of an image,
+     * or null if there is none or it is too old to be used.
+     *
+     * @memberof Context
+     * @param {number} image_id the image id
+     * @return {Object|null} the image data or null
+     */
+    takePreloadedImageData(image_id) {
+        let entry = this.preloaded_image_data.get(image_id);
+        if (typeof entry === 'undefined') return null;
+        this.preloaded_image_data.delete(image_id);
+        if (Date.now() - entry.time > IMAGE_DATA_PRELOAD_MAX_AGE) return null;
+        return entry.data;
+    }
+
     /**
      * Makes a browser history entry for back/forth navigation
      *
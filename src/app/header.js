@@ -31,6 +31,12 @@ import {
 } from '../utils/constants';
 import { IMAGE_VIEWER_RESIZE } from '../events/events';
 
+/**
+ * the interval (in ms) at which the status of a projection is polled
+ * @type {number}
+ */
+const PROJECTION_POLL_INTERVAL = 1000;
+
 /**
  * @classdesc
  *
@@ -216,36 +222,59 @@ export class Header {
             "&projection=" + imgInf.projection +
             "&start=" + imgInf.projection_opts.start +
             "&end=" + imgInf.projection_opts.end;
+        if (this.context.async_projections) url += "&async=true";
         if (this.context.initial_type !== INITIAL_TYPES.WELL &&
              typeof imgInf.parent_id === 'number')
                  url += "&dataset=" + imgInf.parent_id;
 
+        let showResult = (resp) => {
+            let msg = "";
+            if (typeof resp.id === 'number') {
+                let linkWebclient = this.context.server +
+                    this.context.getPrefixedURI(WEBCLIENT) +
+                    "/?show=image-" + resp.id;
+                let linkIviewer = this.context.server +
+                    this.context.getPrefixedURI(IVIEWER) +
+                    "/?images=" + resp.id;
+                if (this.context.initial_type !== INITIAL_TYPES.WELL &&
+                    typeof imgInf.parent_id === 'number')
+                        linkIviewer += "&dataset=" + imgInf.parent_id;
+            msg =
+                "<a href='" + linkWebclient + "' target='_blank'>" +
+                "Navigate to Image in Webclient</a><br>" +
+                "<br><a href='" + linkIviewer + "' target='_blank'>" +
+                "Open Image in iviewer</a>";
+            } else {
+                msg = "Failed to create projected image";
+                if (typeof resp.error === 'string')
+                    console.error(resp.error);
+            }
+            Ui.showModalMessage(msg, 'Close');
+        };
+
+        // if created in the background, we poll the job of the projection
+        let pollJob = (jobId) => {
+            $.ajax({
+                url: this.context.server +
+                    this.context.getPrefixedURI(IVIEWER) +
+                    '/projection_job/' + jobId + '/',
+                success: (resp) => {
+                    if (resp.status === 'queued' || resp.status === 'running')
+                        setTimeout(() => pollJob(jobId), PROJECTION_POLL_INTERVAL);
+                    else showResult(resp);
+                },
+                error: (error) => showResult({error: error.statusText})
+            });
+        };
+
         $.ajax({
             url: url,
             success: (resp) => {
-                let msg = "";
-                if (typeof resp.id === 'number') {
-                    let linkWebclient = this.context.server +
-                        this.context.getPrefixedURI(WEBCLIENT) +
-                        "/?show=image-" + resp.id;
-                    let linkIviewer = this.context.server +
-                        this.context.getPrefixedURI(IVIEWER) +
-                        "/?images=" + resp.id;
-                    if (this.context.initial_type !== INITIAL_TYPES.WELL &&
-                        typeof imgInf.parent_id === 'number')
-                            linkIviewer += "&dataset=" + imgInf.parent_id;
-                msg =
-                    "<a href='" + linkWebclient + "' target='_blank'>" +
-                    "Navigate to Image in Webclient</a><br>" +
-                    "<br><a href='" + linkIviewer + "' target='_blank'>" +
-                    "Open Image in iviewer</a>";
-                } else {
-                    msg = "Failed to create projected image";
-                    if (typeof resp.error === 'string')
-                        console.error(resp.error);
-                }
-                Ui.showModalMessage(msg, 'Close');
-            }
+                if (typeof resp.job === 'string') pollJob(resp.job);
+                else showResult(resp);
+            },
+            error: (error) => showResult(
+                error.responseJSON || {error: error.statusText})
         });
     }
 
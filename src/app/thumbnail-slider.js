@@ -100,6 +100,22 @@ export default class ThumbnailSlider extends EventSubscriber {
      */
     thumbnails_request_size = 10;
 
+    /**
+     * the size of the thumbnails of well images, which are loaded inline
+     * with the list of images
+     * @memberof ThumbnailSlider
+     * @type {number}
+     */
+    inline_thumbnail_size = 96;
+
+    /**
+     * the number of images on either side of the selected one whose
+     * image data is preloaded
+     * @memberof ThumbnailSlider
+     * @type {number}
+     */
+    preload_count = 2;
+
     /**
      * size of thumbnails in slider (height + margin)
      * @memberof ThumbnailSlider
@@ -216,6 +232,7 @@ export default class ThumbnailSlider extends EventSubscriber {
             UI.scrollContainer(
                 'img-thumb-' + this.image_config.image_info.image_id,
                 '.thumbnail-scroll-panel');
+            this.preloadNeighbours();
             // no need to initialize twice
             return;
         }
@@ -458,6 +475,16 @@ export default class ThumbnailSlider extends EventSubscriber {
             (init_type === INITIAL_TYPES.IMAGES || init_type === INITIAL_TYPES.ROIS || init_type === INITIAL_TYPES.SHAPES) ?
                 this.image_config.image_info.parent_type : init_type;
 
+        let child_is_image = (init_type === INITIAL_TYPES.IMAGES || init_type === INITIAL_TYPES.ROIS ||
+                init_type === INITIAL_TYPES.SHAPES);
+        if (init_type === INITIAL_TYPES.WELL ||
+            (child_is_image && parent_type === INITIAL_TYPES.WELL)) {
+                // all images of the well are loaded at once
+                if (init) this.requestWellThumbnails(
+                    parent_id, refresh, thumb_start_index);
+                return;
+        }
+
         let offset = parseInt(thumb_start_index / this.thumbnails_request_size) * this.thumbnails_request_size;
         let limit = this.thumbnails_request_size;
         if (thumb_end_index !== undefined) {
@@ -466,18 +493,11 @@ export default class ThumbnailSlider extends EventSubscriber {
             limit = thumb_end_index - offset;
         }
 
-
         let url = this.context.server;
-        let child_is_image = (init_type === INITIAL_TYPES.IMAGES || init_type === INITIAL_TYPES.ROIS ||
-                init_type === INITIAL_TYPES.SHAPES);
         if (init_type === INITIAL_TYPES.DATASET ||
             (child_is_image && parent_type === INITIAL_TYPES.DATASET)) {
                 url += this.web_api_base + DATASETS_REQUEST_URL +
                     '/' + parent_id + '/images/?';
-        } else if (this.context.initial_type === INITIAL_TYPES.WELL ||
-            (child_is_image && parent_type === INITIAL_TYPES.WELL)) {
-                url += (this.context.getPrefixedURI(IVIEWER) +
-                        "/well_images/?id=" + parent_id + "&");
         }
         url += 'offset=' + offset + '&limit=' + limit;
 
@@ -505,6 +525,7 @@ export default class ThumbnailSlider extends EventSubscriber {
 
                 // add thumnails to the map which will trigger the loading
                 this.addThumbnails(response.data, offset);
+                this.preloadNeighbours();
                 if (init) {
                     if (thumb_start_index > 0) {
                         // Scrolling will trigger loading of any unloaded thumbs
@@ -529,6 +550,84 @@ export default class ThumbnailSlider extends EventSubscriber {
         });
     }
 
+    /**
+     * Requests the images of a well with their thumbnails, following
+     * the cursor of the response until all are loaded
+     *
+     * @param {number} well_id the well id
+     * @param {boolean} refresh true if the user hit the refresh icon
+     * @param {number} thumb_start_index Index of the thumbnail to scroll to
+     * @param {string} after the cursor of the next page, if any
+     * @param {number} offset the index of the first image of the page
+     * @memberof ThumbnailSlider
+     */
+    requestWellThumbnails(well_id, refresh = false, thumb_start_index = 0,
+                          after = null, offset = 0) {
+        let url = this.context.server +
+            this.context.getPrefixedURI(IVIEWER) + "/plate_images/?well=" +
+            well_id + "&thumbnails=" + this.inline_thumbnail_size;
+        if (after !== null) url += "&after=" + after;
+        let first_page = after === null;
+
+        $.ajax(
+            {url : url,
+            success : (response) => {
+                this.requesting_thumbnail_data = false;
+                if (typeof response !== 'object' || response === null ||
+                    typeof response.meta !== 'object' ||
+                    response.meta === null || !Misc.isArray(response.data)) {
+                        if (first_page) this.hideMe();
+                        return;
+                }
+                if (first_page) {
+                    this.setThumbnailsCount(response.meta.totalCount);
+                    if (this.thumbnails.length === 0) {
+                        this.hideMe();
+                        return;
+                    }
+                }
+                this.addThumbnails(response.data, offset);
+                if (typeof response.meta.next === 'string') {
+                    this.requestWellThumbnails(
+                        well_id, refresh, thumb_start_index,
+                        response.meta.next, offset + response.data.length);
+                }
+                if (!first_page || response.data.length === 0) return;
+
+                this.preloadNeighbours();
+                if (thumb_start_index > 0)
+                    this.scrollToThumbnail(thumb_start_index);
+                // open first image for well
+                if (!refresh &&
+                    this.context.initial_type === INITIAL_TYPES.WELL) {
+                    this.onClick(response.data[0]['@id']);
+                }
+            },
+            error : (response) => {
+                this.requesting_thumbnail_data = false;
+                if (first_page) this.hideMe();
+            }
+        });
+    }
+
+    /**
+     * Preloads the image data of the images next to the selected one,
+     * with one request, so that they open faster
+     *
+     * @memberof ThumbnailSlider
+     */
+    preloadNeighbours() {
+        if (this.image_config === null || this.preload_count <= 0) return;
+        let image_id = this.image_config.image_info.image_id;
+        let index = this.thumbnails.findIndex(t => t.id === image_id);
+        if (index === -1) return;
+        let ids = this.thumbnails.slice(
+            Math.max(0, index - this.preload_count),
+            index + this.preload_count + 1).map(t => t.id).filter(
+                id => typeof id === 'number' && id !== image_id);
+        if (ids.length > 0) this.context.preloadImageData(ids);
+    }
+
     /**
      * Adds thumbnails with Image IDs to this.thumbnails array.
      * We create a new list from old, replacing the thumbnails (instead of
@@ -553,6 +652,7 @@ export default class ThumbnailSlider extends EventSubscriber {
                 return {
                     id: t['@id'],
                     url: thumbPrefix + t['@id'] + "/",
+                    data_url: t.thumbnail,
                     title: typeof t.Name === 'string' ? t.Name : t['@id'],
                     revision : 0
                 }
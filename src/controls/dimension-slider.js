@@ -22,11 +22,17 @@ import Misc from '../utils/misc';
 import Ui from '../utils/ui';
 import {UNTILED_RETRIEVAL_LIMIT} from '../viewers/viewer/globals';
 import {slider} from 'jquery-ui/ui/widgets/slider';
-import {PROJECTION} from '../utils/constants';
+import {IVIEWER, PROJECTION} from '../utils/constants';
 import {
     IMAGE_DIMENSION_CHANGE, IMAGE_DIMENSION_PLAY, IMAGE_SETTINGS_CHANGE
 } from '../events/events';
 
+/**
+ * the number of planes ahead whose histograms are prefetched on play
+ * @type {number}
+ */
+const HISTOGRAM_PREFETCH_PLANES = 10;
+
 /**
  * Represents a dimension slider using jquery slider
  */
@@ -129,6 +135,7 @@ export default class DimensionSlider {
             });
         } else {
             this.last_player_start = conf.image_info.dimensions[this.dim];
+            this.prefetchHistograms(forwards);
         }
 
         // send out a dimension change notification
@@ -141,6 +148,42 @@ export default class DimensionSlider {
             });
     }
 
+    /**
+     * Has the server compute the histograms of the next planes in the
+     * background so that the histogram follows the movie playback
+     *
+     * @param {boolean} forwards the direction of playback
+     * @memberof DimensionSlider
+     */
+    prefetchHistograms(forwards) {
+        let image_info = this.image_config.image_info;
+        if (!this.image_config.show_histogram || image_info.tiled ||
+            !Misc.isArray(image_info.channels)) return;
+        let channels = [];
+        image_info.channels.forEach((c, i) => {
+            if (c.active) channels.push(i);
+        });
+        if (channels.length === 0) return;
+
+        let dims = image_info.dimensions;
+        let current = dims[this.dim];
+        let start = forwards ? current + 1 :
+            Math.max(0, current - HISTOGRAM_PREFETCH_PLANES);
+        let end = forwards ?
+            Math.min(dims['max_' + this.dim] - 1,
+                     current + HISTOGRAM_PREFETCH_PLANES) :
+            current - 1;
+        if (start > end) return;
+
+        let other = this.dim === 't' ? 'z' : 't';
+        let url = this.context.server + this.context.getPrefixedURI(IVIEWER) +
+            "/histograms/" + image_info.image_id + "/?c=" +
+            channels.join(',') + "&" + other + "=" + dims[other] +
+            "&" + this.dim + "=" + start + "&" + this.dim + "_end=" + end +
+            "&prefetch=true";
+        $.ajax({url});
+    }
+
     /**
      * Overridden aurelia lifecycle method:
      * called whenever the view is bound within aurelia
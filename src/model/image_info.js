@@ -310,46 +310,58 @@ export default class ImageInfo {
         } else {
             url += "/image_data/" + this.image_id + '/';
         }
-        $.ajax({
-            url,
-            success : (response) => {
-                if (!this.image_id) {
-                    this.image_id = response.id;
-                }
-                this.web_url = this.context.server + this.context.getPrefixedURI(WEBCLIENT) +
-                    '/?show=image-' + this.image_id;
-
-                // validate response
-                // check for Exceptions and show error dialog.
-                const valid = this.validateImageInfo(response);
-                if (!valid) {
-                    return;
-                }
+        let onSuccess = (response) => {
+            if (!this.image_id) {
+                this.image_id = response.id;
+            }
+            this.web_url = this.context.server + this.context.getPrefixedURI(WEBCLIENT) +
+                '/?show=image-' + this.image_id;
+
+            // validate response
+            // check for Exceptions and show error dialog.
+            const valid = this.validateImageInfo(response);
+            if (!valid) {
+                return;
+            }
 
-                // read initial request params
-                this.initializeImageInfo(response, refresh);
-                // check for a parent id (if not well)
-                if (this.context.initial_type !== INITIAL_TYPES.WELL &&
-                    typeof this.parent_id !== 'number') {
-                    if (typeof response.meta === 'object' &&
-                            typeof response.meta.datasetId === 'number')
-                        this.parent_id = response.meta.datasetId;
-                }
+            // read initial request params
+            this.initializeImageInfo(response, refresh);
+            // check for a parent id (if not well)
+            if (this.context.initial_type !== INITIAL_TYPES.WELL &&
+                typeof this.parent_id !== 'number') {
+                if (typeof response.meta === 'object' &&
+                        typeof response.meta.datasetId === 'number')
+                    this.parent_id = response.meta.datasetId;
+            }
 
-                // fetch copied img RDef
-                this.requestImgRDef();
-                // request regions data if rois tab showing
-                let conf = this.context.getImageConfig(this.config_id);
-                if (this.context.isRoisTabActive()) {
-                    if (this.initial_roi_id) {
-                        conf.regions_info.setPageByRoiAndReload(this.initial_roi_id);
-                    } else if (this.initial_shape_id) {
-                        conf.regions_info.setPageByRoiAndReload(null, this.initial_shape_id);
-                    } else {
-                        conf.regions_info.requestData();
-                    }
+            // fetch copied img RDef
+            this.requestImgRDef();
+            // request regions data if rois tab showing
+            let conf = this.context.getImageConfig(this.config_id);
+            if (this.context.isRoisTabActive()) {
+                if (this.initial_roi_id) {
+                    conf.regions_info.setPageByRoiAndReload(this.initial_roi_id);
+                } else if (this.initial_shape_id) {
+                    conf.regions_info.setPageByRoiAndReload(null, this.initial_shape_id);
+                } else {
+                    conf.regions_info.requestData();
                 }
-            },
+            }
+        };
+
+        // use the data preloaded e.g. by the thumbnail slider
+        let preloaded = refresh || !this.image_id ?
+            null : this.context.takePreloadedImageData(this.image_id);
+        if (preloaded !== null) {
+            // keep the handling asynchronous, as for a request
+            setTimeout(() => onSuccess(preloaded), 0);
+            return;
+        }
+        $.ajax({
+            url,
+            // the browser revalidates its copy using the ETag
+            cache: true,
+            success : onSuccess,
             error : (error, textStatus) => {
                 this.ready = false;
                 this.error = true;
@@ -705,7 +717,7 @@ export default class ImageInfo {
     requestDeltaT() {
         if (this.dimensions.max_t <= 1) return;
         let url = this.context.server + this.context.getPrefixedURI(IVIEWER);
-        url += "/image_data/" + this.image_id + '/delta_t/';
+        url += "/image_data/" + this.image_id + '/delta_t/?encoding=delta';
         $.ajax({
             url,
             success: (response) => {
@@ -723,7 +735,16 @@ export default class ImageInfo {
      */
     setFormattedDeltaT(response) {
 
-        this.image_delta_t = response.delta_t
+        if (response.encoding === 'delta') {
+            // the first deltaT and the intervals between the timepoints
+            let t = response.start;
+            let delta_t = t === null ? [] : [t];
+            for (let i = 0; i < response.deltas.length; i++) {
+                t += response.deltas[i];
+                delta_t.push(t);
+            }
+            this.image_delta_t = delta_t;
+        } else this.image_delta_t = response.delta_t;
 
         // original units
         this.image_delta_t_unit = response.delta_t_unit_symbol;
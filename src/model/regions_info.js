@@ -20,6 +20,7 @@ import {noView} from 'aurelia-framework';
 import RegionsHistory from './regions_history';
 import Misc from '../utils/misc';
 import {Converters} from '../utils/converters';
+import {convertColumnarToRois} from '../viewers/viewer/utils/Conversion';
 import {
     REGIONS_COPY_SHAPES, REGIONS_GENERATE_SHAPES, REGIONS_SET_PROPERTY
 } from '../events/events';
@@ -78,6 +79,14 @@ export default class RegionsInfo  {
      */
     roi_page_number = 0;
 
+    /**
+     * Cursors for keyset pagination of ROIs loaded by plane, i.e. the id
+     * of the last ROI of the previous page, keyed by plane url and page
+     * @memberof RegionsInfo
+     * @type {Object}
+     */
+    roi_page_cursors = {};
+
     /**
      * a total shape count (exluding new with deleted!)
      * necessary because the data map still needs to include deleted
@@ -418,10 +427,17 @@ export default class RegionsInfo  {
         let url = this.image_info.context.server;
 
         if (this.isRoiLoadingPaginatedByPlane()) {
+            // the compact (columnar) form of rois_by_plane
             url += this.image_info.context.getPrefixedURI(IVIEWER) +
-                  '/rois_by_plane/' + this.image_info.image_id + '/' +
+                  '/shapes_by_plane/' + this.image_info.image_id + '/' +
                   z_start + (z_end ? '-' + z_end : '') + '/' +
                   this.image_info.dimensions.t + '/?';
+            // use the cursor of the page if we know it (i.e. we have
+            // loaded the page before), otherwise fall back to the offset
+            let cursor = this.roi_page_cursors[url + this.roi_page_number];
+            if (typeof cursor === 'number') {
+                return url + 'limit=' + this.roi_page_size + '&after=' + cursor;
+            }
         } else {
             url += this.image_info.context.getPrefixedURI(WEB_API_BASE) +
                 REGIONS_REQUEST_URL + '/?image=' + this.image_info.image_id +
@@ -455,16 +471,25 @@ export default class RegionsInfo  {
         this.is_pending = true;
 
         // send request
+        let url = this.getRegionsUrl();
+        let page = this.roi_page_number;
         $.ajax({
-            url : this.getRegionsUrl(),
+            url : url,
             success : (response) => {
                 if (this.try_request_again) {
                     this.is_pending = false;
                     this.try_request_again = false;
                     this.requestData();
                 } else if (this.is_pending) {
-                    this.setData(response.data);
+                    this.setData(typeof response.rois === 'object' ?
+                        convertColumnarToRois(response) : response.data);
                     this.roi_count_on_current_plane = response.meta.totalCount;
+                    // remember the cursor for the next page
+                    if (typeof response.meta.next === 'number') {
+                        let planeUrl = url.substring(0, url.indexOf('?') + 1);
+                        this.roi_page_cursors[planeUrl + (page + 1)] =
+                            response.meta.next;
+                    }
                 }
             }, error : (error) => {
                 this.is_pending = false;
@@ -510,6 +535,9 @@ export default class RegionsInfo  {
                         let newShape =
                             Converters.amendShapeDefinition(
                                 Object.assign({}, shape));
+                        // decoded coords are only used to create the
+                        // features, the Points are kept up-to-date
+                        delete newShape.coords;
                         let shapeId = newShape['@id']
                         newShape.shape_id = "" + roiId + ":" + shapeId;
                         // we add some flags we are going to need
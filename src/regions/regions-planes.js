@@ -19,6 +19,7 @@
 import {computedFrom} from 'aurelia-framework';
 import Context from '../app/context';
 import Ui from '../utils/ui';
+import {decodeRunLengths} from '../viewers/viewer/utils/Conversion';
 import { IVIEWER, ROI_TABS,
     PROJECTION} from '../utils/constants';
 import {inject, customElement, bindable, BindingEngine} from 'aurelia-framework';
@@ -114,9 +115,14 @@ export default class RegionsPlanes {
         $.ajax({
             url :
                 this.context.server + this.context.getPrefixedURI(IVIEWER) +
-                "/plane_shape_counts/" + this.regions_info.image_info.image_id + '/',
+                "/plane_shape_counts/" + this.regions_info.image_info.image_id +
+                '/?encoding=rle',
             success : (response) => {
                 this.is_pending = false;
+                // older servers ignore the encoding and return data
+                if (response.encoding === 'rle') {
+                    response.data = decodeRunLengths(response);
+                }
                 let shape_counts = [];
                 let max_count = 1;
                 let min_count = Infinity;
@@ -18,7 +18,7 @@
 
 import {noView} from 'aurelia-framework';
 import Misc from '../utils/misc';
-import {WEBGATEWAY} from '../utils/constants';
+import {IVIEWER} from '../utils/constants';
 import ImageInfo from '../model/image_info';
 import {
     IMAGE_SETTINGS_CHANGE, IMAGE_DIMENSION_CHANGE, HISTOGRAM_RANGE_UPDATE,
@@ -322,7 +322,8 @@ export default class Histogram extends EventSubscriber {
     }
 
     /**
-     * Requests Histogram Data
+     * Requests Histogram Data. The histograms of the other active channels
+     * of the plane are requested along with it and kept for later use
      * @param {number} channel the channel
      * @param {function} handler the success handler
      * @memberof Histogram
@@ -335,26 +336,40 @@ export default class Histogram extends EventSubscriber {
                 channel > this.image_info.channels.length ||
                 typeof handler !== 'function')) return;
 
-        // assemble url
-        let server = this.image_info.context.server;
-        let uri_prefix = this.image_info.context.getPrefixedURI(WEBGATEWAY);
         let time = this.image_info.dimensions.t;
         let plane = this.image_info.dimensions.z;
-        let url = server + uri_prefix + "/histogram_json/" +
-            this.image_info.image_id + "/channel/" + channel + "/?theT=" +
-            time + "&theZ="+ plane;
+        let channels = [channel];
+        if (Misc.isArray(this.image_info.channels))
+            this.image_info.channels.forEach((c, i) => {
+                if (c.active && i !== channel &&
+                    !this.data_cache.has("" + i + "/" + plane + "/" + time))
+                    channels.push(i);
+            });
+
+        // assemble url
+        let server = this.image_info.context.server;
+        let uri_prefix = this.image_info.context.getPrefixedURI(IVIEWER);
+        let url = server + uri_prefix + "/histograms/" +
+            this.image_info.image_id + "/?c=" + channels.join(',') +
+            "&t=" + time + "&z="+ plane;
 
         // fire off ajax request
         $.ajax({url : url,
             success : (response) => {
                 // for error and non array data (which is what we want)
                 // we return null and the handler will respond accordingly
-                let data =
-                    typeof response === 'object' &&
-                        Misc.isArray(response.data) ? response.data : null;
-                if (data) // store requested data
-                    this.data_cache.set(
-                        "" + channel + "/" + plane + "/" + time, data);
+                let data = null;
+                if (typeof response === 'object' &&
+                        Misc.isArray(response.data)) {
+                    // store requested data
+                    response.data.forEach((h) => {
+                        if (!Misc.isArray(h.data)) return;
+                        this.data_cache.set(
+                            "" + h.theC + "/" + h.theZ + "/" + h.theT,
+                            h.data);
+                        if (h.theC === channel) data = h.data;
+                    });
+                }
                 handler(data);
             },
             error : () => handler(null)});
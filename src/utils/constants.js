@@ -144,6 +144,7 @@ export const REQUEST_PARAMS = {
     ROI_COLOR_PALETTE: 'ROI_COLOR_PALETTE',
     SHOW_PALETTE_ONLY: 'SHOW_PALETTE_ONLY',
     ENABLE_MIRROR: 'ENABLE_MIRROR',
+    ASYNC_PROJECTIONS: 'ASYNC_PROJECTIONS',
     FLIP_X: 'FX',
     FLIP_Y: 'FY',
     FULL_PAGE: 'FULL_PAGE',
@@ -404,10 +404,14 @@ class IntensityDisplay extends Control {
                         "server" : this.image_.server_,
                         "uri" : this.prefix_ + "/get_intensity/?image=" + this.image_.id_ +
                                 "&z=" + z + "&t=" + t + "&x=" + x + "&y=" + y +
-                                "&c=" + channelsThatNeedToBeRequested.join(','),
+                                "&c=" + channelsThatNeedToBeRequested.join(',') +
+                                "&format=columnar",
                         "success" : function(resp) {
                             try {
                                 var res = JSON.parse(resp);
+                                // older servers ignore the format parameter
+                                if (res['format'] === 'columnar')
+                                    res = this.columnarToPixels(res);
                                 this.cacheIntensities(res);
                                 displayIntensity(this.getCachedIntensities(z, t, x, y));
                             } catch(parseError) {
@@ -456,6 +460,33 @@ class IntensityDisplay extends Control {
         }
     }
 
+    /**
+     * Converts a columnar intensity response, i.e. an extent and one flat
+     * array of values per channel (in row order), into the per pixel
+     * structure that is used for caching
+     *
+     * @param {Object} columnar the columnar response
+     * @return {Object} an object with count and pixels entries
+     */
+    columnarToPixels(columnar) {
+        var extent = columnar['extent'];
+        var channels = columnar['channels'];
+        var values = columnar['values'];
+        var ret = {'count': 0, 'pixels': {}};
+        var i = 0;
+        for (var row = extent[1]; row < extent[3]; row++) {
+            for (var col = extent[0]; col < extent[2]; col++) {
+                var entry = {};
+                for (var c = 0; c < channels.length; c++)
+                    entry['' + channels[c]] = values[c][i];
+                ret['pixels']['' + col + '-' + row] = entry;
+                i++;
+            }
+        }
+        ret['count'] = i * channels.length;
+        return ret;
+    }
+
     cacheIntensities(intensities) {
         try {
             var plane = this.image_.getPlane();
@@ -31,6 +31,7 @@ import {calculateLengthAndArea,
 import {isArray,
     getCookie,
     sendEventNotification} from '../utils/Misc';
+import {splitRoisIntoChunks} from '../utils/Conversion';
 import {sendRequest} from '../utils/Net';
 import {PROJECTION,
     PLUGIN_PREFIX,
@@ -39,6 +40,18 @@ import {PROJECTION,
     REGIONS_MODE,
     REGIONS_REQUEST_URL} from '../globals';
 
+/**
+ * Changes with more shapes than this are saved in chunks
+ * @type {number}
+ */
+const CHUNKED_SAVE_THRESHOLD = 1000;
+
+/**
+ * The number of times a chunk is sent before giving up
+ * @type {number}
+ */
+const CHUNKED_SAVE_ATTEMPTS = 3;
+
 /**
  * @classdesc
  * Regions is the viewer's layer source for displaying the regions.
@@ -588,7 +601,79 @@ class Regions extends Vector {
 
         if (typeof omit_client_update !== 'boolean') omit_client_update = false;
 
+        var capturedRegionsReference = this;
+
+        // the success handler for the POST
+        var success = function(data) {
+            var params = {
+                "shapes": {},
+                "omit_client_update" : omit_client_update
+            };
+
+            var errors = [];
+            try {
+                data = JSON.parse(data);
+                if (data && typeof data['ids'] === 'object')
+                    params['shapes'] = data['ids'];
+                if (data && isArray(data['errors']))
+                    errors = data['errors'];
+            } catch(parseError) {
+                errors.push("Failed to parse JSON response");
+            }
+
+            try {
+                // synchronize ids and states
+                for (var id in params['shapes']) {
+                    var f = capturedRegionsReference.idIndex_[id];
+                    if (f['state'] === REGIONS_STATE.REMOVED)
+                        capturedRegionsReference.removeFeature(f);
+                    else {
+                        f['state'] = REGIONS_STATE.DEFAULT;
+                        f.setId(params['shapes'][id]);
+                        if (typeof f['permissions'] !== 'object') {
+                            f['permissions'] = {
+                                'canAnnotate': true,
+                                'canEdit': true,
+                                'canDelete': true,
+                            }
+                        }
+                    }
+                }
+                // tag on the newly but immediately deleted shapes
+                for (var i in roisAsJsonObject['new_and_deleted']) {
+                    var id = roisAsJsonObject['new_and_deleted'][i];
+                    if (typeof capturedRegionsReference.idIndex_[id] === 'object') {
+                        capturedRegionsReference.removeFeature(
+                            capturedRegionsReference.idIndex_[id]);
+                        params['shapes'][id] = id;
+                    }
+                };
+            } catch(err) {
+                errors.push('Failed to sync rois' + err);
+            }
+
+            if (errors.length > 0) params['errors'] = errors;
+            sendEventNotification(
+                capturedRegionsReference.viewer_, "REGIONS_STORED_SHAPES", params);
+        };
+
+        // the error handler for the POST
+        var error = function(error) {
+            var params = {
+                "shapes": [],
+                "errors" : [error]
+            };
+            sendEventNotification(
+                capturedRegionsReference.viewer_, "REGIONS_STORED_SHAPES", params);
+        };
+
         try {
+            // large changes are saved in chunks
+            if (roisAsJsonObject['count'] > CHUNKED_SAVE_THRESHOLD) {
+                this.storeRegionsInChunks(roisAsJsonObject, success, error);
+                return true;
+            }
+
             var postContent = {
                 "imageId": this.viewer_.id_,
                 "rois": roisAsJsonObject
@@ -602,73 +687,9 @@ class Regions extends Vector {
                 "method" : 'POST',
                 "content" : JSON.stringify(postContent),
                 "headers" : {"X-CSRFToken" : getCookie("csrftoken")},
-                "jsonp" : false
-            };
-
-            var capturedRegionsReference = this;
-
-            // the success handler for the POST
-            properties["success"] = function(data) {
-                var params = {
-                    "shapes": {},
-                    "omit_client_update" : omit_client_update
-                };
-
-                var errors = [];
-                try {
-                    data = JSON.parse(data);
-                    if (data && typeof data['ids'] === 'object')
-                        params['shapes'] = data['ids'];
-                    if (data && isArray(data['errors']))
-                        errors = data['errors'];
-                } catch(parseError) {
-                    errors.push("Failed to parse JSON response");
-                }
-
-                try {
-                    // synchronize ids and states
-                    for (var id in params['shapes']) {
-                        var f = capturedRegionsReference.idIndex_[id];
-                        if (f['state'] === REGIONS_STATE.REMOVED)
-                            capturedRegionsReference.removeFeature(f);
-                        else {
-                            f['state'] = REGIONS_STATE.DEFAULT;
-                            f.setId(params['shapes'][id]);
-                            if (typeof f['permissions'] !== 'object') {
-                                f['permissions'] = {
-                                    'canAnnotate': true,
-                                    'canEdit': true,
-                                    'canDelete': true,
-                                }
-                            }
-                        }
-                    }
-                    // tag on the newly but immediately deleted shapes
-                    for (var i in roisAsJsonObject['new_and_deleted']) {
-                        var id = roisAsJsonObject['new_and_deleted'][i];
-                        if (typeof capturedRegionsReference.idIndex_[id] === 'object') {
-                            capturedRegionsReference.removeFeature(
-                                capturedRegionsReference.idIndex_[id]);
-                            params['shapes'][id] = id;
-                        }
-                    };
-                } catch(err) {
-                    errors.push('Failed to sync rois' + err);
-                }
-
-                if (errors.length > 0) params['errors'] = errors;
-                sendEventNotification(
-                    capturedRegionsReference.viewer_, "REGIONS_STORED_SHAPES", params);
-            };
-
-            // the error handler for the POST
-            properties["error"] = function(error) {
-                var params = {
-                    "shapes": [],
-                    "errors" : [error]
-                };
-                sendEventNotification(
-                    capturedRegionsReference.viewer_, "REGIONS_STORED_SHAPES", params);
+                "jsonp" : false,
+                "success": success,
+                "error": error
             };
 
             // send request
@@ -680,6 +701,96 @@ class Regions extends Vector {
         return true;
     }
 
+    /**
+     * Persists modified/added shapes in chunks: a save session is started,
+     * the chunks are sent one after the other (each is retried a few times
+     * if it fails) and the save is then committed. The ids of all the saved
+     * chunks are then handed to success, as for a single request. They are
+     * collected from the responses to the chunks since the server only
+     * returns them again if its cache is shared.
+     *
+     * @param {Object} roisAsJsonObject a populated object for json serialization
+     * @param {function} success the handler for the response of the commit
+     * @param {function} error the handler for request errors
+     */
+    storeRegionsInChunks(roisAsJsonObject, success, error) {
+        var uri = this.viewer_.getPrefixedURI(PLUGIN_PREFIX) +
+            '/persist_rois/chunked/';
+        var post = function(uri, content, onSuccess, onError) {
+            sendRequest({
+                "server" : this.viewer_.getServer(),
+                "uri" : uri,
+                "method" : 'POST',
+                "content" : JSON.stringify(content),
+                "headers" : {"X-CSRFToken" : getCookie("csrftoken")},
+                "jsonp" : false,
+                "success": onSuccess,
+                "error": onError
+            }, this);
+        }.bind(this);
+
+        post(uri, {"imageId": this.viewer_.id_}, function(data) {
+            var session = null;
+            var chunks = [];
+            try {
+                data = JSON.parse(data);
+                session = data['session'];
+                chunks = splitRoisIntoChunks(
+                    roisAsJsonObject, data['chunkSize']);
+            } catch(parseError) {}
+            if (typeof session !== 'string') {
+                error("Failed to start saving: " +
+                    (isArray(data['errors']) ? data['errors'] : data));
+                return;
+            }
+            var sessionUri = uri + session + '/';
+            var ids = {};
+            var commit = function() {
+                post(sessionUri + 'commit/', {"chunks": chunks.length},
+                    function(data) {
+                        try {
+                            data = JSON.parse(data);
+                            data['ids'] = Object.assign(data['ids'] || {}, ids);
+                            data = JSON.stringify(data);
+                        } catch(parseError) {}
+                        success(data);
+                    }, error);
+            };
+            var sendChunk = function(index, attempt) {
+                if (index >= chunks.length) {
+                    commit();
+                    return;
+                }
+                var retry = function(err) {
+                    if (attempt < CHUNKED_SAVE_ATTEMPTS) {
+                        sendChunk(index, attempt + 1);
+                        return;
+                    }
+                    // commit what was saved, reporting the missing chunks
+                    console.error(
+                        "Failed to save chunk " + index + ": " + err);
+                    commit();
+                };
+                post(sessionUri + index + '/', {"rois": chunks[index]},
+                    function(data) {
+                        var errors = null;
+                        try {
+                            data = JSON.parse(data);
+                            errors = data['errors'];
+                            // also those of a chunk saved with errors, which
+                            // is not saved again when retried
+                            Object.assign(ids, data['ids']);
+                        } catch(parseError) {
+                            errors = parseError;
+                        }
+                        if (errors) retry(errors);
+                        else sendChunk(index + 1, 1);
+                    }, retry);
+            };
+            sendChunk(0, 1);
+        }, error);
+    }
+
     /**
      * Sets the ID of a shape that we are hovering over, to update its style
      *
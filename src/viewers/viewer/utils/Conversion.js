@@ -853,6 +853,54 @@ export const toJsonObject =
     return categorizedRois;
 };
 
+/**
+ * Splits the categorized rois of toJsonObject into chunks of at most
+ * chunkSize changes each, which can be saved separately. A change is a new,
+ * modified or deleted shape, or an empty roi to be deleted.
+ *
+ * @static
+ * @function
+ * @param {Object} rois the categorized rois, as returned by toJsonObject
+ * @param {number} chunkSize the maximum number of changes per chunk
+ * @return {Array.<Object>} the chunks, with the same keys as rois
+ */
+export const splitRoisIntoChunks = function(rois, chunkSize) {
+    var chunks = [];
+    var chunk = null;
+    var nextChunk = function() {
+        if (chunk !== null && chunk['count'] < chunkSize) return chunk;
+        chunk = {
+            "count": 0,
+            "empty_rois": {},
+            "deleted" : {},
+            "new" : [],
+            "modified" : []
+        };
+        chunks.push(chunk);
+        return chunk;
+    };
+    ['new', 'modified'].forEach(function(key) {
+        if (!isArray(rois[key])) return;
+        rois[key].forEach(function(shape) {
+            nextChunk()[key].push(shape);
+            chunk['count']++;
+        });
+    });
+    for (var roiId in rois['deleted']) {
+        rois['deleted'][roiId].forEach(function(shapeId) {
+            var deleted = nextChunk()['deleted'];
+            if (!isArray(deleted[roiId])) deleted[roiId] = [];
+            deleted[roiId].push(shapeId);
+            chunk['count']++;
+        });
+    }
+    for (var roiId in rois['empty_rois']) {
+        nextChunk()['empty_rois'][roiId] = rois['empty_rois'][roiId];
+        chunk['count']++;
+    }
+    return chunks;
+};
+
 /**
  * Turns an openlayers feature/geometry into a json shape definition that
  * can then be marshalled by omero marshal and stored
@@ -930,3 +978,131 @@ export const convertPointStringIntoCoords = function(points) {
 
     return ret;
 }
+
+/**
+ * The schema prefix of the omero_marshal types
+ * @type {string}
+ */
+const MARSHAL_SCHEMA = "http://www.openmicroscopy.org/Schemas/OME/2016-06#";
+
+/**
+ * Decodes a base64 string of little-endian values into a typed array
+ *
+ * @static
+ * @function
+ * @param {string} base64 the base64 encoded buffer
+ * @param {function} arrayType the typed array class, e.g. Float32Array
+ * @return {TypedArray} the typed array
+ */
+export const decodeBase64Buffer = function(base64, arrayType) {
+    var binary = atob(base64 || "");
+    var bytes = new Uint8Array(binary.length);
+    for (var i=0; i<binary.length; i++) bytes[i] = binary.charCodeAt(i);
+    return new arrayType(bytes.buffer);
+}
+
+/**
+ * Expands the run length encoded counts returned by plane_shape_counts
+ * with encoding=rle into a 2D array [z][t]
+ *
+ * @static
+ * @function
+ * @param {Object} response with shape ([size_z, size_t]), values and lengths
+ * @return {Array.<Array.<number>>} the 2D array of counts
+ */
+export const decodeRunLengths = function(response) {
+    var size_t = response.shape[1];
+    var flat = [];
+    for (var i=0; i<response.values.length; i++) {
+        for (var n=0; n<response.lengths[i]; n++) {
+            flat.push(response.values[i]);
+        }
+    }
+    var data = [];
+    for (var z=0; z<response.shape[0]; z++) {
+        data.push(flat.slice(z * size_t, (z + 1) * size_t));
+    }
+    return data;
+}
+
+/**
+ * Turns the compact columnar form of ROIs and shapes returned by
+ * shapes_by_plane into the same array of rois (incl. shapes) as the
+ * omero_marshal json of rois_by_plane.
+ * Polygons and polylines get their coordinates as 'coords' too,
+ * so that features can be created without parsing the 'Points'
+ *
+ * @static
+ * @function
+ * @param {Object} columnar the shapes_by_plane response
+ * @return {Array.<Object>} an array of rois (incl. shapes)
+ */
+export const convertColumnarToRois = function(columnar) {
+    var rois = [];
+    var roiIds = columnar['rois']['ids'];
+    for (var r=0; r<roiIds.length; r++) {
+        rois.push({
+            '@id': roiIds[r],
+            '@type': MARSHAL_SCHEMA + 'ROI',
+            'Name': columnar['rois']['names'][r],
+            'shapes': []
+        });
+    }
+
+    for (var type in columnar['shapes']) {
+        var col = columnar['shapes'][type];
+        var ids = decodeBase64Buffer(col['ids'], Float64Array);
+        var roi = decodeBase64Buffer(col['roi'], Int32Array);
+        var dims = {
+            'TheZ': decodeBase64Buffer(col['z'], Int32Array),
+            'TheT': decodeBase64Buffer(col['t'], Int32Array),
+            'TheC': decodeBase64Buffer(col['c'], Int32Array)
+        };
+        var style = decodeBase64Buffer(col['style'], Int32Array);
+        var details = decodeBase64Buffer(col['details'], Int32Array);
+        var values = decodeBase64Buffer(col['values'], Float64Array);
+        var keys = col['keys'];
+        var offsets = typeof col['offsets'] === 'string' ?
+            decodeBase64Buffer(col['offsets'], Uint32Array) : null;
+        var coords = typeof col['coords'] === 'string' ?
+            decodeBase64Buffer(col['coords'], Float64Array) : null;
+
+        for (var i=0; i<col['count']; i++) {
+            var shape = {'@id': ids[i], '@type': MARSHAL_SCHEMA + type};
+            // styles are shared, their nested objects are copied
+            var shapeStyle = columnar['styles'][style[i]];
+            for (var s in shapeStyle) {
+                shape[s] = typeof shapeStyle[s] === 'object' ?
+                    Object.assign({}, shapeStyle[s]) : shapeStyle[s];
+            }
+            shape['omero:details'] = columnar['details'][details[i]];
+            for (var d in dims) {
+                if (dims[d][i] >= 0) shape[d] = dims[d][i];
+            }
+            for (var k=0; k<keys.length; k++) {
+                var value = values[i * keys.length + k];
+                if (!isNaN(value)) shape[keys[k]] = value;
+            }
+            if (isArray(col['text']) && col['text'][i] !== null)
+                shape['Text'] = col['text'][i];
+            if (typeof col['transforms'] === 'object' &&
+                typeof col['transforms'][i] === 'object')
+                shape['Transform'] = col['transforms'][i];
+            if (offsets !== null && coords !== null) {
+                var points = [];
+                var shapeCoords = [];
+                for (var p=offsets[i]; p<offsets[i+1]; p++) {
+                    var x = coords[2 * p];
+                    var y = coords[2 * p + 1];
+                    points.push(x + "," + y);
+                    shapeCoords.push([x, -y]);
+                }
+                shape['Points'] = points.join(" ");
+                shape['coords'] = shapeCoords;
+            }
+            rois[roi[i]]['shapes'].push(shape);
+        }
+    }
+
+    return rois;
+}
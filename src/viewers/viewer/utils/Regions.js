@@ -97,8 +97,9 @@ export const FEATURE_FACTORY_LOOKUP_TABLE = {
         feat.setStyle(createFeatureStyle(shape));
         return feat;
     }, "polyline" : function(shape) {
-        if (typeof(shape['Points']) != 'string') return null;
-        var coords = convertPointStringIntoCoords(shape['Points']);
+        // coords may have been decoded already, see convertColumnarToRois
+        var coords = isArray(shape['coords']) ? shape['coords'] :
+            convertPointStringIntoCoords(shape['Points']);
         if (coords === null) return null;
         var drawStartArrow =
             typeof shape['MarkerStart'] === 'string' &&
@@ -143,9 +144,9 @@ export const FEATURE_FACTORY_LOOKUP_TABLE = {
         feat.setStyle(createFeatureStyle(shape, true));
         return feat;
     }, "polygon" : function(shape) {
-        if (typeof(shape['Points']) != 'string') return null;
-
-        var coords = convertPointStringIntoCoords(shape['Points']);
+        // coords may have been decoded already, see convertColumnarToRois
+        var coords = isArray(shape['coords']) ? shape['coords'] :
+            convertPointStringIntoCoords(shape['Points']);
         if (coords === null) return null;
 
         var feat = new Feature({"geometry" :
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2026 University of Dundee. All Rights Reserved.
+# Use is subject to license terms supplied in LICENSE.txt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+"""
+   Fixtures shared by the tests, which are IWebTest classes
+"""
+
+from omero.gateway import BlitzGateway
+
+import pytest
+
+
+@pytest.fixture()
+def conn(request):
+    """Return a new user in a read-annotate group."""
+    group = request.instance.new_group(perms='rwra--')
+    user = request.instance.new_client_and_user(group=group)
+    gateway = BlitzGateway(client_obj=user[0])
+    # Refresh the session context
+    gateway.getEventContext()
+    return gateway
+
+
+@pytest.fixture()
+def django_client(request, conn):
+    user_name = conn.getUser().getName()
+    return request.instance.new_django_client(user_name, user_name)
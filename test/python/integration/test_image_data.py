@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2026 University of Dundee. All Rights Reserved.
+# Use is subject to license terms supplied in LICENSE.txt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+   Test loading image data
+"""
+
+import json
+from types import SimpleNamespace
+
+from django.urls import reverse
+
+from omeroweb.testlib import IWebTest, get_json
+
+from omero.model import ImageI, PixelsI, PlaneInfoI, PointI, RoiI, TimeI
+from omero.model.enums import UnitsTime
+from omero.rtypes import rint
+from omero_iviewer import caches, views
+from omero_iviewer.views import SERVER_CACHE
+
+
+class FakeConfigService(object):
+    """Counts the config values read."""
+
+    def __init__(self):
+        self.calls = []
+
+    def getConfigValue(self, key):
+        self.calls.append(key)
+        return None
+
+
+def test_index_params_cached(monkeypatch):
+    """The server constants of the index page are loaded once per TTL"""
+    monkeypatch.setattr(views, 'SERVER_CACHE', caches.TTLCache(60))
+    now = [1000]
+    monkeypatch.setattr(caches, 'time', SimpleNamespace(time=lambda: now[0]))
+    config = FakeConfigService()
+    conn = SimpleNamespace(host='localhost', port=4064,
+                           getConfigService=lambda: config)
+
+    params = views.load_index_params(conn)
+    assert sorted(config.calls) == [
+        'omero.pixeldata.max_projection_bytes',
+        'omero.server.nodedescriptors']
+    now[0] += 59
+    assert views.load_index_params(conn) == params
+    assert len(config.calls) == 2
+    # and loaded again once expired
+    now[0] += 2
+    assert views.load_index_params(conn) == params
+    assert len(config.calls) == 4
+
+
+class TestImageData(IWebTest):
+    """Tests loading the data of images"""
+
+    def test_image_data_etag(self, conn, django_client):
+        image = self.import_fake_file(client=conn.c)[0]
+        url = reverse('omero_iviewer_image_data',
+                      kwargs={'image_id': image.id.val})
+        rsp = django_client.get(url)
+        assert rsp.status_code == 200
+        etag = rsp['ETag']
+        data = json.loads(rsp.content)
+        assert data['id'] == image.id.val
+        assert data['roi_count'] == 0
+
+        # unchanged
+        rsp = django_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert rsp.status_code == 304
+        assert rsp['ETag'] == etag
+
+        # adding a ROI changes the data
+        roi = RoiI()
+        roi.setImage(ImageI(image.id.val, False))
+        roi.addShape(PointI())
+        conn.getUpdateService().saveObject(roi)
+        rsp = django_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert rsp.status_code == 200
+        assert rsp['ETag'] != etag
+        assert json.loads(rsp.content)['roi_count'] == 1
+        etag = rsp['ETag']
+
+        # as does changing the rendering settings
+        img = conn.getObject('Image', image.id.val)
+        img.setActiveChannels([1], windows=[[0, 10]])
+        img.saveDefaults()
+        rsp = django_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert rsp.status_code == 200
+        assert rsp['ETag'] != etag
+        channel = json.loads(rsp.content)['channels'][0]
+        assert channel['window']['end'] == 10
+        etag = rsp['ETag']
+
+        # as does renaming a channel
+        lc = img.getChannels()[0].getLogicalChannel()
+        lc.setName('renamed')
+        lc.save()
+        rsp = django_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert rsp.status_code == 200
+        assert rsp['ETag'] != etag
+        channel = json.loads(rsp.content)['channels'][0]
+        assert channel['label'] == 'renamed'
+
+    def test_images_data(self, conn, django_client):
+        images = self.import_fake_file(images_count=2, client=conn.c)
+        roi = RoiI()
+        roi.setImage(ImageI(images[1].id.val, False))
+        roi.addShape(PointI())
+        conn.getUpdateService().saveObject(roi)
+        missing_id = images[1].id.val + 1000000
+        image_ids = [i.id.val for i in images] + [missing_id]
+        url = reverse('omero_iviewer_images_data')
+        url += '?images=%s' % ','.join(str(i) for i in image_ids)
+        data = get_json(django_client, url)['data']
+        assert data[str(missing_id)]['error'] == 'Image not found'
+
+        # same data as loaded one by one, also when cached
+        for rsp in (data, get_json(django_client, url)['data']):
+            for image, roi_count in zip(images, [0, 1]):
+                single_url = reverse('omero_iviewer_image_data',
+                                     kwargs={'image_id': image.id.val})
+                single = get_json(django_client, single_url)
+                assert rsp[str(image.id.val)] == single
+                assert single['roi_count'] == roi_count
+
+    def test_images_data_errors(self, django_client):
+        url = reverse('omero_iviewer_images_data')
+        rsp = get_json(django_client, url + '?images=1,a')
+        assert rsp['error'] == 'Image ids must be integers'
+        rsp = get_json(django_client, url)
+        assert rsp['error'] == 'No images given'
+
+    def test_server_constants_cached(self, conn, django_client):
+        image = self.import_fake_file(client=conn.c)[0]
+        url = reverse('omero_iviewer_image_data',
+                      kwargs={'image_id': image.id.val})
+        families = get_json(django_client, url)['families']
+        assert 'linear' in families
+        # loaded once, not for each image
+        hits = SERVER_CACHE.stats()['hits']
+        assert get_json(django_client, url + '?x=1')['families'] == families
+        assert SERVER_CACHE.stats()['hits'] > hits
+
+    def test_delta_t(self, conn, django_client):
+        image = self.import_fake_file(sizeT=4, sizeC=2, client=conn.c)[0]
+        pixels = conn.getObject('Image', image.id.val).getPrimaryPixels()
+        infos = []
+        # deltaT in ms for C=0, T=0..2 and only for C=1 at T=3
+        for t, c, delta_t in [(0, 0, 0), (1, 0, 500), (2, 0, 1500),
+                              (3, 1, 2000), (0, 1, 100)]:
+            info = PlaneInfoI()
+            info.pixels = PixelsI(pixels.id, False)
+            info.theZ = rint(0)
+            info.theC = rint(c)
+            info.theT = rint(t)
+            info.deltaT = TimeI(delta_t, UnitsTime.MILLISECOND)
+            infos.append(info)
+        conn.getUpdateService().saveArray(infos)
+
+        url = reverse('omero_iviewer_image_data_deltat',
+                      kwargs={'image_id': image.id.val})
+        rsp = get_json(django_client, url)
+        assert rsp['delta_t'] == [0, 0.5, 1.5, 2]
+        assert rsp['delta_t_unit_symbol'] == 'ms'
+
+        rsp = get_json(django_client, url + '?encoding=delta')
+        assert rsp['encoding'] == 'delta'
+        assert rsp['start'] == 0
+        assert rsp['deltas'] == [0.5, 1, 0.5]
+
+    def test_histograms(self, conn, django_client):
+        image = self.import_fake_file(sizeZ=2, sizeC=2, client=conn.c)[0]
+        url = reverse('omero_iviewer_histograms',
+                      kwargs={'image_id': image.id.val})
+        rsp = get_json(django_client, url + '?c=0,1&z=1&bins=16')
+        assert rsp['bins'] == 16
+        assert [(h['theZ'], h['theT'], h['theC']) for h in rsp['data']] == \
+            [(1, 0, 0), (1, 0, 1)]
+        # same as the webgateway histogram
+        for h in rsp['data']:
+            assert len(h['data']) == 16
+            wg_url = reverse('histogram_json', kwargs={
+                'iid': image.id.val, 'theC': h['theC']})
+            wg_rsp = get_json(django_client, wg_url + '?theZ=1&bins=16')
+            assert h['data'] == wg_rsp['data']
+
+        rsp = get_json(django_client, url + '?c=0&z=0&z_end=1&prefetch=true')
+        assert rsp['prefetching'] <= 2
+
+        rsp = get_json(django_client, url + '?c=2')
+        assert 'error' in rsp
+        rsp = get_json(django_client, url + '?c=0&z=2')
+        assert rsp['error'] == 'Z is out of bounds'
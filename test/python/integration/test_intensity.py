@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2026 University of Dundee. All Rights Reserved.
+# Use is subject to license terms supplied in LICENSE.txt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+   Test querying pixel intensities
+"""
+
+from django.urls import reverse
+
+from omeroweb.testlib import IWebTest, get_json, post_json
+
+import base64
+import numpy
+
+
+class TestIntensity(IWebTest):
+    """Tests querying pixel intensities"""
+
+    def test_columnar_matches_legacy(self, conn, django_client):
+        """The columnar format returns the same values as the legacy one"""
+        image = self.create_test_image(size_x=64, size_y=64, size_z=1,
+                                       size_c=2, size_t=1,
+                                       session=conn.c.sf)
+        url = reverse('omero_iviewer_get_intensity')
+        url += '?image=%s&x=10&y=20&z=0&t=0&c=0,1' % image.id.val
+
+        legacy = get_json(django_client, url)
+        columnar = get_json(django_client, url + '&format=columnar')
+        assert columnar['format'] == 'columnar'
+        assert columnar['channels'] == [0, 1]
+        assert columnar['count'] == legacy['count']
+
+        x0, y0, x1, y1 = columnar['extent']
+        width = x1 - x0
+        for c, values in enumerate(columnar['values']):
+            for i, value in enumerate(values):
+                key = '%s-%s' % (x0 + i % width, y0 + i // width)
+                assert legacy['pixels'][key][str(c)] == value
+
+        encoded = get_json(
+            django_client, url + '&format=columnar&encoding=base64')
+        decoded = numpy.frombuffer(base64.b64decode(encoded['data']),
+                                   dtype=numpy.dtype(encoded['dtype']))
+        assert decoded.tolist() == \
+            columnar['values'][0] + columnar['values'][1]
+
+    def test_batched_intensities(self, conn, django_client):
+        """Batched points return the same values as get_intensity"""
+        image = self.create_test_image(size_x=300, size_y=300, size_z=1,
+                                       size_c=2, size_t=2,
+                                       session=conn.c.sf)
+        url = reverse('omero_iviewer_get_intensities')
+        points = [[10, 20], [290, 5], [260, 270]]
+        data = {'image': image.id.val, 'c': [0, 1], 'z': 0, 't': [0, 1],
+                'points': points}
+        rsp = post_json(django_client, url, data)
+        assert rsp['shape'] == [2, 1, 2, 3]
+
+        single_url = reverse('omero_iviewer_get_intensity')
+        for t in range(2):
+            for i, (x, y) in enumerate(points):
+                single = get_json(
+                    django_client, single_url +
+                    '?image=%s&x=%s&y=%s&z=0&t=%s&c=0,1' % (
+                        image.id.val, x, y, t))
+                pixel = single['pixels']['%s-%s' % (x, y)]
+                for c in range(2):
+                    assert rsp['values'][t][0][c][i] == pixel[str(c)]
+
+    def test_polyline_intensities(self, conn, django_client):
+        """A polyline is sampled every step pixels"""
+        image = self.create_test_image(size_x=64, size_y=64, size_z=1,
+                                       size_c=1, size_t=1,
+                                       session=conn.c.sf)
+        url = reverse('omero_iviewer_get_intensities')
+        data = {'image': image.id.val, 'c': 0,
+                'polyline': [[0, 0], [0, 10], [20, 10]], 'step': 5}
+        rsp = post_json(django_client, url, data)
+        assert rsp['distance'] == [0, 5, 10, 15, 20, 25, 30]
+        assert rsp['x'] == [0, 0, 0, 5, 10, 15, 20]
+        assert rsp['y'] == [0, 5, 10, 10, 10, 10, 10]
+        assert rsp['shape'] == [1, 1, 1, 7]
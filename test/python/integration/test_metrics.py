@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2026 University of Dundee. All Rights Reserved.
+# Use is subject to license terms supplied in LICENSE.txt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+"""
+   Test the metrics of requests
+"""
+
+from django.urls import reverse
+
+from omeroweb.testlib import IWebTest, get_json
+
+from omero_iviewer.metrics import METRICS_ENABLED
+from omero_iviewer.views import METRICS_ENDPOINT
+
+
+class TestMetrics(IWebTest):
+    """Tests timing requests and service calls"""
+
+    def test_server_timing(self, conn, django_client):
+        image = self.import_fake_file(client=conn.c)[0]
+        url = reverse('omero_iviewer_image_data',
+                      kwargs={'image_id': image.id.val})
+        rsp = django_client.get(url)
+        assert rsp.status_code == 200
+        if not METRICS_ENABLED:
+            assert 'Server-Timing' not in rsp
+            return
+        timings = rsp['Server-Timing'].split(', ')
+        assert timings[0].startswith('view;dur=')
+        assert any(t.startswith('query;desc="') for t in timings)
+
+    def test_metrics_endpoint(self, django_client):
+        url = reverse('omero_iviewer_metrics')
+        if not METRICS_ENDPOINT:
+            assert django_client.get(url).status_code == 404
+            return
+        # requests of views are added to the metrics
+        get_json(django_client, reverse('omero_iviewer_images_data'))
+        rsp = django_client.get(url)
+        assert rsp['Content-Type'].startswith('text/plain')
+        text = rsp.content.decode('utf-8')
+        assert '# TYPE omero_iviewer_cache_entries gauge' in text
+        if METRICS_ENABLED:
+            assert 'omero_iviewer_request_duration_seconds_count' \
+                '{view="images_data"}' in text
+
+        # only to the allowed clients
+        rsp = django_client.get(url, REMOTE_ADDR='192.0.2.1')
+        assert rsp.status_code == 403
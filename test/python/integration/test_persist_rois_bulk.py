@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2026 University of Dundee. All Rights Reserved.
+# Use is subject to license terms supplied in LICENSE.txt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+   Test saving many edited shapes with persist_rois
+"""
+
+from django.urls import reverse
+
+from omeroweb.testlib import IWebTest, get_json, post_json
+
+from omero.model import ImageI, RoiI, PointI
+from omero.rtypes import rdouble
+from omero.gateway import BlitzGateway
+from omero_marshal import get_encoder
+from omero_sys_ParametersI import ParametersI
+from omero_iviewer.metrics import RequestTimer, SERVICES, TimedService
+
+ROI_COUNT = 200
+SHAPES_PER_ROI = 3
+
+
+class TestPersistRoisBulk(IWebTest):
+    """Tests persist_rois saves large edits with a few service calls"""
+
+    def make_rois(self, conn, roi_count=ROI_COUNT):
+        """Returns an image with roi_count ROIs of SHAPES_PER_ROI points."""
+        image = self.make_image(client=conn.c)
+        rois = []
+        for r in range(roi_count):
+            roi = RoiI()
+            roi.setImage(ImageI(image.id.val, False))
+            for s in range(SHAPES_PER_ROI):
+                point = PointI()
+                point.x = rdouble(r)
+                point.y = rdouble(s)
+                roi.addShape(point)
+            rois.append(roi)
+        conn.getUpdateService().saveArray(rois)
+        return image
+
+    def get_changes(self, django_client, image, roi_count=ROI_COUNT):
+        """
+        Returns the changes of a large edit: one shape is modified and one
+        deleted in each ROI, and as many new shapes are added.
+        """
+        rois_url = reverse('api_rois', kwargs={'api_version': 0})
+        rois_url += '?image=%s&limit=%s' % (image.id.val, roi_count)
+        rois = get_json(django_client, rois_url)['data']
+        assert len(rois) == roi_count
+        modified = []
+        deleted = {}
+        new = []
+        encoder = get_encoder(PointI)
+        for i, roi in enumerate(rois):
+            shapes = sorted(roi['shapes'], key=lambda s: s['@id'])
+            shape_json = shapes[0]
+            shape_json['oldId'] = '%s:%s' % (roi['@id'], shape_json['@id'])
+            shape_json['X'] = 1000
+            del shape_json['omero:details']
+            modified.append(shape_json)
+            deleted[str(roi['@id'])] = [
+                '%s:%s' % (roi['@id'], shapes[1]['@id'])]
+            point = PointI()
+            point.x = rdouble(i)
+            point.y = rdouble(i)
+            point_json = encoder.encode(point)
+            point_json['oldId'] = '-%s:-%s' % (i + 1, i + 1)
+            new.append(point_json)
+        return new, modified, deleted
+
+    def persist(self, django_client, image, new, modified, deleted,
+                monkeypatch):
+        """
+        Saves the changes with persist_rois, returning the response and
+        the number of calls to each OMERO service made by the view.
+        """
+        timer = RequestTimer()
+        for method, name in SERVICES.items():
+            def get_service(gateway, *args,
+                            _get=getattr(BlitzGateway, method), _name=name,
+                            **kwargs):
+                return TimedService(
+                    _get(gateway, *args, **kwargs), _name, timer)
+            monkeypatch.setattr(BlitzGateway, method, get_service)
+        persist_url = reverse('omero_iviewer_persist_rois')
+        data = {
+            'imageId': image.id.val,
+            'rois': {
+                'count': len(new) + len(modified),
+                'new': new,
+                'modified': modified,
+                'deleted': deleted,
+            }
+        }
+        try:
+            rsp = post_json(django_client, persist_url, data)
+        finally:
+            monkeypatch.undo()
+        return rsp, dict((service, count)
+                         for service, (count, _) in timer.calls.items())
+
+    def test_persist_rois_bulk(self, conn, django_client, monkeypatch):
+        # the calls made for a small edit
+        image = self.make_rois(conn, 10)
+        new, modified, deleted = self.get_changes(django_client, image, 10)
+        rsp, small_calls = self.persist(
+            django_client, image, new, modified, deleted, monkeypatch)
+        assert 'errors' not in rsp
+        # all shapes and ROIs are saved at once
+        assert small_calls['update'] == 1
+
+        image = self.make_rois(conn)
+        new, modified, deleted = self.get_changes(django_client, image)
+        rsp, calls = self.persist(
+            django_client, image, new, modified, deleted, monkeypatch)
+        # the number of calls does not grow with the number of ROIs
+        assert calls == small_calls
+
+        assert 'errors' not in rsp
+        assert len(rsp['ids']) == 3 * ROI_COUNT
+        for m in modified:
+            assert rsp['ids'][m['oldId']] == m['oldId']
+        for n in new:
+            assert ':' in rsp['ids'][n['oldId']]
+            assert not rsp['ids'][n['oldId']].startswith('-')
+
+        # check the saved state
+        query = """
+            select count(shape.id) from Shape shape
+            where shape.roi.image.id = :id"""
+        params = ParametersI()
+        params.addId(image.id.val)
+        count = conn.getQueryService().projection(
+            query, params, conn.SERVICE_OPTS)[0][0].val
+        # one shape deleted per ROI, one new ROI per shape added
+        assert count == ROI_COUNT * (SHAPES_PER_ROI - 1) + ROI_COUNT
+        for m in modified:
+            shape = conn.getObject('Shape', m['@id'])
+            assert shape.getX() == 1000
+            assert shape._obj.roi is not None
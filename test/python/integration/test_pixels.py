@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2026 University of Dundee. All Rights Reserved.
+# Use is subject to license terms supplied in LICENSE.txt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+"""
+   Test reading regions through the tile cache
+"""
+
+from types import SimpleNamespace
+
+from omero_iviewer.caches import LRUCache
+from omero_iviewer.pixels import RegionReader, TILE_BLOCK_SIZE
+
+import numpy
+import pytest
+
+
+class FakeRawPixelsStore(object):
+    """Serves the tiles of one plane and counts the getTile calls."""
+
+    def __init__(self, plane):
+        self.plane = plane
+        self.tiles = []
+
+    def setPixelsId(self, pixels_id, bypass, opts=None):
+        pass
+
+    def getTile(self, z, c, t, x, y, width, height, opts=None):
+        self.tiles.append((x, y, width, height))
+        return self.plane[y:y + height, x:x + width].tobytes()
+
+    def close(self):
+        pass
+
+
+class FakeConnection(object):
+    """The parts of a BlitzGateway used by RegionReader."""
+
+    SERVICE_OPTS = None
+
+    def __init__(self, store):
+        self.c = SimpleNamespace(sf=SimpleNamespace(
+            createRawPixelsStore=lambda: store))
+
+    def getEventContext(self):
+        return SimpleNamespace(groupId=3, userId=2)
+
+
+@pytest.fixture()
+def plane():
+    size_x, size_y = TILE_BLOCK_SIZE * 2 + 10, TILE_BLOCK_SIZE + 20
+    values = numpy.arange(size_x * size_y) % 65521
+    return values.astype('>u2').reshape(size_y, size_x)
+
+
+def test_region_across_blocks(plane):
+    """Regions are assembled from blocks, read once from the store"""
+    store = FakeRawPixelsStore(plane)
+    size_y, size_x = plane.shape
+    reader = RegionReader(FakeConnection(store), 1, size_x, size_y,
+                          plane.dtype, LRUCache(10 * 1024 * 1024))
+    # from the first column of blocks to the partial blocks at the edges
+    x, y = TILE_BLOCK_SIZE - 5, TILE_BLOCK_SIZE - 7
+    width, height = size_x - x, size_y - y
+    region = reader.get_region(0, 0, 0, x, y, width, height)
+    assert numpy.array_equal(region, plane[y:y + height, x:x + width])
+    size = TILE_BLOCK_SIZE
+    assert sorted(store.tiles) == [
+        (0, 0, size, size), (0, size, size, 20),
+        (size, 0, size, size), (size, size, size, 20),
+        (size * 2, 0, 10, size), (size * 2, size, 10, 20)]
+
+    # a region within the same blocks is served from the cache
+    store.tiles = []
+    region = reader.get_region(0, 0, 0, 3, 4, size_x - 6, size_y - 8)
+    assert numpy.array_equal(region, plane[4:size_y - 4, 3:size_x - 3])
+    xs = numpy.array([0, size, size_x - 1])
+    ys = numpy.array([size_y - 1, 0, size])
+    assert numpy.array_equal(reader.get_points(0, 0, 0, xs, ys),
+                             plane[ys, xs])
+    assert store.tiles == []
+    reader.close()
+
+
+def test_region_without_cache(plane):
+    """Without a cache the region is read as one tile"""
+    store = FakeRawPixelsStore(plane)
+    size_y, size_x = plane.shape
+    reader = RegionReader(FakeConnection(store), 1, size_x, size_y,
+                          plane.dtype, LRUCache(0))
+    region = reader.get_region(0, 0, 0, 250, 10, 20, 260)
+    assert numpy.array_equal(region, plane[10:270, 250:270])
+    assert store.tiles == [(250, 10, 20, 260)]
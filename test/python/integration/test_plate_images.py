@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2026 University of Dundee. All Rights Reserved.
+# Use is subject to license terms supplied in LICENSE.txt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+"""
+   Test listing the images of plates
+"""
+
+from django.urls import reverse
+
+from omeroweb.testlib import IWebTest, get_json
+
+
+class TestPlateImages(IWebTest):
+    """Tests listing the images of the wells of plates"""
+
+    def test_plate_images(self, conn, django_client):
+        plate = self.import_plates(client=conn.c, plate_rows=2,
+                                   plate_cols=3, fields=2)[0]
+        url = reverse('omero_iviewer_plate_images')
+        url += '?plate=%s' % plate.id.val
+        rsp = get_json(django_client, url)
+        assert rsp['meta']['totalCount'] == 12
+        assert rsp['meta']['next'] is None
+        keys = [(i['row'], i['column'], i['field']) for i in rsp['data']]
+        assert keys == [(r, c, f) for r in range(2) for c in range(3)
+                        for f in range(2)]
+
+        # same images as in the wells
+        for img in rsp['data']:
+            well = conn.getObject('Well', img['well'])
+            assert img['@id'] == well.getImage(img['field']).id
+        well_id = rsp['data'][0]['well']
+        well_rsp = get_json(django_client, reverse(
+            'omero_iviewer_plate_images') + '?well=%s' % well_id)
+        assert well_rsp['data'] == rsp['data'][:2]
+
+        # pages follow the cursor
+        pages = []
+        page = get_json(django_client, url + '&limit=5&thumbnails=32')
+        while True:
+            pages.append(page)
+            if page['meta']['next'] is None:
+                break
+            page = get_json(django_client, url + '&limit=5&thumbnails=32'
+                            '&after=%s' % page['meta']['next'])
+        assert [len(p['data']) for p in pages] == [5, 5, 2]
+        assert 'totalCount' not in pages[1]['meta']
+        images = [i for p in pages for i in p['data']]
+        assert [i['@id'] for i in images] == \
+            [i['@id'] for i in rsp['data']]
+        for img in images:
+            assert img['thumbnail'].startswith('data:image/jpeg;base64,')
+
+    def test_plate_images_errors(self, django_client):
+        url = reverse('omero_iviewer_plate_images')
+        rsp = get_json(django_client, url)
+        assert rsp['error'] == 'Invalid Parameter types'
+        rsp = get_json(django_client, url + '?plate=1&after=1,2')
+        assert rsp['error'] == 'Invalid Parameter types'
+        rsp = get_json(django_client, url + '?plate=1&thumbnails=1000')
+        assert rsp['error'] == 'Parameter out of range'
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2026 University of Dundee. All Rights Reserved.
+# Use is subject to license terms supplied in LICENSE.txt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+   Test saving projections
+"""
+
+import threading
+import time
+
+from django.test import override_settings
+from django.urls import reverse
+
+from omeroweb.testlib import IWebTest, get_json
+
+from omero_iviewer import views
+from omero_iviewer.jobs import JobQueue, TooManyJobs
+from omero_iviewer.views import PROJECTION_JOBS
+
+import pytest
+
+
+class TestProjection(IWebTest):
+    """Tests creating projected images"""
+
+    def wait_for_job(self, django_client, job_id):
+        url = reverse('omero_iviewer_projection_job',
+                      kwargs={'job_id': job_id})
+        for i in range(60):
+            rsp = get_json(django_client, url)
+            if rsp['status'] not in ('queued', 'running'):
+                return rsp
+            time.sleep(1)
+        raise Exception("Projection job did not finish")
+
+    def test_save_projection_async(self, conn, django_client):
+        image = self.import_fake_file(sizeZ=4, client=conn.c)[0]
+        dataset = self.make_dataset(client=conn.c)
+        url = reverse('omero_iviewer_save_projection')
+        url += '?image=%s&projection=intmax&start=0&end=3&dataset=%s' % (
+            image.id.val, dataset.id.val)
+
+        rsp = get_json(django_client, url + '&async=true')
+        assert rsp['status'] in ('queued', 'running', 'done')
+        rsp = self.wait_for_job(django_client, rsp['job'])
+        assert rsp['status'] == 'done'
+        assert rsp['progress'] == 1
+
+        new_image = conn.getObject('Image', rsp['id'])
+        assert new_image.getSizeZ() == 1
+        assert '_proj' in new_image.getName()
+        assert 'Projection Type: intmax' in new_image.getDescription()
+        assert new_image.getParent().id == dataset.id.val
+
+    def test_projection_job_of_other_user(self, conn, django_client):
+        image = self.import_fake_file(sizeZ=2, client=conn.c)[0]
+        url = reverse('omero_iviewer_save_projection')
+        url += '?image=%s&projection=intmax&start=0&end=1&async=true' % (
+            image.id.val)
+        job_id = get_json(django_client, url)['job']
+
+        other_user = self.new_user()
+        other_client = self.new_django_client(
+            other_user.omeName.val, other_user.omeName.val)
+        url = reverse('omero_iviewer_projection_job',
+                      kwargs={'job_id': job_id})
+        get_json(other_client, url, status_code=404)
+        self.wait_for_job(django_client, job_id)
+
+    def test_projection_job_of_other_process(self, conn, django_client):
+        image = self.import_fake_file(sizeZ=2, client=conn.c)[0]
+        url = reverse('omero_iviewer_save_projection')
+        url += '?image=%s&projection=intmax&start=0&end=1&async=true' % (
+            image.id.val)
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            job_id = get_json(django_client, url)['job']
+            rsp = self.wait_for_job(django_client, job_id)
+            assert rsp['status'] == 'done'
+            # polled from a process which did not run the job
+            with PROJECTION_JOBS.lock:
+                del PROJECTION_JOBS.jobs[job_id]
+            assert self.wait_for_job(django_client, job_id) == rsp
+
+    def test_jobs_per_user_of_other_process(self, conn):
+        """The jobs of a user are counted in all processes"""
+        queue = JobQueue(1, 1, shared=True)
+        other = JobQueue(1, 1, shared=True)
+        release = threading.Event()
+
+        def wait(conn, job):
+            release.wait(60)
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            job = other.submit(conn, wait)
+            with pytest.raises(TooManyJobs):
+                queue.submit(conn, wait)
+            release.set()
+            for i in range(60):
+                if job.is_finished:
+                    break
+                time.sleep(0.1)
+            assert job.status == 'done'
+            assert queue.submit(conn, wait).status != 'failed'
+
+    def test_save_projections(self, conn, django_client):
+        dataset = self.make_dataset(client=conn.c)
+        images = self.import_fake_file(
+            images_count=2, sizeZ=3, sizeT=4, sizeC=3, client=conn.c)
+        for image in images:
+            self.link(dataset, image, client=conn.c)
+        url = reverse('omero_iviewer_save_projections')
+        url += ('?dataset=%s&projection=intmax&t_start=1&t_end=2'
+                '&channels=0,2' % dataset.id.val)
+        rsp = get_json(django_client, url)
+        rsp = self.wait_for_job(django_client, rsp['job'])
+        assert rsp['status'] == 'done'
+
+        results = rsp['result']
+        assert len(results) == 2
+        for image in images:
+            new_image_id = results[str(image.id.val)]['id']
+            new_image = conn.getObject('Image', new_image_id)
+            assert new_image.getSizeZ() == 1
+            assert new_image.getSizeT() == 2
+            assert new_image.getSizeC() == 2
+            assert 'timepoints: 2-3' in new_image.getDescription()
+            assert 'channels: 1,3' in new_image.getDescription()
+            assert new_image.getParent().id == dataset.id.val
+
+    def test_save_projections_save_error(self, conn, django_client,
+                                         monkeypatch):
+        """A projection which can't be saved doesn't fail the others"""
+        dataset = self.make_dataset(client=conn.c)
+        images = self.import_fake_file(
+            images_count=2, sizeZ=2, client=conn.c)
+        save_projected_images = views.save_projected_images
+        failing = []
+
+        def save(conn, projections, dataset_id=None):
+            if len(failing) == 0:
+                failing.append(projections[0][0])
+            if failing[0] in [p[0] for p in projections]:
+                raise ValueError("Cannot save %s" % failing[0])
+            save_projected_images(conn, projections, dataset_id)
+        monkeypatch.setattr(views, 'save_projected_images', save)
+
+        url = reverse('omero_iviewer_save_projections')
+        url += '?images=%s,%s&projection=intmax&link_dataset=%s' % (
+            images[0].id.val, images[1].id.val, dataset.id.val)
+        rsp = get_json(django_client, url)
+        rsp = self.wait_for_job(django_client, rsp['job'])
+        assert rsp['status'] == 'done'
+        results = sorted(rsp['result'].values(), key=lambda r: 'error' in r)
+        assert 'error' not in results[0]
+        assert results[1]['id'] == failing[0]
+        assert 'Cannot save' in results[1]['error']
+        new_image = conn.getObject('Image', results[0]['id'])
+        assert new_image.getParent().id == dataset.id.val
+
+    def test_save_projections_errors(self, conn, django_client):
+        image = self.import_fake_file(sizeZ=2, client=conn.c)[0]
+        url = reverse('omero_iviewer_save_projections')
+        url += '?images=%s,%s&projection=intmax&end=5' % (
+            image.id.val, image.id.val + 1000000)
+        rsp = get_json(django_client, url)
+        rsp = self.wait_for_job(django_client, rsp['job'])
+        results = rsp['result']
+        assert 'out of range' in results[str(image.id.val)]['error']
+        assert results[str(image.id.val + 1000000)]['error'] == \
+            'Image not Found'
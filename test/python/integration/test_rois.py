@@ -23,36 +23,53 @@
    Test saving ROIs
 """
 
+import base64
+import json
+
+from django.test import override_settings
 from django.urls import reverse
 
 from omeroweb.testlib import IWebTest, get_json, post_json
 
-from omero.model import ImageI, RoiI, PointI
-from omero.rtypes import rdouble, rstring
-from omero.gateway import BlitzGateway, TagAnnotationWrapper
+from omero.model import ImageI, RoiI, PointI, PolygonI, RectangleI
+from omero.rtypes import rdouble, rint, rstring
+from omero.gateway import TagAnnotationWrapper
 from omero_marshal import get_encoder
+from omero_iviewer.views import encode_counts
 
+import numpy
 import pytest
 
+# the ids of saved chunks are kept in the django cache
+LOCMEM_CACHES = {'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@pytest.mark.parametrize('counts', [
+    numpy.zeros((3, 0), dtype=numpy.int64),
+    numpy.full((2, 3), 4),
+    numpy.array([[0, 2, 2], [2, 0, 0]]),
+])
+def test_encode_counts(counts):
+    """The encoded counts decode as regions-planes.js does"""
+    rle = encode_counts(counts, 'rle')
+    assert sum(rle['lengths']) == counts.size
+    assert all(a != b for a, b in zip(rle['values'], rle['values'][1:]))
+    flat = []
+    for value, length in zip(rle['values'], rle['lengths']):
+        flat.extend([value] * length)
+    assert numpy.array_equal(
+        numpy.array(flat, dtype=numpy.int64).reshape(counts.shape), counts)
+
+    sparse = encode_counts(counts, 'sparse')
+    decoded = numpy.zeros(counts.shape, dtype=numpy.int64)
+    decoded[sparse['z'], sparse['t']] = sparse['values']
+    assert numpy.array_equal(decoded, counts)
+
 
 class TestRois(IWebTest):
     """Tests querying & saving ROIs"""
 
-    @pytest.fixture()
-    def conn(self):
-        """Return a new user in a read-annotate group."""
-        group = self.new_group(perms='rwra--')
-        user = self.new_client_and_user(group=group)
-        gateway = BlitzGateway(client_obj=user[0])
-        # Refresh the session context
-        gateway.getEventContext()
-        return gateway
-
-    @pytest.fixture()
-    def django_client(self, conn):
-        user_name = conn.getUser().getName()
-        return self.new_django_client(user_name, user_name)
-
     def test_save_rois(self, conn, django_client):
         """Save new ROIs to an Image"""
         image = self.make_image(client=conn.c)
@@ -129,3 +146,363 @@ class TestRois(IWebTest):
         assert len(list(roi.listAnnotations())) == 1
         assert len(list(conn.getAnnotationLinks(
             "Shape", parent_ids=[shape_id]))) == 1
+
+    def test_rois_in_viewport(self, conn, django_client):
+        """Load the shapes within a viewport"""
+        image = self.make_image(client=conn.c)
+        roi = RoiI()
+        roi.setImage(ImageI(image.id.val, False))
+        # a grid of 10 x 10 rectangles, 10 pixels wide, every 100 pixels
+        for x in range(10):
+            for y in range(10):
+                rect = RectangleI()
+                rect.x = rdouble(x * 100)
+                rect.y = rdouble(y * 100)
+                rect.width = rdouble(10)
+                rect.height = rdouble(10)
+                rect.theZ = rint(0)
+                rect.theT = rint(0)
+                roi.addShape(rect)
+        point = PointI()
+        point.x = rdouble(150)
+        point.y = rdouble(150)
+        roi.addShape(point)
+        roi = conn.getUpdateService().saveAndReturnObject(roi)
+
+        url = reverse('omero_iviewer_rois_in_viewport', kwargs={
+            'image_id': image.id.val, 'the_z': 0, 'the_t': 0})
+        rsp = get_json(django_client, url + '?bbox=95,95,205,205')
+        assert rsp['meta']['totalCount'] == 5
+        assert len(rsp['data']) == 1
+        assert rsp['data'][0]['@id'] == roi.id.val
+        shapes = rsp['data'][0]['shapes']
+        assert len(shapes) == 5
+        for shape in shapes:
+            assert 95 <= shape['X'] <= 205
+
+        # other planes only have the point, which has no Z or T
+        url = reverse('omero_iviewer_rois_in_viewport', kwargs={
+            'image_id': image.id.val, 'the_z': 1, 'the_t': 0})
+        rsp = get_json(django_client, url + '?bbox=0,0,1000,1000&limit=10')
+        assert rsp['meta']['totalCount'] == 1
+
+        # the index is updated when saving from iviewer
+        shape_json = shapes[0]
+        shape_json['oldId'] = '%s:%s' % (roi.id.val, shape_json['@id'])
+        shape_json['X'] = 500
+        shape_json['Y'] = 500
+        del shape_json['omero:details']
+        persist_url = reverse('omero_iviewer_persist_rois')
+        post_json(django_client, persist_url, {
+            'imageId': image.id.val,
+            'rois': {'count': 1, 'modified': [shape_json]}})
+        url = reverse('omero_iviewer_rois_in_viewport', kwargs={
+            'image_id': image.id.val, 'the_z': 0, 'the_t': 0})
+        rsp = get_json(django_client, url + '?bbox=95,95,205,205')
+        assert rsp['meta']['totalCount'] == 4
+
+    def test_rois_by_plane_invalid_page(self, conn, django_client):
+        image = self.make_image(client=conn.c)
+        for name in ('omero_iviewer_rois_by_plane',
+                     'omero_iviewer_shapes_by_plane'):
+            url = reverse(name, kwargs={
+                'image_id': image.id.val, 'the_z': 0, 'the_t': 0})
+            for query in ('?after=1)', '?offset=a', '?limit=1.5'):
+                rsp = get_json(django_client, url + query, status_code=400)
+                assert rsp['error'] == \
+                    'after, offset and limit must be integers'
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_save_rois_in_chunks(self, conn, django_client):
+        """Save new ROIs in chunks"""
+        image = self.make_image(client=conn.c)
+        encoder = get_encoder(PointI)
+        chunks = []
+        for c in range(2):
+            new = []
+            for i in range(3):
+                point = PointI()
+                point.x = rdouble(c)
+                point.y = rdouble(i)
+                point_json = encoder.encode(point)
+                point_json['oldId'] = '-%s:-%s' % (c * 3 + i + 1, 1)
+                new.append(point_json)
+            chunks.append({'rois': {'count': 3, 'new': new}})
+
+        url = reverse('omero_iviewer_persist_rois_session')
+        rsp = post_json(django_client, url, {'imageId': image.id.val})
+        session = rsp['session']
+        assert rsp['chunkSize'] > 0
+
+        ids = {}
+        for index, chunk in enumerate(chunks):
+            url = reverse('omero_iviewer_persist_rois_chunk', kwargs={
+                'session_id': session, 'index': index})
+            rsp = post_json(django_client, url, chunk)
+            assert 'errors' not in rsp
+            assert len(rsp['ids']) == 3
+            ids.update(rsp['ids'])
+        # sending a saved chunk again doesn't save it twice
+        rsp = post_json(django_client, url, chunks[-1])
+        for old_id, new_id in rsp['ids'].items():
+            assert ids[old_id] == new_id
+
+        # commit reports missing chunks
+        url = reverse('omero_iviewer_persist_rois_commit', kwargs={
+            'session_id': session})
+        rsp = post_json(django_client, url, {'chunks': 3})
+        assert rsp['missing'] == [2]
+        rsp = post_json(django_client, url, {'chunks': 2})
+        assert 'errors' not in rsp
+        assert rsp['ids'] == ids
+
+        rois_url = reverse('api_rois', kwargs={'api_version': 0})
+        rois_url += '?image=%s' % image.id.val
+        rsp = get_json(django_client, rois_url)
+        assert len(rsp['data']) == 6
+
+        # the save session is ended
+        post_json(django_client, url, {}, status_code=404)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_save_rois_chunk_retried(self, conn, django_client):
+        """A chunk saved with errors is not saved again when retried"""
+        image = self.make_image(client=conn.c)
+        point_json = get_encoder(PointI).encode(PointI())
+        point_json['oldId'] = '-1:-1'
+        chunk = {'rois': {'count': 2, 'new': [point_json],
+                          'empty_rois': {'invalid': ['invalid:1']}}}
+
+        url = reverse('omero_iviewer_persist_rois_session')
+        session = post_json(
+            django_client, url, {'imageId': image.id.val})['session']
+        url = reverse('omero_iviewer_persist_rois_chunk', kwargs={
+            'session_id': session, 'index': 0})
+        # the new ROI is saved, deleting the invalid ROI fails
+        rsp = post_json(django_client, url, chunk)
+        assert len(rsp['errors']) == 1
+        new_id = rsp['ids']['-1:-1']
+        rsp = post_json(django_client, url, chunk)
+        assert 'errors' not in rsp
+        assert rsp['ids'] == {'-1:-1': new_id}
+
+        url = reverse('omero_iviewer_persist_rois_commit', kwargs={
+            'session_id': session})
+        rsp = post_json(django_client, url, {'chunks': 1})
+        assert rsp['ids'] == {'-1:-1': new_id}
+        rois_url = reverse('api_rois', kwargs={'api_version': 0})
+        rois_url += '?image=%s' % image.id.val
+        assert len(get_json(django_client, rois_url)['data']) == 1
+
+    def test_shape_stats(self, conn, django_client):
+        image = self.import_fake_file(sizeT=3, sizeC=2, client=conn.c)[0]
+        roi = RoiI()
+        roi.setImage(ImageI(image.id.val, False))
+        # on all planes
+        rect = RectangleI()
+        rect.x = rdouble(2)
+        rect.y = rdouble(3)
+        rect.width = rdouble(10)
+        rect.height = rdouble(5)
+        roi.addShape(rect)
+        # on T=1 only
+        point = PointI()
+        point.x = rdouble(4)
+        point.y = rdouble(4)
+        point.theZ = rint(0)
+        point.theT = rint(1)
+        roi.addShape(point)
+        roi = conn.getUpdateService().saveAndReturnObject(roi)
+        rect_id, point_id = sorted(s.id.val for s in roi.copyShapes())
+
+        url = reverse('omero_iviewer_shape_stats')
+        url += '?ids=%s,%s&z=0' % (rect_id, point_id)
+        single = [get_json(django_client, url + '&t=%s' % t)
+                  for t in range(3)]
+        for rsp in single:
+            assert [s['index'] for s in rsp[str(rect_id)]] == [0, 1]
+            assert rsp[str(rect_id)][0]['points'] == 50
+            assert rsp[str(point_id)][0]['points'] == 1
+
+        rsp = get_json(django_client, url + '&t=0&t_end=2&format=columnar')
+        # the rectangle on each T, the point on its own plane only
+        assert len(rsp['shape']) == 2 * 3 + 2
+        for i, shape_id in enumerate(rsp['shape']):
+            t = rsp['theT'][i]
+            c = rsp['theC'][i]
+            if shape_id == point_id:
+                assert t == 1
+            stat = [s for s in single[t][str(shape_id)]
+                    if s['index'] == c][0]
+            for name in ('points', 'min', 'max', 'sum', 'mean', 'std_dev'):
+                assert rsp[name][i] == stat[name]
+
+        # a changed shape is measured again
+        rect = conn.getQueryService().get('Rectangle', rect_id)
+        rect.width = rdouble(5)
+        conn.getUpdateService().saveObject(rect)
+        rsp = get_json(django_client, url + '&t=0&cs=1')
+        assert [s['index'] for s in rsp[str(rect_id)]] == [1]
+        assert rsp[str(rect_id)][0]['points'] == 25
+
+    def test_rois_by_plane_stream(self, conn, django_client):
+        image = self.make_image(client=conn.c)
+        rois = []
+        for i in range(3):
+            roi = RoiI()
+            roi.setImage(ImageI(image.id.val, False))
+            rect = RectangleI()
+            rect.x = rdouble(i * 10)
+            rect.y = rdouble(0)
+            rect.width = rdouble(5)
+            rect.height = rdouble(5)
+            rect.theZ = rint(0)
+            rect.theT = rint(0)
+            roi.addShape(rect)
+            rois.append(roi)
+        conn.getUpdateService().saveArray(rois)
+        url = reverse('omero_iviewer_rois_by_plane', kwargs={
+            'image_id': image.id.val, 'the_z': 0, 'the_t': 0})
+        url += '?limit=2'
+
+        rsp = django_client.get(url + '&stream=true')
+        assert rsp.status_code == 200
+        assert rsp.streaming
+        streamed = json.loads(b''.join(rsp.streaming_content))
+        # the same as the response which is not streamed
+        assert streamed == get_json(django_client, url)
+        assert len(streamed['data']) == 2
+        assert streamed['meta']['totalCount'] == 3
+        assert streamed['meta']['next'] == streamed['data'][1]['@id']
+
+    def test_rois_by_plane_pages(self, conn, django_client):
+        """Paging with 'after' returns every ROI once"""
+        image = self.make_image(client=conn.c)
+        rois = []
+        for i in range(9):
+            roi = RoiI()
+            roi.setImage(ImageI(image.id.val, False))
+            point = PointI()
+            point.x = rdouble(i)
+            point.y = rdouble(0)
+            # every third ROI is on another plane
+            point.theZ = rint(1 if i % 3 == 2 else 0)
+            point.theT = rint(0)
+            roi.addShape(point)
+            rois.append(roi)
+        rois = conn.getUpdateService().saveAndReturnArray(rois)
+        ids = [r.id.val for r in rois if r.copyShapes()[0].theZ.val == 0]
+        # and one more ROI is deleted, the ids of the plane have gaps
+        conn.deleteObjects('Roi', [ids.pop(2)], wait=True)
+        assert len(ids) == 5
+
+        url = reverse('omero_iviewer_rois_by_plane', kwargs={
+            'image_id': image.id.val, 'the_z': 0, 'the_t': 0})
+        pages = []
+        data = {'limit': 2}
+        while True:
+            rsp = get_json(django_client, url, data)
+            pages.append([r['@id'] for r in rsp['data']])
+            assert rsp['meta']['totalCount'] == 5
+            if rsp['meta']['next'] is None:
+                break
+            data['after'] = rsp['meta']['next']
+        assert pages == [ids[0:2], ids[2:4], ids[4:5]]
+
+    def test_shapes_by_plane_precision(self, conn, django_client):
+        """Shape values and coordinates are sent in double precision"""
+        image = self.make_image(client=conn.c)
+        roi = RoiI()
+        roi.setImage(ImageI(image.id.val, False))
+        point = PointI()
+        point.x = rdouble(123456789.123456)
+        point.y = rdouble(0.1)
+        roi.addShape(point)
+        polygon = PolygonI()
+        polygon.points = rstring('0.1,0.2 1234567.891,2.5 3,4')
+        roi.addShape(polygon)
+        conn.getUpdateService().saveObject(roi)
+
+        url = reverse('omero_iviewer_shapes_by_plane', kwargs={
+            'image_id': image.id.val, 'the_z': 0, 'the_t': 0})
+        shapes = get_json(django_client, url)['shapes']
+
+        def decode(data):
+            return numpy.frombuffer(
+                base64.b64decode(data), dtype='<f8').tolist()
+        assert shapes['Point']['keys'] == ['X', 'Y']
+        assert decode(shapes['Point']['values']) == [123456789.123456, 0.1]
+        assert decode(shapes['Polygon']['coords']) == \
+            [0.1, 0.2, 1234567.891, 2.5, 3, 4]
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_plane_shape_counts(self, conn, django_client):
+        image = self.import_fake_file(sizeZ=2, sizeT=2, client=conn.c)[0]
+
+        def point(z, t):
+            shape = PointI()
+            shape.x = rdouble(1)
+            shape.y = rdouble(1)
+            if z is not None:
+                shape.theZ = rint(z)
+            if t is not None:
+                shape.theT = rint(t)
+            return shape
+
+        def save(*shapes):
+            roi = RoiI()
+            roi.setImage(ImageI(image.id.val, False))
+            for shape in shapes:
+                roi.addShape(shape)
+            conn.getUpdateService().saveObject(roi)
+
+        # two shapes on Z=0, T=0, one on Z=1, T=1 and one on all Z at T=0
+        save(point(0, 0), point(0, 0), point(1, 1), point(None, 0))
+        url = reverse('omero_iviewer_plane_shape_counts',
+                      kwargs={'image_id': image.id.val})
+        assert get_json(django_client, url)['data'] == [[3, 0], [1, 1]]
+        rsp = get_json(django_client, url + '?encoding=rle')
+        assert rsp == {'encoding': 'rle', 'shape': [2, 2],
+                       'values': [3, 0, 1], 'lengths': [1, 1, 2]}
+
+        # the counts are cached until ROIs are saved from iviewer
+        save(point(0, 1))
+        assert get_json(django_client, url)['data'] == [[3, 0], [1, 1]]
+        point_json = get_encoder(PointI).encode(point(1, 0))
+        point_json['oldId'] = '-1:-1'
+        post_json(django_client, reverse('omero_iviewer_persist_rois'), {
+            'imageId': image.id.val,
+            'rois': {'count': 1, 'new': [point_json]}})
+        assert get_json(django_client, url)['data'] == [[3, 1], [2, 1]]
+
+    def test_roi_page_data(self, conn, django_client):
+        image = self.import_fake_file(sizeZ=2, client=conn.c)[0]
+        rois = []
+        # ROIs with a shape on Z=0, Z=1, Z=0, on all Z, then no shapes
+        for the_z in [0, 1, 0, None, False]:
+            roi = RoiI()
+            roi.setImage(ImageI(image.id.val, False))
+            if the_z is not False:
+                point = PointI()
+                if the_z is not None:
+                    point.theZ = rint(the_z)
+                roi.addShape(point)
+            rois.append(conn.getUpdateService().saveAndReturnObject(roi))
+
+        for index, roi in enumerate(rois):
+            url = reverse('omero_iviewer_roi_page_data', kwargs={
+                'obj_type': 'roi', 'obj_id': roi.id.val})
+            rsp = get_json(django_client, url)
+            assert rsp['image']['id'] == image.id.val
+            assert rsp['roi_index'] == index
+            assert rsp['roi_count'] == 5
+
+        # the index on the plane of the shape
+        for roi, index, count in [(rois[2], 1, 3), (rois[1], 0, 2),
+                                  (rois[3], 3, 4)]:
+            url = reverse('omero_iviewer_roi_page_data', kwargs={
+                'obj_type': 'shape', 'obj_id': roi.copyShapes()[0].id.val})
+            rsp = get_json(django_client, url)
+            assert rsp['roi']['id'] == roi.id.val
+            assert rsp['roi_index'] == index
+            assert rsp['roi_count'] == count
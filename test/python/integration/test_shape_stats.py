@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2026 University of Dundee. All Rights Reserved.
+# Use is subject to license terms supplied in LICENSE.txt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+"""
+   Test computing shape statistics with numpy
+"""
+
+from django.urls import reverse
+
+from omeroweb.testlib import IWebTest, get_json
+
+from omero.model import AffineTransformI, EllipseI, ImageI, MaskI, \
+    PolygonI, RectangleI, RoiI
+from omero.rtypes import rdouble, rstring
+
+import numpy
+import pytest
+
+SIZE_X = 64
+SIZE_Y = 48
+
+
+def rectangle(x, y, width, height):
+    shape = RectangleI()
+    shape.x = rdouble(x)
+    shape.y = rdouble(y)
+    shape.width = rdouble(width)
+    shape.height = rdouble(height)
+    return shape
+
+
+class TestShapeStats(IWebTest):
+    """Tests the numpy engine of shape_stats"""
+
+    @pytest.fixture()
+    def planes(self):
+        """Two channels of distinct values: x + 100 * y and its double"""
+        ys, xs = numpy.mgrid[0:SIZE_Y, 0:SIZE_X]
+        plane = (xs + 100 * ys).astype(numpy.uint16)
+        return [plane, plane * 2]
+
+    def save_shapes(self, conn, planes, shapes, size_z=1):
+        """planes are ordered by Z, then channel"""
+        image = conn.createImageFromNumpySeq(
+            iter(planes), 'shape_stats', sizeZ=size_z, sizeC=2, sizeT=1)
+        roi = RoiI()
+        roi.setImage(ImageI(image.id, False))
+        for shape in shapes:
+            roi.addShape(shape)
+        roi = conn.getUpdateService().saveAndReturnObject(roi)
+        return sorted(s.id.val for s in roi.copyShapes())
+
+    def test_engines_agree(self, conn, django_client, planes):
+        ellipse = EllipseI()
+        ellipse.x = rdouble(20)
+        ellipse.y = rdouble(15)
+        ellipse.radiusX = rdouble(8)
+        ellipse.radiusY = rdouble(5)
+        polygon = PolygonI()
+        polygon.points = rstring('5,5 30,8 12,30')
+        rotated = rectangle(10, 10, 12, 6)
+        rotated.transform = AffineTransformI()
+        for name, value in zip(('a00', 'a10', 'a01', 'a11', 'a02', 'a12'),
+                               (0, 1, -1, 0, 40, 0)):
+            setattr(rotated.transform, name, rdouble(value))
+        shape_ids = self.save_shapes(conn, planes, [
+            rectangle(2, 3, 10, 5), ellipse, polygon, rotated])
+
+        url = reverse('omero_iviewer_shape_stats')
+        url += '?ids=%s&z=0&t=0' % ','.join(str(i) for i in shape_ids)
+        service = get_json(django_client, url)
+        numpy_stats = get_json(django_client, url + '&engine=numpy')
+        for shape_id in shape_ids:
+            expected = service[str(shape_id)]
+            stats = numpy_stats[str(shape_id)]
+            assert [s['index'] for s in stats] == [0, 1]
+            for stat, exp in zip(stats, expected):
+                for name in ('points', 'min', 'max', 'sum', 'mean'):
+                    assert stat[name] == pytest.approx(exp[name])
+                assert stat['std_dev'] == pytest.approx(
+                    exp['std_dev'], rel=1e-6)
+
+    def test_mask_and_percentiles(self, conn, django_client, planes):
+        # a 4x2 mask with the pixels on its diagonals
+        mask = MaskI()
+        mask.x = rdouble(8)
+        mask.y = rdouble(4)
+        mask.width = rdouble(4)
+        mask.height = rdouble(2)
+        mask.bytes = numpy.packbits(
+            [1, 0, 0, 1, 0, 1, 1, 0]).tobytes()
+        shape_ids = self.save_shapes(
+            conn, planes, [rectangle(2, 3, 10, 5), mask])
+        rect_id, mask_id = shape_ids
+
+        url = reverse('omero_iviewer_shape_stats')
+        url += '?ids=%s,%s&z=0&t=0&cs=1&percentiles=50,90' % (
+            rect_id, mask_id)
+        rsp = get_json(django_client, url)
+
+        mask_values = planes[1][[4, 4, 5, 5], [8, 11, 9, 10]]
+        stat = rsp[str(mask_id)][0]
+        assert stat['index'] == 1
+        assert stat['points'] == 4
+        assert stat['sum'] == mask_values.sum()
+        assert stat['percentiles'] == pytest.approx(
+            numpy.percentile(mask_values, [50, 90]).tolist())
+
+        rect_values = planes[1][3:8, 2:12]
+        stat = rsp[str(rect_id)][0]
+        assert stat['points'] == 50
+        assert stat['min'] == rect_values.min()
+        assert stat['max'] == rect_values.max()
+        assert stat['std_dev'] == pytest.approx(rect_values.std())
+        assert stat['percentiles'] == pytest.approx(
+            numpy.percentile(rect_values, [50, 90]).tolist())
+
+        rsp = get_json(django_client, url + '&format=columnar')
+        assert len(rsp['percentiles']) == 2
+
+    def test_images_and_planes(self, conn, django_client, planes):
+        # two images of two Z, with distinct values in all planes
+        images = []
+        shape_ids = []
+        for i in range(2):
+            image_planes = [p + 1000 * (2 * i + z)
+                            for z in range(2) for p in planes]
+            images.append(image_planes)
+            # the shapes alternate between the images
+            shape_ids.extend(self.save_shapes(conn, image_planes, [
+                rectangle(2 + i, 3, 10, 5), rectangle(20, 10 + i, 4, 6)],
+                size_z=2))
+        boxes = [(3, 2, 5, 10), (10, 20, 6, 4), (3, 3, 5, 10),
+                 (11, 20, 6, 4)]
+
+        url = reverse('omero_iviewer_shape_stats')
+        url += '?ids=%s&z=0&z_end=1&t=0&engine=numpy&format=columnar' % (
+            ','.join(str(i) for i in shape_ids))
+        rsp = get_json(django_client, url)
+        assert len(rsp['shape']) == 4 * 2 * 2
+        for shape_id, z, c, total in zip(
+                rsp['shape'], rsp['theZ'], rsp['theC'], rsp['sum']):
+            index = shape_ids.index(shape_id)
+            y, x, height, width = boxes[index]
+            plane = images[index // 2][2 * z + c]
+            assert total == plane[y:y + height, x:x + width].sum()
+
+    def test_errors(self, conn, django_client, planes):
+        shape_ids = self.save_shapes(conn, planes, [rectangle(0, 0, 4, 4)])
+        url = reverse('omero_iviewer_shape_stats')
+        url += '?ids=%s&z=0&t=0' % shape_ids[0]
+        rsp = get_json(django_client, url + '&engine=gpu')
+        assert rsp['error'] == 'Unknown engine: gpu'
+        rsp = get_json(django_client, url + '&percentiles=120')
+        assert rsp['error'] == 'Percentiles must be within 0-100'
+        rsp = get_json(django_client, url + '&engine=numpy&cs=2')
+        assert rsp['error'] == 'Plane or channel out of bounds'
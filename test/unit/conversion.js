@@ -36,8 +36,10 @@ import {convertRgbaColorFormatToObject,
     convertColorObjectToHex,
     convertColorObjectToRgba,
     convertColorToSignedInteger,
+    convertColumnarToRois,
     convertPointStringIntoCoords,
     convertSignedIntegerToColorObject,
+    decodeRunLengths,
     pointToJsonObject,
     ellipseToJsonObject,
     rectangleToJsonObject,
@@ -47,6 +49,7 @@ import {convertRgbaColorFormatToObject,
     polygonToJsonObject,
     integrateStyleIntoJsonObject,
     integrateMiscInfoIntoJsonObject,
+    splitRoisIntoChunks,
     toJsonObject} from '../../src/viewers/viewer/utils/Conversion';
 /*
  * Tests utility routines in ome.ol3.utils.Conversion
@@ -335,4 +338,105 @@ describe("Conversion", function() {
         assert.equal(jsonObject['new_and_deleted'][0], ['-2:-2']);
         assert.equal(jsonObject['empty_rois']['10'][0], '10:10');
     });
+
+    it('convertColumnarToRois', function() {
+        // as returned by shapes_by_plane
+        var columnar = {
+            "rois": {"ids": [1, 2], "names": ["r1", "r2"]},
+            "styles": [{"StrokeColor": 255}, {}],
+            "details": [{"permissions": {"canEdit": true}}],
+            "shapes": {
+                "Rectangle": {
+                    "count": 2,
+                    "ids": "AAAAAAAAFEAAAAAAAAAgQA==",
+                    "roi": "AAAAAAEAAAA=",
+                    "z": "AQAAAAEAAAA=",
+                    "t": "//////////8=",
+                    "c": "//////////8=",
+                    "style": "AAAAAAEAAAA=",
+                    "details": "AAAAAAAAAAA=",
+                    "keys": ["X", "Y", "Width", "Height"],
+                    "values": "AACAVDRvnUEAAAAAAAAAQAAAAAAAAAhAAAAAAAAAEEAAAAAAAADwPwAAAAAAAABAAAAAAAAACEAAAAAAAAD4fw=="
+                },
+                "Polygon": {
+                    "count": 2,
+                    "ids": "AAAAAAAAGEAAAAAAAAAcQA==",
+                    "roi": "AQAAAAEAAAA=",
+                    "z": "AQAAAAEAAAA=",
+                    "t": "//////////8=",
+                    "c": "//////////8=",
+                    "style": "AQAAAAEAAAA=",
+                    "details": "AAAAAAAAAAA=",
+                    "keys": [],
+                    "values": "",
+                    "offsets": "AAAAAAMAAAAFAAAA",
+                    "coords": "AAAAAAAA8D8AAAAAAAAAQAAAAAAAAAhAAAAAAAAAEEAAAAAAAAAUQAAAAAAAABhAAAAAAAAA8D8AAAAAAAAAQAAAAAAAAAhAmpmZmZmZuT8="
+                }
+            }
+        };
+        var rois = convertColumnarToRois(columnar);
+        assert.equal(rois.length, 2);
+        assert.equal(rois[0]['@id'], 1);
+        assert.equal(rois[1]['Name'], "r2");
+        assert.equal(rois[0]['shapes'].length, 1);
+        assert.equal(rois[1]['shapes'].length, 3);
+
+        var rect = rois[0]['shapes'][0];
+        assert.equal(rect['@id'], 5);
+        assert.equal(rect['@type'],
+            "http://www.openmicroscopy.org/Schemas/OME/2016-06#Rectangle");
+        assert.equal(rect['TheZ'], 1);
+        assert.equal(typeof rect['TheT'], 'undefined');
+        assert.equal(rect['StrokeColor'], 255);
+        assert.equal(rect['Width'], 3);
+        // values are not rounded to single precision
+        assert.equal(rect['X'], 123456789.125);
+        assert.equal(rect['omero:details']['permissions']['canEdit'], true);
+        // unset values are not set
+        var rect2 = rois[1]['shapes'][0];
+        assert.equal(rect2['@id'], 8);
+        assert.equal(typeof rect2['Height'], 'undefined');
+
+        var polygon = rois[1]['shapes'][1];
+        assert.equal(polygon['@id'], 6);
+        assert.equal(polygon['Points'], "1,2 3,4 5,6");
+        expect(polygon['coords']).to.eql([[1, -2], [3, -4], [5, -6]]);
+        assert.equal(rois[1]['shapes'][2]['Points'], "1,2 3,0.1");
+    });
+
+    it('decodeRunLengths', function() {
+        // as encoded by plane_shape_counts?encoding=rle
+        expect(decodeRunLengths({"encoding": "rle", "shape": [3, 0],
+            "values": [], "lengths": []})).to.eql([[], [], []]);
+        expect(decodeRunLengths({"encoding": "rle", "shape": [2, 3],
+            "values": [4], "lengths": [6]})).to.eql([[4, 4, 4], [4, 4, 4]]);
+        expect(decodeRunLengths({"encoding": "rle", "shape": [2, 3],
+            "values": [0, 2, 0], "lengths": [1, 3, 2]})).to.eql(
+                [[0, 2, 2], [2, 0, 0]]);
+    });
+
+    it('splitRoisIntoChunks', function() {
+        var rois = {
+            "count": 7,
+            "empty_rois": {"3": ["3:7", "3:8"]},
+            "new_and_deleted": [],
+            "deleted": {"1": ["1:1", "1:2"], "2": ["2:4"]},
+            "new": [{"oldId": "-1:-1"}, {"oldId": "-2:-2"}],
+            "modified": [{"oldId": "1:3"}]
+        };
+        var chunks = splitRoisIntoChunks(rois, 3);
+        assert.equal(chunks.length, 3);
+        assert.equal(chunks[0]['new'].length, 2);
+        assert.equal(chunks[0]['modified'].length, 1);
+        expect(chunks[1]['deleted']).to.eql(
+            {"1": ["1:1", "1:2"], "2": ["2:4"]});
+        // an empty roi is a single change
+        expect(chunks[2]['empty_rois']).to.eql({"3": ["3:7", "3:8"]});
+        assert.equal(chunks[2]['count'], 1);
+        // the deleted shapes of a roi may be split
+        chunks = splitRoisIntoChunks(rois, 2);
+        assert.equal(chunks.length, 4);
+        expect(chunks[1]['deleted']).to.eql({"1": ["1:1"]});
+        expect(chunks[2]['deleted']).to.eql({"1": ["1:2"], "2": ["2:4"]});
+    });
 });